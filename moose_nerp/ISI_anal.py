@@ -5,6 +5,7 @@ import moose
 from scipy import fftpack, signal
 
 import detect
+from moose_nerp.prototypes import spike_trains
 
 def flatten(isiarray):
     return [item for sublist in isiarray for item in sublist]
@@ -260,7 +261,11 @@ def input_raster(files):
     pre_spikes=[{} for f in files]
     for trial,infile in enumerate(files):
         ######### End temp stuff
-        tt=np.load(infile).item()
+        if infile.endswith('.npz') and spike_trains.is_ragged(infile):
+            tt=spike_trains.load_nested(infile)
+        else:
+            #older files: pickled dictionary saved with np.save
+            tt=np.load(infile,allow_pickle=True).item()
         for ax,syntype in enumerate(tt.keys()):
             for presyn in tt[syntype].keys():
                 spiketimes=[]
@@ -356,5 +361,6 @@ def save_tt(connections,param_sim):
             for syn in connections['ep']['/ep'][syntype][ext].keys():
                 tt=moose.element(connections['ep']['/ep'][syntype][ext][syn])
                 used_tt[syntype][ext][syn]=tt.vector
-    np.save('tt'+param_sim.fname,used_tt)
+    #ragged spike train file, read with input_raster
+    spike_trains.save_nested('tt'+param_sim.fname+'.npz',used_tt)
 
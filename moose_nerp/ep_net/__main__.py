@@ -27,6 +27,7 @@ from moose_nerp.prototypes import (calcium,
                                    create_network,
                                    tables,
                                    net_output,
+                                   spike_trains,
                                    util)
 from moose_nerp import ep as model
 from moose_nerp import ep_net as net
@@ -195,7 +196,7 @@ if net.single:
                     for branch, presyn in pre_dict.items():
                         if 'TimTab' in presyn:
                             timtabs[syn][pretype][branch] = moose.element(presyn).vector
-    np.save(outdir + 'tt' + param_sim.fname, timtabs)
+    spike_trains.save_nested(outdir + 'tt' + param_sim.fname + '.npz', timtabs)
     # block in non-interactive mode
 util.block_if_noninteractive()
 
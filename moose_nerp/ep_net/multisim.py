@@ -26,6 +26,7 @@ def moose_main(p):
                                        create_network,
                                        tables,
                                        net_output,
+                                       spike_trains,
                                        util)
     from moose_nerp import ep as model
     from moose_nerp import ep_net as net
@@ -175,7 +176,7 @@ def moose_main(p):
                         for branch, presyns in pre_dict.items():
                             if 'TimTab' in presyns:
                                 timtabs[syn][pretype][branch] = moose.element(presyns).vector
-        np.save(outdir + 'tt' + param_sim.fname, timtabs)
+        spike_trains.save_nested(outdir + 'tt' + param_sim.fname + '.npz', timtabs)
 
     # create dictionary with the output (vectors) from test plasticity
     tab_dict = {}
@@ -188,6 +189,34 @@ def moose_main(p):
     return param_dict, tab_dict, vmtab, spike_time, isis
 
 
+_shared_trains = None
+
+
+def attach_trains(handle):
+    # Pool initializer: trains loaded by the parent, used by TableSet.load instead of reading the files
+    global _shared_trains
+    from moose_nerp.prototypes import spike_trains, ttables
+    _shared_trains, trains = spike_trains.attach(handle)
+    ttables.TableSet.SHARED.update(trains)
+
+
+def share_trains(sim_params):
+    # load the time table files of all trials once, into one shared memory block: the files of all
+    # TableSets of param_net, with the GPe and str files replaced by those given for each trial
+    # (generated trains, train_generator.TrainSpec, have no file)
+    from moose_nerp.prototypes import spike_trains, ttables
+    from moose_nerp.ep_net import param_net
+    filenames = set()
+    for params in sim_params:
+        ttGPe, ttstr = params[5:]
+        overrides = {param_net.tt_GPe.tablename: ttGPe, param_net.tt_str.tablename: ttstr}
+        for tableset in ttables.TableSet.ALL:
+            fname = overrides.get(tableset.tablename) or tableset.filename
+            if isinstance(fname, str):
+                filenames.add(fname)
+    return spike_trains.SharedPool({repr(fname): spike_trains.from_file(fname) for fname in filenames})
+
+
 def multi_main(p):
     from multiprocessing.pool import Pool
     import os
@@ -209,9 +238,14 @@ def multi_main(p):
     print('************* number of processors', max_pools, ' num params', len(sim_params), 'pools', num_pools, 'syn',
           p.syn, 'freq', p.freq, 'ttfile', p.ttstr)
     print(sim_params)
-    p = Pool(num_pools, maxtasksperchild=1)
-    #
-    results = p.map(moose_main, sim_params)
+    pool = share_trains(sim_params)
+    try:
+        p = Pool(num_pools, initializer=attach_trains, initargs=(pool.handle(),), maxtasksperchild=1)
+        #
+        results = p.map(moose_main, sim_params)
+        p.close()
+    finally:
+        pool.close()
 
 
 from moose_nerp.prototypes import standard_options
@@ -2,6 +2,7 @@
 ####################### Populations
 from moose_nerp.prototypes.syn_proto import ShortTermPlasParams, SpikePlasParams
 from moose_nerp.prototypes.ttables import TableSet
+from moose_nerp.prototypes.train_generator import TrainSpec
 from moose_nerp.prototypes.util import NamedList
 
 neur_distr = NamedList('neur_distr', 'neuronname spacing percent')
@@ -68,10 +69,12 @@ dend_location = NamedList('dend_location',
 
 # probability for intrinsic is the probability of connecting pre and post.
 connect = NamedList('connect', 'synapse pre post num_conns=2 space_const=None probability=None dend_loc=None stp=None')
-ext_connect = NamedList('ext_connect', 'synapse pre post dend_loc=None stp=None weight=1')
+ext_connect = NamedList('ext_connect', 'synapse pre post dend_loc=None stp=None weight=1 aggregate=False')
 
 # tables of extrinsic inputs
 # first string is name of the table in moose, and 2nd string is name of external file
+# or a train_generator.TrainSpec to generate the trains, e.g.
+# tt_STN = TableSet('tt_STN', TrainSpec('lognormal', 100, 25.0, 18.0, sigma=0.8, seed=1), syn_per_tt=2)
 # tt_STN = TableSet('tt_STN', 'ep_net/STN_InhomPoisson',syn_per_tt=2)
 tt_STN = TableSet('tt_STN', 'ep_net/STN_lognorm', syn_per_tt=2)
 # tt_str = TableSet('tt_str', 'ep_net/SPN_InhomPoisson',syn_per_tt=2)
@@ -135,7 +135,7 @@ else:
         mean_sta={}
         fileroot=filedir+'tt'+rootname
         for params in presyn_set:
-            pattern,key,freq=file_pattern(fileroot,suffix,params, '*.npy')
+            pattern,key,freq=file_pattern(fileroot,suffix,params, '*.np[yz]')
             files=ISI_anal.file_set(pattern)
             print('tt files',pattern, 'num files',len(files))
             if len(files):
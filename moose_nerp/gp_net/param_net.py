@@ -82,7 +82,7 @@ dend_location = NamedList('dend_location',
 
 # probability for intrinsic is the probability of connecting pre and post.
 connect = NamedList('connect', 'synapse pre post num_conns=2 space_const=None probability=None dend_loc=None')
-ext_connect = NamedList('ext_connect', 'synapse pre post dend_loc=None')
+ext_connect = NamedList('ext_connect', 'synapse pre post dend_loc=None aggregate=False')
 
 # tables of extrinsic inputs
 # first string is name of the table in moose, and 2nd string is name of external file
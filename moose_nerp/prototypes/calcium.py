@@ -5,7 +5,7 @@ import numpy as np
 
 from moose_nerp.prototypes import constants, logutil
 from moose_nerp.prototypes.spines import NAME_NECK, NAME_HEAD
-from moose_nerp.prototypes.util import distance_mapping, NamedList
+from moose_nerp.prototypes.util import distance_mapping, DistanceMap, NamedList
 
 CalciumConfig = NamedList('CalciumConfig', '''
 shellMode
@@ -387,9 +387,11 @@ def addCalcium(model, ntype):
     pools = CaProto(model)
     capool = []
     params = model.CaPlasticityParams
+    #compiled once, instead of sorting the mapping for every compartment
+    shell_modes = DistanceMap(params.CaShellModeDensity)
     for comp in moose.wildcardFind(ntype + '/#[TYPE=Compartment]'):
         if NAME_NECK not in comp.name and NAME_HEAD not in comp.name:  # Look for spines connected to the dendrite
-            shellMode = distance_mapping(params.CaShellModeDensity, comp)
+            shellMode = shell_modes.at(comp)
             dshells_dend = add_calcium_to_compartment(model, shellMode, comp, pools, capool, spine=False)
             if dshells_dend == -1:
                 return
@@ -405,7 +407,7 @@ def addCalcium(model, ntype):
                         'Could not find spines!!!'
                 for sp in spines:
 
-                    shellMode = distance_mapping(params.CaShellModeDensity, moose.element(sp))
+                    shellMode = shell_modes.at(moose.element(sp))
                     dshells_neck = add_calcium_to_compartment(model, shellMode, moose.element(sp), pools, capool,
                                                               spine=True)
                     if dshells_neck == -1:
@@ -423,7 +425,7 @@ def addCalcium(model, ntype):
                     if not heads:
                         'Could not find heads!!!'
                     for head in heads:
-                        shellMode = distance_mapping(params.CaShellModeDensity, moose.element(head))
+                        shellMode = shell_modes.at(moose.element(head))
                         dshells_head = add_calcium_to_compartment(model, shellMode, moose.element(head), pools, capool,
                                                                   spine=True)
                         if dshells_head == -1:
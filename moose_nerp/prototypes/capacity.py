@@ -0,0 +1,241 @@
+"""\
+Capacity planner: predicts the size of a network before building it, from param_net,
+the neuron prototypes and the connectivity plan (create_network dry run).
+Predicts moose objects by class, messages, SynHandler synapses, time tables per TableSet
+and recording tables, and estimates memory, build time and run time from cost coefficients.
+COSTS are defaults measured on a desktop computer; calibrate() measures them on this machine.
+"""
+from __future__ import print_function, division
+import os
+import time
+from collections import Counter
+import numpy as np
+import moose
+
+from moose_nerp.prototypes import connect_plan, ttables, logutil
+log = logutil.Logger()
+
+#per-class memory (bytes) and creation time (sec) of moose objects, memory and time per object
+#of copied neuron prototypes (including their messages), memory and time per message and
+#per synapse, and run time per object per time step
+COSTS = {'object_bytes': {'Neutral': 410, 'Compartment': 985, 'ZombieCompartment': 985, 'HHChannel': 1990,
+                          'HHChannel2D': 1990, 'SynChan': 830, 'NMDAChan': 830, 'SimpleSynHandler': 1020,
+                          'TimeTable': 690, 'SpikeGen': 610, 'Table': 860, 'CaConc': 670, 'Function': 1200},
+         'object_time': {},
+         'default_object_bytes': 1000,
+         'default_object_time': 20e-6,
+         'copy_bytes': 600,
+         'copy_time': 1.6e-6,
+         'message_bytes': 133,
+         'message_time': 2.5e-6,
+         'synapse_bytes': 48,
+         'sample_bytes': 8,
+         'step_time': 0.15e-6}
+#classes that are calibrated, number of objects of each, and number of copies of neuron prototypes
+CALIBRATION_CLASSES = ['Neutral', 'Compartment', 'HHChannel', 'SynChan', 'SimpleSynHandler', 'TimeTable',
+                       'SpikeGen', 'Table', 'CaConc', 'Function']
+CALIBRATION_SIZE = 2000
+CALIBRATION_COPIES = 5
+CALIBRATION_PATH = '/capacity_calibration'
+#classes without computations at each time step
+PASSIVE_CLASSES = ['Neutral', 'Neuron', 'Spine', 'HHGate', 'HHGate2D', 'Synapse']
+#warn if the estimated memory exceeds MEMORY_WARN, and refuse to build above MEMORY_MAX, fraction of available memory
+MEMORY_WARN = 0.5
+MEMORY_MAX = 0.9
+
+def resident_memory():
+    #resident memory of this process in bytes, None if unknown
+    try:
+        import psutil
+        return psutil.Process(os.getpid()).memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError):
+        return None
+
+def available_memory():
+    #memory available for new objects in bytes, None if unknown
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def calibrate(neur_protos={}, num=CALIBRATION_SIZE):
+    #micro-benchmark: creation time and memory of each class, messages and synapses, copies of the
+    #neuron prototypes (if given) and time step cost; measured coefficients replace those in COSTS
+    #call before creating the network: time steps are measured only if no compartments exist
+    container = moose.Neutral(CALIBRATION_PATH)
+    run_steps = not len(moose.wildcardFind('/##[ISA=Compartment]'))
+    for cls in CALIBRATION_CLASSES:
+        parent = moose.Neutral(container.path + '/' + cls)
+        mem, start = resident_memory(), time.time()
+        for i in range(num):
+            getattr(moose, cls)('{}/x{}'.format(parent.path, i))
+        COSTS['object_time'][cls] = (time.time() - start) / num
+        if mem is not None:
+            COSTS['object_bytes'][cls] = max(resident_memory() - mem, 0) / num
+    sh = moose.SimpleSynHandler(container.path + '/sh')
+    mem = resident_memory()
+    sh.synapse.num = num
+    if mem is not None:
+        COSTS['synapse_bytes'] = max(resident_memory() - mem, 0) / num
+    tt = moose.TimeTable(container.path + '/tt')
+    mem, start = resident_memory(), time.time()
+    for i in range(num):
+        moose.connect(tt, 'eventOut', sh.synapse[i], 'addSpike')
+    COSTS['message_time'] = (time.time() - start) / num
+    if mem is not None:
+        COSTS['message_bytes'] = max(resident_memory() - mem, 0) / num
+    #time steps are measured only if no model exists, since moose.start runs all elements
+    if run_steps:
+        steps = 100
+        moose.reinit()
+        start = time.time()
+        moose.start(steps * moose.element('/clock').tickDt[0])
+        num_active = len([el for el in moose.wildcardFind(container.path + '/##')
+                          if el.className not in PASSIVE_CLASSES])
+        COSTS['step_time'] = (time.time() - start) / steps / num_active
+    else:
+        log.info('CAPACITY: model exists, step_time not calibrated')
+    if len(neur_protos):
+        copies = moose.Neutral(container.path + '/copies')
+        num_objects = CALIBRATION_COPIES * sum(sum(prototype_census(proto)[0].values()) for proto in neur_protos.values())
+        mem, start = resident_memory(), time.time()
+        for i in range(CALIBRATION_COPIES):
+            for ntype, proto in neur_protos.items():
+                moose.copy(proto, copies, ntype + str(i))
+        COSTS['copy_time'] = (time.time() - start) / num_objects
+        if mem is not None:
+            COSTS['copy_bytes'] = max(resident_memory() - mem, 0) / num_objects
+    moose.delete(container)
+    log.info('CAPACITY: calibrated {}', COSTS)
+    return COSTS
+
+def prototype_census(neur_proto):
+    #number of moose objects by class, and number of messages, of a neuron prototype
+    objects = Counter()
+    messages = 0
+    for element in [neur_proto] + list(moose.wildcardFind(neur_proto.path + '/##')):
+        objects[element.className] += 1
+        messages += len(element.msgOut)
+    return objects, messages
+
+def estimate_network(model, netparams, neur_protos={}, plan=None):
+    #predicted size of the network: counts, memory (bytes), build and run time (sec)
+    if plan is None:
+        plan = connect_plan.network_plan(model, netparams, neur_protos)
+    objects = Counter()   #objects created individually
+    copied = Counter()    #objects of copied neuron prototypes
+    copied_messages = 0
+    messages = 0
+    neurons = {ntype: len(cells) for ntype, cells in plan['pop'].items()}
+    if not plan['single']:
+        for ntype, num in neurons.items():
+            #copies of the prototypes, with spike generator connected to the soma
+            proto_objects, proto_messages = prototype_census(moose.element(ntype))
+            for cls, count in proto_objects.items():
+                copied[cls] += count * num
+            copied_messages += proto_messages * num
+            objects['SpikeGen'] += num
+            messages += num
+    #synapses, including the NMDA synapses created with each AMPA synapse
+    #merged extern trains (connect_plan.merged_edges) are about one time table and synapse per merge
+    merged, merge_id = connect_plan.merged_edges(plan, netparams)
+    merge_first = np.unique(merge_id[merged], return_index=True)[1]
+    merged_tt = plan['edges'][merged][merge_first]
+    merged_tt['pre'] = -1
+    objects['TimeTable'] += len(merged_tt)
+    edges = np.concatenate([plan['edges'][~merged], merged_tt])
+    conns = [key.split(connect_plan.CONN_KEY_SEPARATOR) for key in plan['conns']]
+    synapses = len(edges)
+    syn_params = model.param_syn
+    ampa_edges = [syn_conn for syn_conn in zip(edges['syn'], edges['conn'])
+                  if plan['synapses'][syn_conn[0]].endswith(syn_params.NAME_AMPA)]
+    for (syn, conn_num), count in Counter(ampa_edges).items():
+        branch = plan['synapses'][syn].rsplit('/', 1)[0]
+        if moose.exists(moose.element(conns[conn_num][0]).path + '/' + branch + '/' + syn_params.NAME_NMDA):
+            synapses += count
+    messages += synapses
+    #short term plasticity: one function per synapse, plus one for each of depression and facilitation
+    for conn_num, count in Counter(edges['stp'][edges['stp'] >= 0]).items():
+        post, syntype, pre = conns[conn_num]
+        stp_params = netparams.connect_dict[post][syntype][pre].stp
+        num_inputs = (stp_params.depress is not None) + (stp_params.facil is not None)
+        objects['Function'] += count * (1 + num_inputs)
+        messages += count * (1 + 2 * num_inputs)
+    #time tables: only the trains of each TableSet connected to a synapse are created
+    time_tables = {}
+    pre_nodes = edges['pre'][edges['pre'] >= plan['num_cells']]
+    for tableset in ttables.TableSet.ALL:
+        prefix = tableset.table_path('')
+        in_set = np.array([path.startswith(prefix) for path in plan['nodes']], dtype=bool)
+        if not np.any(in_set):
+            continue
+        used = np.unique(pre_nodes[in_set[pre_nodes]])
+        time_tables[tableset.tablename] = {'available': int(np.sum(in_set)), 'used': len(used),
+                                           'synapses': int(np.sum(in_set[pre_nodes]))}
+        objects['TimeTable'] += len(used)
+    #recording tables: spike table for every neuron, Vm table if plot_netvm (see net_output.SpikeTables)
+    param_sim = model.param_sim
+    num_neurons = sum(neurons.values())
+    plot_netvm = bool(getattr(netparams, 'plot_netvm', 0)) and not plan['single']
+    recording_tables = num_neurons * (2 if plot_netvm else 1)
+    objects['Table'] += recording_tables
+    messages += recording_tables
+    samples = (num_neurons if plot_netvm else 0) * int(param_sim.simtime / param_sim.plotdt)
+    #costs
+    object_bytes = sum(count * COSTS['object_bytes'].get(cls, COSTS['default_object_bytes'])
+                       for cls, count in objects.items())
+    memory = (object_bytes + sum(copied.values()) * COSTS['copy_bytes'] + messages * COSTS['message_bytes'] +
+              synapses * COSTS['synapse_bytes'] + samples * COSTS['sample_bytes'])
+    build_time = (sum(count * COSTS['object_time'].get(cls, COSTS['default_object_time'])
+                      for cls, count in objects.items()) +
+                  sum(copied.values()) * COSTS['copy_time'] + messages * COSTS['message_time'])
+    objects.update(copied)
+    num_active = sum(count for cls, count in objects.items() if cls not in PASSIVE_CLASSES)
+    run_time = num_active * COSTS['step_time'] * param_sim.simtime / param_sim.simdt
+    return {'neurons': neurons,
+            'objects': dict(objects),
+            'messages': int(messages + copied_messages),
+            'synapses': int(synapses),
+            'time_tables': time_tables,
+            'recording_tables': recording_tables,
+            'memory': memory,
+            'build_time': build_time,
+            'run_time': run_time}
+
+def report(estimate):
+    print('CAPACITY: neurons', estimate['neurons'])
+    for cls, count in sorted(estimate['objects'].items()):
+        print('   {:20s} {:12d}'.format(cls, count))
+    print('   messages {} synapses {} recording tables {}'.format(estimate['messages'], estimate['synapses'],
+                                                                 estimate['recording_tables']))
+    for tablename, counts in estimate['time_tables'].items():
+        print('   time tables {}: {}'.format(tablename, counts))
+    print('   memory {:.1f} MB, build {:.1f} s, run {:.1f} s (without hsolve)'.format(
+        estimate['memory'] / 2 ** 20, estimate['build_time'], estimate['run_time']))
+
+def check_capacity(estimate, warn=MEMORY_WARN, max_fraction=MEMORY_MAX):
+    #warn, or raise MemoryError, if the estimated memory is a large fraction of available memory
+    available = available_memory()
+    if available is None:
+        log.info('CAPACITY: available memory unknown, estimated {:.1f} MB', estimate['memory'] / 2 ** 20)
+        return
+    fraction = estimate['memory'] / available
+    if fraction > max_fraction:
+        raise MemoryError('network needs about {:.0f} MB, only {:.0f} MB available'.format(
+            estimate['memory'] / 2 ** 20, available / 2 ** 20))
+    if fraction > warn:
+        log.warning('CAPACITY: network needs about {:.0f} MB, {:.0%} of available memory',
+                    estimate['memory'] / 2 ** 20, fraction)
+    else:
+        log.info('CAPACITY: network needs about {:.0f} MB, build {:.0f} s', estimate['memory'] / 2 ** 20,
+                 estimate['build_time'])
@@ -11,6 +11,8 @@ from moose_nerp.prototypes import (calcium,
                      spines,
                      syn_proto,
                      add_channel,
+                     connect_plan,
+                     library_snapshot,
                      util as _util,
                      logutil
                      )
@@ -29,7 +31,10 @@ def create_neuron(model, ntype, ghkYN):
         raise
     #######channels
     Cond = model.Condset[ntype]
-    for comp in moose.wildcardFind('{}/#[TYPE=Compartment]'.format(ntype)):
+    comps = moose.wildcardFind('{}/#[TYPE=Compartment]'.format(ntype))
+    #conductance of each channel (columns) in each compartment (rows), evaluated at once
+    conds = _util.distance_matrix(Cond, comps)
+    for comp, comp_conds in zip(comps, conds):
         #If we are using GHK, just create one GHK per compartment, connect it to comp
         #calcium concentration is connected in a different function
         if ghkYN:
@@ -38,8 +43,7 @@ def create_neuron(model, ntype, ghkYN):
             moose.connect(ghk,'channel',comp,'channel')
         else:
             ghk=[]
-        for channame in Cond.keys():
-            c = _util.distance_mapping(Cond[channame], comp)
+        for channame, c in zip(Cond.keys(), comp_conds):
             if c > 0:
                 log.debug('Testing Cond If {} {}', channame, c)
                 calciumPermeable = model.Channels[channame].calciumPermeable
@@ -53,10 +57,10 @@ def create_neuron(model, ntype, ghkYN):
     return cellproto
 
 def neuronclasses(model):
-    ##create channels in the library
-    chan_proto.chanlib(model)
-    syn_proto.synchanlib(model)
-    ##now create the neuron prototypes
+    ##create channels in the library, or restore them from a snapshot (model.library_cache)
+    library_snapshot.make_library(model)
+    ##now create the neuron prototypes; synapse candidate tables of previous prototypes are obsolete
+    connect_plan.clear_synapse_tables()
     neuron={}
     synArray={}
     headArray={}
@@ -0,0 +1,203 @@
+"""\
+Voltage clamp characterization of the channels of a model (model.Channels, created in /library by
+chanlib).  For each channel, one clamp compartment (VClamp and command PulseGen, as vclamp.py) is
+created per voltage step, and all compartments of all channels are simulated together.  Gates of
+calcium (ZChannelParams) are stepped in calcium concentration instead, by a PulseGen into concen.
+From the recorded gate states, the steady state (inf) and time constant (tau, time to reach 1-1/e
+of the change) of each gate at each step are extracted, and compared with the analytic forms of
+table_resolution.gate_rates.  Time constants close to the settling time of the clamp (a few simdt)
+are overestimated.  2D (BK) channels are not characterized.
+
+   results = chan_characterize.characterize(model)
+   costs = chan_characterize.integration_cost(model)
+   chan_characterize.report(results, costs)
+"""
+from __future__ import print_function, division
+import time
+import numpy as np
+import moose
+
+from moose_nerp.prototypes import add_channel, chan_proto, table_resolution, logutil
+log = logutil.Logger()
+
+PATH = '/chan_clamp'
+SIMDT = 2e-5
+HOLD = -0.1
+VSTEPS = np.linspace(-0.1, 0.04, 15)
+NUM_CA_STEPS = 16
+DELAY = 0.01
+DURATION = 0.5
+#geometry (m) and membrane (per m2) of the clamp compartments, channel density (S/m2)
+DIAMETER = 10e-6
+CM = 0.01
+RM = 1.0
+GBAR = 10.0
+#a gate is converged if it changes less than CONVERGED of its change during the last 10% of the step;
+#tau is not measured if the change is less than MIN_CHANGE
+CONVERGED = 1e-3
+MIN_CHANGE = 1e-3
+
+def compartment(path, hold):
+    comp = moose.Compartment(path)
+    comp.length = comp.diameter = DIAMETER
+    area = np.pi * DIAMETER ** 2
+    comp.Cm = CM * area
+    comp.Rm = RM / area
+    comp.Em = comp.initVm = hold
+    return comp
+
+def step(path, hold, level, delay):
+    #command stepped from hold to level at delay
+    command = moose.PulseGen(path)
+    command.baseLevel = hold
+    command.firstDelay = delay
+    command.firstLevel = level
+    command.firstWidth = 1e9
+    return command
+
+def clamp_compartment(path, hold, level, delay, simdt):
+    #compartment clamped at hold, stepped to level at delay
+    comp = compartment(path, hold)
+    clamp = moose.VClamp(path + '/vclamp')
+    clamp.tau = 2 * simdt
+    clamp.ti = simdt
+    clamp.gain = comp.Cm / simdt
+    moose.connect(step(path + '/command', hold, level, delay), 'output', clamp, 'commandIn')
+    moose.connect(clamp, 'currentOut', comp, 'injectMsg')
+    moose.connect(comp, 'VmOut', clamp, 'sensedIn')
+    return comp
+
+def library(model, channels):
+    #create the channels that are not yet in /library
+    if not moose.exists('/library'):
+        moose.Neutral('/library')
+    for name in channels:
+        if not moose.exists('/library/' + name):
+            chan_proto.make_channel(model, '/library/' + name, model.Channels[name])
+
+def gates(params):
+    #gates of a channel: name, parameters and the stepped variable (Vm or Ca)
+    return [(gate, getattr(params, gate), 'Ca' if isinstance(getattr(params, gate), chan_proto.ZChannelParams) else 'Vm')
+            for gate, power in (('X', params.channel.Xpow), ('Y', params.channel.Ypow), ('Z', params.channel.Zpow))
+            if power > 0]
+
+def build(model, channels=None, vsteps=VSTEPS, casteps=None, hold=HOLD, delay=DELAY, simdt=SIMDT, path=PATH):
+    #clamp compartments of all channels (names of model.Channels, all if None) and tables of their
+    #gate states; returns one family (dict) per channel and stepped variable
+    if casteps is None:
+        casteps = np.geomspace(model.CAMIN, model.CAMAX, NUM_CA_STEPS)
+    if channels is None:
+        channels = list(model.Channels)
+    channels = [name for name in channels if not isinstance(model.Channels[name], chan_proto.TwoD)]
+    library(model, channels)
+    moose.Neutral(path)
+    families = []
+    for name in channels:
+        params = model.Channels[name]
+        for variable, levels in (('Vm', vsteps), ('Ca', casteps)):
+            gate_names = [gate for gate, gate_params, var in gates(params) if var == variable]
+            if not gate_names:
+                continue
+            family = {'channel': name, 'variable': variable, 'levels': np.asarray(levels), 'gates': gate_names,
+                      'tables': {gate: [] for gate in gate_names}}
+            for k, level in enumerate(levels):
+                comp_path = '{}/{}_{}{}'.format(path, name, variable, k)
+                if variable == 'Vm':
+                    comp = clamp_compartment(comp_path, hold, level, delay, simdt)
+                else:
+                    comp = compartment(comp_path, hold)
+                add_channel.addOneChan(name, GBAR, comp, False)
+                chan = moose.element(comp.path + '/' + name)
+                if variable == 'Ca':
+                    #calcium concentration of the channel, stepped from CAMIN
+                    moose.connect(step(comp_path + '/concen', model.CAMIN, level, delay), 'output', chan, 'concen')
+                for gate in gate_names:
+                    tab = moose.Table(comp.path + '/' + gate)
+                    moose.connect(tab, 'requestOut', chan, 'get' + gate)
+                    family['tables'][gate].append(tab)
+            families.append(family)
+    return families
+
+def gate_kinetics(traces, simdt, delay):
+    #steady state and time constant of gate traces (steps x time) after the step at delay;
+    #nan if the gate has not converged, or (tau) if it hardly changes
+    traces = np.asarray(traces)
+    start = int(round(delay / simdt))
+    x = traces[:, start:]
+    x0, xss = x[:, :1], x[:, -1:]
+    change = xss - x0
+    last = x[:, -max(x.shape[1] // 10, 2)]
+    converged = np.abs(xss[:, 0] - last) <= CONVERGED * np.maximum(np.abs(change[:, 0]), MIN_CHANGE)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frac = (x - x0) / change
+    reached = frac >= 1 - np.exp(-1)
+    idx = np.maximum(np.argmax(reached, axis=1), 1)
+    rows = np.arange(len(x))
+    #linear interpolation between the samples before and after crossing
+    before, after = frac[rows, idx - 1], frac[rows, idx]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tau = (idx - 1 + (1 - np.exp(-1) - before) / (after - before)) * simdt
+    tau[~converged | (np.abs(change[:, 0]) < MIN_CHANGE) | ~reached.any(axis=1)] = np.nan
+    inf = np.where(converged, xss[:, 0], np.nan)
+    return inf, tau
+
+def characterize(model, channels=None, vsteps=VSTEPS, casteps=None, hold=HOLD, delay=DELAY, duration=DURATION,
+                 simdt=SIMDT, path=PATH):
+    #run the clamp families of all channels in one simulation; returns, by channel and gate, the
+    #stepped variable, levels, measured and analytic inf and tau
+    families = build(model, channels, vsteps, casteps, hold, delay, simdt, path)
+    for tick in range(0, 10):
+        moose.setClock(tick, simdt)
+    moose.reinit()
+    moose.start(delay + duration)
+    results = {}
+    for family in families:
+        params = model.Channels[family['channel']]
+        for gate in family['gates']:
+            inf, tau = gate_kinetics([tab.vector for tab in family['tables'][gate]], simdt, delay)
+            A, B = table_resolution.gate_rates(getattr(params, gate), family['levels'])
+            results.setdefault(family['channel'], {})[gate] = {
+                'variable': family['variable'], 'levels': family['levels'], 'inf': inf, 'tau': tau,
+                'inf_analytic': A / B, 'tau_analytic': 1 / B}
+    moose.delete(path)
+    return results
+
+def integration_cost(model, channels=None, num=100, steps=2000, simdt=SIMDT, path=PATH):
+    #run time (sec) per channel per time step of each channel, from num compartments with the
+    #channel, relative to num compartments without channels (without hsolve)
+    if channels is None:
+        channels = list(model.Channels)
+    channels = [name for name in channels if not isinstance(model.Channels[name], chan_proto.TwoD)]
+    library(model, channels)
+    for tick in range(0, 10):
+        moose.setClock(tick, simdt)
+    def run_time(name):
+        container = moose.Neutral(path)
+        for k in range(num):
+            comp = compartment('{}/comp{}'.format(path, k), HOLD)
+            if name is not None:
+                add_channel.addOneChan(name, GBAR, comp, False)
+        moose.reinit()
+        start = time.time()
+        moose.start(steps * simdt)
+        elapsed = time.time() - start
+        moose.delete(container)
+        return elapsed
+    base = run_time(None)
+    return {name: (run_time(name) - base) / (num * steps) for name in channels}
+
+def _max_abs(values):
+    #largest absolute value, nan if none is finite
+    values = np.abs(values[np.isfinite(values)])
+    return np.max(values) if len(values) else np.nan
+
+def report(results, costs={}):
+    print('CHANNELS: {:8s} {:4s} {:>4s} {:>12s} {:>12s} {:>14s}'.format('channel', 'gate', 'var', 'max inf err',
+                                                                       'max tau err', 'cost us/step'))
+    for name, gate_results in results.items():
+        for gate, res in gate_results.items():
+            inf_err = _max_abs(res['inf'] - res['inf_analytic'])
+            tau_err = _max_abs(res['tau'] / res['tau_analytic'] - 1)
+            cost = '{:14.3f}'.format(costs[name] * 1e6) if name in costs else '{:>14s}'.format('-')
+            print('          {:8s} {:4s} {:>4s} {:12.4g} {:12.4g} {}'.format(name, gate, res['variable'],
+                                                                            inf_err, tau_err, cost))
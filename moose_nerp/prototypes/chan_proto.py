@@ -4,9 +4,17 @@ Create general Channel Proto, pass in name, x and y power, and params
 Also, create the library of channels
 chan_proto requires alpha and beta params for both activation and inactivation
 If channel does not have inactivation, just send in empty Yparam array.
+
+Gate tables can be cached on disk (chanlib cache_dir, or model.gate_cache): the tables of each
+channel are saved in an npz file named by a hash of the channel parameters and of the voltage and
+calcium ranges, and later processes only copy them into the gates.  The 2D tables of BK channels
+are not cached: they are computed faster than a file of their size is read.
 """
 
 from __future__ import print_function, division
+import os
+import hashlib
+import tempfile
 import moose
 import numpy as np
 import logging
@@ -85,13 +93,16 @@ def interpolate_values_in_table(model, tabA, V_0, l=40):
     around tabA[V_0]. '''
     V = np.linspace(model.VMIN, model.VMAX, len(tabA))
     idx =  abs(V-V_0).argmin()
-    A_min = tabA[idx-l]
-    V_min = V[idx-l]
-    A_max = tabA[idx+l]
-    V_max = V[idx+l]
+    #the interpolated range is limited to the table
+    lo = max(idx-l, 0)
+    hi = min(idx+l, len(tabA)-1)
+    A_min = tabA[lo]
+    V_min = V[lo]
+    A_max = tabA[hi]
+    V_max = V[hi]
     a = (A_max-A_min)/(V_max-V_min)
     b = A_max - a*V_max
-    tabA[idx-l:idx+l] = V[idx-l:idx+l]*a+b
+    tabA[lo:hi] = V[lo:hi]*a+b
     return tabA
 
 def  calc_V0(rate,B,C,vhalf,vslope,Params):
@@ -117,8 +128,27 @@ def fix_singularities(model, Params, Gate):
             #change values in tableB (alpha is stored in tableA)
             Gate.tableB = interpolate_values_in_table(model, Gate.tableB, V_0)
 
-def make_gate(params,model,gate):
-    if isinstance(params,AlphaBetaChannelParams):
+def set_gate_tables(gate, tables, name):
+    #copy tables of gate name (e.g. gateX), saved by gate_tables, into gate
+    rng = tables[name + '/range']
+    if len(rng) == 3:
+        gate.min = rng[0]
+        gate.max = rng[1]
+        gate.divs = int(rng[2])
+    else:
+        gate.xminA = gate.xminB = rng[0]
+        gate.xmaxA = gate.xmaxB = rng[1]
+        gate.xdivsA = gate.xdivsB = int(rng[2])
+        gate.yminA = gate.yminB = rng[3]
+        gate.ymaxA = gate.ymaxB = rng[4]
+        gate.ydivsA = gate.ydivsB = int(rng[5])
+    gate.tableA = tables[name + '/tableA']
+    gate.tableB = tables[name + '/tableB']
+
+def make_gate(params,model,gate,tables=None):
+    if tables is not None:
+        set_gate_tables(gate, tables, gate.name)
+    elif isinstance(params,AlphaBetaChannelParams):
         gate.setupAlpha(params + [model.VDIVS, model.VMIN, model.VMAX])
         fix_singularities(model, params, gate)
     elif isinstance(params,StandardMooseTauInfChannelParams):
@@ -127,53 +157,62 @@ def make_gate(params,model,gate):
     elif isinstance(params,TauInfMinChannelParams):
         make_sigmoid_gate(model,params,gate)
 
-def chan_proto(model, chanpath, params):
+def Z_gate_tables(params, ca_array):
+    #tableA (inf/tau) and tableB (1/tau) of a calcium dependent gate, ZChannelParams
+    caterm = (ca_array/params.Kd) ** params.power
+    inf_z = caterm / (1 + caterm)
+    if params.taumax>0:
+        tauterm=(ca_array/params.cahalf)**params.tau_power
+        taumax_z=(params.taumax-params.tau)/(1+tauterm)
+        taumin_z= params.tau * np.ones(len(ca_array))
+        tau_z = taumin_z+taumax_z
+    else:
+        tau_z = params.tau * np.ones(len(ca_array))
+    return inf_z / tau_z, 1 / tau_z
+
+def chan_proto(model, chanpath, params, tables=None):
+    #tables: gate tables saved by gate_tables, used instead of computing them
     log.info("{}: {}", chanpath, params)
     chan = moose.HHChannel(chanpath)
 
     chan.Xpower = params.channel.Xpow
     if params.channel.Xpow > 0:
         xGate = moose.HHGate(chan.path + '/gateX')
-        make_gate(params.X,model,xGate)
+        make_gate(params.X,model,xGate,tables)
 
     chan.Ypower = params.channel.Ypow
     if params.channel.Ypow > 0:
         yGate = moose.HHGate(chan.path + '/gateY')
-        make_gate(params.Y,model,yGate)
+        make_gate(params.Y,model,yGate,tables)
 
     if params.channel.Zpow > 0:
         chan.Zpower = params.channel.Zpow
         zGate = moose.HHGate(chan.path + '/gateZ')
-        if params.Z.__class__==ZChannelParams:
+        if params.Z.__class__==ZChannelParams and tables is not None:
+            set_gate_tables(zGate, tables, 'gateZ')
+            chan.useConcentration = True
+        elif params.Z.__class__==ZChannelParams:
             #
             ca_array = np.linspace(model.CAMIN, model.CAMAX, model.CADIVS)
             zGate.min = model.CAMIN
             zGate.max = model.CAMAX
-            caterm = (ca_array/params.Z.Kd) ** params.Z.power
-            inf_z = caterm / (1 + caterm)
-            if params.Z.taumax>0:
-                tauterm=(ca_array/params.Z.cahalf)**params.Z.tau_power
-                taumax_z=(params.Z.taumax-params.Z.tau)/(1+tauterm)
-                taumin_z= params.Z.tau * np.ones(len(ca_array))
-                tau_z = taumin_z+taumax_z
-            else:
-                tau_z = params.Z.tau * np.ones(len(ca_array))
-            #
-            zGate.tableA = inf_z / tau_z
-            zGate.tableB = 1 / tau_z
+            zGate.tableA, zGate.tableB = Z_gate_tables(params.Z, ca_array)
             chan.useConcentration = True
         else:
             chan.useConcentration = False
-            make_gate(params.Z,model,zGate)
+            make_gate(params.Z,model,zGate,tables)
 
     chan.Ek = params.channel.Erev
     chan.tick=-1
     return chan
 
-def BKchan_proto(model, chanpath, params):
+def BK_gating_matrix(model, params, v_array=None, ca_array=None):
+    #tableA and tableB of the BK gate, at voltages (rows) and calcium concentrations (columns)
     ZFbyRT= 2 * constants.Faraday / (constants.R * constants.celsius_to_kelvin(model.Temp))
-    v_array = np.linspace(model.VMIN, model.VMAX, model.VDIVS)
-    ca_array = np.linspace(model.CAMIN, model.CAMAX, model.CADIVS)
+    if v_array is None:
+        v_array = np.linspace(model.VMIN, model.VMAX, model.VDIVS)
+    if ca_array is None:
+        ca_array = np.linspace(model.CAMIN, model.CAMAX, model.CADIVS)
     if model.VDIVS<=5 and model.CADIVS<=5:
         log.info("{}, {}", v_array, ca_array)
     gatingMatrix = []
@@ -186,7 +225,10 @@ def BKchan_proto(model, chanpath, params):
             gatingMatrix.append(pars.alphabeta/(1+ca_array[None,:]/pars.K*Vdepgating[:,None]))
             gatingMatrix[i] += gatingMatrix[0]
             #table.tableVector2D=gatingMatrix
+    return gatingMatrix
 
+def BKchan_proto(model, chanpath, params):
+    gatingMatrix = BK_gating_matrix(model, params)
 
     chan = moose.HHChannel2D(chanpath)
     chan.Xpower = params.channel.Xpow
@@ -223,15 +265,69 @@ _FUNCTIONS = {
     TwoD: BKchan_proto,
 }
 
-def make_channel(model, chanpath, params):
+GATE_CACHE_VERSION = 1
+
+def gate_fingerprint(model, params):
+    #hash of everything that determines the gate tables of a channel
+    key = repr((GATE_CACHE_VERSION, params, model.VMIN, model.VMAX, model.VDIVS,
+                model.CAMIN, model.CAMAX, model.CADIVS, model.Temp))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def gate_tables(chan):
+    #tables of the gates of chan, as arrays by gate name/table; range holds min, max and divs
+    tables = {}
+    #gates of zero power are not created, and cannot be read
+    for name, power in (('gateX', chan.Xpower), ('gateY', chan.Ypower), ('gateZ', chan.Zpower)):
+        if power <= 0:
+            continue
+        if chan.className == 'HHChannel2D':
+            gate = moose.HHGate2D(chan.path + '/' + name)
+            rng = [gate.xminA, gate.xmaxA, gate.xdivsA, gate.yminA, gate.ymaxA, gate.ydivsA]
+        else:
+            gate = moose.HHGate(chan.path + '/' + name)
+            rng = [gate.min, gate.max, gate.divs]
+        tables[name + '/range'] = np.array(rng, dtype=float)
+        tables[name + '/tableA'] = np.array(gate.tableA)
+        tables[name + '/tableB'] = np.array(gate.tableB)
+    return tables
+
+def save_gate_tables(tables, filename):
+    #written to a temporary file and then renamed, so that other processes never read a partial file
+    fd, tmpname = tempfile.mkstemp(suffix='.npz', dir=os.path.dirname(os.path.abspath(filename)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **tables)
+        os.replace(tmpname, filename)
+    except BaseException:
+        os.remove(tmpname)
+        raise
+
+def make_channel(model, chanpath, params, cache_dir=None):
+    #if cache_dir is given, gate tables are read from, or saved to, the cache (except 2D channels)
     func = _FUNCTIONS[params.__class__]
-    return func(model, chanpath, params)
+    if cache_dir is None or isinstance(params, TwoD):
+        return func(model, chanpath, params)
+    #fingerprint before creating the channel, which may change params (fix_singularities)
+    fname = os.path.join(cache_dir, 'gates_' + gate_fingerprint(model, params) + '.npz')
+    if os.path.exists(fname):
+        with np.load(fname) as data:
+            tables = dict(data)
+        log.debug('{}: gate tables from {}', chanpath, fname)
+        return func(model, chanpath, params, tables)
+    chan = func(model, chanpath, params)
+    save_gate_tables(gate_tables(chan), fname)
+    return chan
 
-def chanlib(model):
+def chanlib(model, cache_dir=None):
+    #cache_dir: directory of cached gate tables, if not given model.gate_cache (if defined)
+    if cache_dir is None:
+        cache_dir = getattr(model, 'gate_cache', None)
+    if cache_dir is not None and not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
     if not moose.exists('/library'):
         moose.Neutral('/library')
     #Adding all the channels to the library.
-    chan = [make_channel(model, '/library/'+key, value) for key, value in model.Channels.items()]
+    chan = [make_channel(model, '/library/'+key, value, cache_dir) for key, value in model.Channels.items()]
     if model.ghkYN:
         ghk = moose.GHK('/library/ghk')
         ghk.T = model.Temp
@@ -8,7 +8,7 @@ import moose
 import logging
 
 from moose_nerp.prototypes import (pop_funcs,
-                                   connect,
+                                   connect_plan,
                                    ttables,
                                    logutil)
 
@@ -25,6 +25,7 @@ max_dist=5.0
 def count_postsyn(netparams,NumSyn,population):
     num_postcells={}  #dictionary of number of cells by type
     num_postsyn={}   #dictionary of post-synaptic receptors by cell type and synaptic receptor
+    syn_tables={}    #dictionary of synapse candidate tables by cell type and synaptic receptor
     for ntype in netparams.connect_dict.keys():   #top level key is post-synaptic type
         #convert to list if only singe instance of any cell type
         if not isinstance(population[ntype],list):
@@ -32,14 +33,14 @@ def count_postsyn(netparams,NumSyn,population):
             population[ntype]=list([temp])
         num_postcells[ntype]=len(population[ntype])
         num_postsyn[ntype]={}
-        neur_proto=moose.element(ntype).path
-        #allsyncomp_list = moose.wildcardFind(neur_proto + '/##[ISA=SynChan]')
+        syn_tables[ntype]={}
+        neur_proto=moose.element(ntype)
         for syntype in netparams.connect_dict[ntype].keys():  #next level is synaptic receptor
-            allsyncomp_list = moose.wildcardFind(neur_proto + '/##/'+syntype+'[ISA=SynChan]')
-            print('CREATE_SYNPATH_ARRAY from check_connect.count_postyn, no prob')
-            syncomps,totalsyn,availsyn=connect.create_synpath_array(allsyncomp_list,syntype,NumSyn)
+            #synapse candidate table of prototype, shared with connect_plan
+            syn_tables[ntype][syntype]=connect_plan.synapse_table(neur_proto,syntype,NumSyn)
+            totalsyn=np.sum(syn_tables[ntype][syntype]['syn_per_comp'])
             num_postsyn[ntype][syntype]=num_postcells[ntype]*totalsyn
-    return num_postsyn,num_postcells,allsyncomp_list
+    return num_postsyn,num_postcells,syn_tables
 
 def count_presyn(netparams,num_cells,volume):
     presyn_cells={}
@@ -61,7 +62,7 @@ def count_presyn(netparams,num_cells,volume):
                     predict_cells=0
                     for dist in np.arange(min_dist*space_const,max_dist*space_const,dist_incr*space_const):
                         outer_area=np.pi*dist*dist
-                        predict_cells+=np.int(density*(outer_area-inner_area)*np.exp(-dist/space_const))
+                        predict_cells+=int(density*(outer_area-inner_area)*np.exp(-dist/space_const))
                         log.debug("dist {} outer_area {} predict_cells {} ",  dist, outer_area, predict_cells)
                         inner_area=outer_area
                     presyn_cells[ntype][syntype]+=min(max_cells,predict_cells)/netparams.connect_dict[ntype][syntype][presyn_type].num_conns
@@ -70,7 +71,7 @@ def count_presyn(netparams,num_cells,volume):
                     print('need to specify either probability or space constant in param_net for', presyn_type)
     return presyn_cells
 
-def count_total_tt(netparams,num_postsyn,num_postcells,allsyncomp_list,NumSyn):
+def count_total_tt(netparams,num_postsyn,num_postcells,syn_tables,NumSyn):
     tt_needed_per_syntype={}
     tt_per_ttfile={}
     for each in ttables.TableSet.ALL:
@@ -90,10 +91,10 @@ def count_total_tt(netparams,num_postsyn,num_postcells,allsyncomp_list,NumSyn):
                         dend_prob=syn_connects[pretype].dend_loc
                     else:
                         dend_prob=None
-                    print('CREATE_SYNPATH_ARRAY from check_connect.count_total_tt')
-                    syncomps,totalsyn,availsyn=connect.create_synpath_array(allsyncomp_list,syntype,NumSyn,prob=dend_prob)
-                    needed_trains+=np.int(np.ceil(len(syncomps)/dups))
-                    tt_per_ttfile[ttname.tablename][ntype]={'num': np.int(np.ceil(totalsyn/dups))*num_postcells[ntype], 'syn_per_tt': dups}
+                    entry_prob=connect_plan.synapse_entries(syn_tables[ntype][syntype],dend_prob)[2]
+                    totalsyn=np.sum(entry_prob)
+                    needed_trains+=int(np.ceil(np.count_nonzero(entry_prob)/dups))
+                    tt_per_ttfile[ttname.tablename][ntype]={'num': int(np.ceil(totalsyn/dups))*num_postcells[ntype], 'syn_per_tt': dups}
                     log.info('tt {} syn_per_tt {} postsyn_prob {} needed_trains {} per neuron',pretype, dups,dend_prob,needed_trains)
                 tt_needed_per_syntype[ntype][syntype]=needed_trains
     for each in ttables.TableSet.ALL:
@@ -112,9 +113,9 @@ def check_netparams(netparams,NumSyn,population=[]):
         for ntype in netparams.connect_dict.keys():
             population[ntype]=np.arange(np.round(num_neurons*netparams.pop_dict[ntype].percent))
     log.debug("pop {}",population)
-    num_postsyn,num_postcells,allsyncomp_list=count_postsyn(netparams,NumSyn,population)
+    num_postsyn,num_postcells,syn_tables=count_postsyn(netparams,NumSyn,population)
     log.info("num synapses {} cells {}", num_postsyn, num_postcells)
-    tt_per_syn,tt_per_ttfile=count_total_tt(netparams,num_postsyn,num_postcells,allsyncomp_list,NumSyn)
+    tt_per_syn,tt_per_ttfile=count_total_tt(netparams,num_postsyn,num_postcells,syn_tables,NumSyn)
     log.info("num time tables needed: per synapse type {} per ttfile {}", tt_per_syn, tt_per_ttfile)
     presyn_cells=count_presyn(netparams,num_postcells,volume)
     log.info("num presyn_cells {}", presyn_cells)
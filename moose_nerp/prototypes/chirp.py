@@ -22,5 +22,88 @@ def chirp(gen_name="chirp", amp=1, f0=1, f1=50, T=0.8, start=0.1, end=0.5, simdt
     return func_1
 
 
-def connect_chirp_to_compartment(chrip_obj, comp_element):
+def connect_chirp_to_compartment(chirp_obj, comp_element):
     moose.connect(chirp_obj, 'valueOut', comp_element, 'injectMsg')
+
+
+# Precomputed waveforms, played by a StimulusTable (stimulus_table), instead of evaluating the
+# expression in the simulation; amp, f0, f1 and freqs may be arrays, giving one waveform per row
+
+def _times(T, simdt):
+    return np.arange(int(round(T / simdt))) * simdt
+
+
+def chirp_waveform(amp=1, f0=1, f1=50, T=0.8, simdt=10E-5, phase=0, amp_offset=0):
+    ''' Linear chirp: frequency increases linearly from f0 to f1 during T
+    '''
+    t = _times(T, simdt)
+    f0, f1, amp = [np.asarray(x, dtype=float)[..., np.newaxis] for x in (f0, f1, amp)]
+    return amp * np.sin(2 * np.pi * (f0 * t + (f1 - f0) / (2 * T) * t ** 2) + phase) + amp_offset
+
+
+def zap_waveform(amp=1, f0=1, f1=50, T=0.8, simdt=10E-5, phase=0, amp_offset=0):
+    ''' ZAP current: frequency increases exponentially from f0 to f1 during T,
+    so that each octave gets the same time
+    '''
+    t = _times(T, simdt)
+    f0, f1, amp = [np.asarray(x, dtype=float)[..., np.newaxis] for x in (f0, f1, amp)]
+    rate = np.log(f1 / f0) / T
+    return amp * np.sin(2 * np.pi * f0 * np.expm1(rate * t) / rate + phase) + amp_offset
+
+
+def multisine_waveform(amp=1, freqs=(1, 2, 5, 10, 20, 50), T=0.8, simdt=10E-5, phases=None, amp_offset=0):
+    ''' Sum of sines at freqs, scaled to peak amplitude amp; Schroeder phases if phases not given,
+    which keep the peak amplitude low
+    '''
+    t = _times(T, simdt)
+    freqs = np.asarray(freqs, dtype=float)
+    num = freqs.shape[-1]
+    if phases is None:
+        phases = -np.pi * np.arange(num) * (np.arange(num) + 1) / num
+    wave = np.sum(np.sin(2 * np.pi * freqs[..., np.newaxis] * t + np.asarray(phases)[..., np.newaxis]), axis=-2)
+    wave = wave / np.max(np.abs(wave), axis=-1, keepdims=True)
+    return np.asarray(amp, dtype=float)[..., np.newaxis] * wave + amp_offset
+
+
+WAVEFORMS = {'chirp': chirp_waveform, 'zap': zap_waveform, 'multisine': multisine_waveform}
+
+
+def set_waveform(table, waveform, simdt, start=0.1):
+    ''' Play waveform (sampled at simdt) from time start; the output is 0 before and after
+    '''
+    # StimulusTable outputs the first value before startTime and the last after stopTime
+    table.vector = np.concatenate([[0], waveform, [0]])
+    table.startTime = start - simdt
+    table.stepSize = simdt
+    table.stepPosition = 0
+    table.stopTime = start + len(waveform) * simdt
+
+
+def stimulus_table(waveform, simdt, start=0.1, comps=(), gen_name='stim'):
+    ''' StimulusTable playing waveform into injectMsg of each compartment in comps.
+    Use set_waveform to play another waveform of the bank, e.g. after moose.reinit
+    '''
+    chirper = moose.element('/chirpgen') if moose.exists('/chirpgen') else moose.Neutral('/chirpgen')
+    table = moose.StimulusTable(chirper.path + '/' + gen_name)
+    set_waveform(table, waveform, simdt, start)
+    for comp in comps:
+        moose.connect(table, 'output', comp, 'injectMsg')
+    return table
+
+
+def impedance(vm, current, dt, fmin=None, fmax=None):
+    ''' Impedance amplitude (ohm) and phase (radians) from Vm and injected current, sampled at dt.
+    The last axis is time, so vm can hold many compartments and runs, e.g. (runs, compartments, time),
+    with current broadcastable to it, e.g. (runs, 1, time).  Returns frequencies and the
+    amplitude and phase at each frequency, restricted to fmin...fmax
+    '''
+    vm = np.asarray(vm, dtype=float)
+    current = np.asarray(current, dtype=float)
+    num = vm.shape[-1]
+    freqs = np.fft.rfftfreq(num, dt)
+    keep = (freqs > 0) & (freqs >= (fmin or 0)) & (freqs <= (fmax or np.inf))
+    vfft = np.fft.rfft(vm - vm.mean(axis=-1, keepdims=True), axis=-1)[..., keep]
+    ifft = np.fft.rfft(current - current.mean(axis=-1, keepdims=True), axis=-1)[..., keep]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = vfft / ifft
+    return freqs[keep], np.abs(z), np.angle(z)
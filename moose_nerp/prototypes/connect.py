@@ -1,8 +1,10 @@
 """\
 Function definitions for connecting populations of neurons
 1. single synaptic connection
-2. creating an array of post-synaptic channels, to randomly select without replacement
-3. connect each post-syn channel type of each neuron to either a pre-synaptic neuron or a timetable
+2. distance dependent probability of post-synaptic channels, to randomly select without replacement
+3. spatial connection decisions between populations, used by connect_plan
+4. create the synapses of a connectivity plan: each post-syn channel is connected to either
+   a pre-synaptic neuron or a timetable
 
 """
 
@@ -11,12 +13,23 @@ from __future__ import print_function, division
 import moose
 import numpy as np
 
-from moose_nerp.prototypes import logutil, util
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+from moose_nerp.prototypes import logutil
 from moose_nerp.prototypes import plasticity
+from moose_nerp.prototypes import ttables
 from moose_nerp.prototypes.spines import NAME_HEAD
 
 log = logutil.Logger()
 CONNECT_SEPARATOR = '_to_'
+# pre-synaptic cells further than SPACE_CONST_CUTOFF*space_const are not considered,
+# since their connection probability, exp(-SPACE_CONST_CUTOFF), is below 1e-6
+SPACE_CONST_CUTOFF = 14
+# number of post-synaptic cells per block when computing distances without cKDTree
+DIST_BLOCK_SIZE = 256
 
 
 def plain_synconn(syn, presyn, syn_delay, weight, simdt=None, stp_params=None):
@@ -55,13 +68,58 @@ def synconn(synpath, dist, presyn, syn_params, mindel=1e-3, cond_vel=0.8, simdt=
             plain_synconn(nmda_syn, presyn, syn_delay, weight)
 
 
-def select_entry(table):
-    row = np.random.random_integers(0, len(table) - 1)
-    element = table[row][0]
-    table[row][1] = int(table[row][1]) - 1
-    if table[row][1] == 0:
-        table.pop(row)
-    return element
+def soma_locations(cells, name_soma):
+    # array (num cells x 3) of soma coordinates, with a single moose lookup per cell
+    locations = np.zeros((len(cells), 3))
+    for i, cell in enumerate(cells):
+        soma = moose.element(cell + '/' + name_soma)
+        locations[i] = soma.x, soma.y, soma.z
+    return locations
+
+
+def candidate_pairs(post_locs, pre_locs, max_dist=np.inf):
+    # indices of post- and pre-synaptic cells, and distance between somas, for all pairs within max_dist
+    # pairs are sorted by index of post-synaptic cell
+    if cKDTree is not None and np.isfinite(max_dist):
+        neighbors = cKDTree(pre_locs).query_ball_point(post_locs, max_dist)
+        counts = np.array([len(n) for n in neighbors], dtype=int)
+        post_idx = np.repeat(np.arange(len(post_locs)), counts)
+        pre_idx = np.concatenate([np.sort(n) for n in neighbors] + [np.zeros(0)]).astype(int)
+    else:
+        post_blocks, pre_blocks = [], []
+        for start in range(0, len(post_locs), DIST_BLOCK_SIZE):
+            block = post_locs[start:start + DIST_BLOCK_SIZE]
+            dist = np.linalg.norm(block[:, None, :] - pre_locs[None, :, :], axis=2)
+            post, pre = np.nonzero(dist <= max_dist)
+            post_blocks.append(post + start)
+            pre_blocks.append(pre)
+        post_idx = np.concatenate(post_blocks + [np.zeros(0, dtype=int)])
+        pre_idx = np.concatenate(pre_blocks + [np.zeros(0, dtype=int)])
+    dist = np.linalg.norm(post_locs[post_idx] - pre_locs[pre_idx], axis=1)
+    return post_idx, pre_idx, dist
+
+
+def spatial_connections(post_locs, pre_locs, connection, cutoff=SPACE_CONST_CUTOFF):
+    # Connection decisions for all pre-post cell pairs in one block:
+    # probability is either exp(-dist/space_const) or constant, as in param_net connect
+    # returns post index, pre index, distance and number of connections for each connected pair,
+    # sorted by post-synaptic index
+    if connection.space_const:
+        post_idx, pre_idx, dist = candidate_pairs(post_locs, pre_locs, cutoff * connection.space_const)
+        prob = np.exp(-(dist / connection.space_const))
+    elif connection.probability:
+        post_idx, pre_idx, dist = candidate_pairs(post_locs, pre_locs)
+        prob = connection.probability
+    else:
+        print('need to specify either probability or space constant in param_net for', connection.synapse,
+              connection.pre)
+        empty = np.zeros(0, dtype=int)
+        return empty, empty, np.zeros(0), empty
+    # select a random number for each pair to determine whether a connection should occur
+    connect = (np.random.uniform(size=len(dist)) < prob) & (dist > 0)
+    num_conns = np.maximum(np.random.poisson(connection.num_conns, size=np.count_nonzero(connect)), 1)
+    log.debug('{} candidate pairs, {} connected', len(dist), np.count_nonzero(connect))
+    return post_idx[connect], pre_idx[connect], dist[connect], num_conns
 
 
 def dendritic_distance_dep_connect_prob(prob, dist):
@@ -70,236 +128,132 @@ def dendritic_distance_dep_connect_prob(prob, dist):
     # sigmoid increases to maximum of maxprob (default=1) between mindist and maxdist
     # dist_prob=maxprob*(distance)**steep/(distance**steepp+half_dist**steep)
     # 2. constant probability between mindist and maxdist
+    # dist can be a single distance or an array of distances
     if prob.postsyn_fraction:
         maxprob = prob.postsyn_fraction
     else:
         maxprob = 1
-    # if prob.steep:
+    dist = np.asarray(dist, dtype=float)
+    below = dist < prob.mindist
+    above = dist > prob.maxdist
+    # distance from mindist, clipped to avoid negative numbers raised to a power outside of mindist-maxdist
+    rel_dist = np.maximum(dist - prob.mindist, 0)
     steep = prob.steep
     if steep > 0:
-        if dist < prob.mindist:
-            dist_prob = 0
-        elif dist > prob.maxdist:
-            dist_prob = 1
-        else:
-            dist_prob = maxprob * (dist - prob.mindist) ** steep / (
-                        (dist - prob.mindist) ** steep + prob.half_dist ** steep)
+        sigmoid = maxprob * rel_dist ** steep / (rel_dist ** steep + prob.half_dist ** steep)
+        dist_prob = np.where(below, 0, np.where(above, 1, sigmoid))
     elif steep < 0:
-        if dist < prob.mindist:
-            dist_prob = 1
-        elif dist > prob.maxdist:
-            dist_prob = 0
-        else:
-            dist_prob = maxprob * prob.half_dist ** (-steep) / (
-                        (dist - prob.mindist) ** (-steep) + prob.half_dist ** (-steep))
+        sigmoid = maxprob * prob.half_dist ** (-steep) / (rel_dist ** (-steep) + prob.half_dist ** (-steep))
+        dist_prob = np.where(below, 1, np.where(above, 0, sigmoid))
     else:
-        if dist < prob.mindist or dist > prob.maxdist:
-            dist_prob = 0
-        else:
-            dist_prob = maxprob
-    return dist_prob
+        dist_prob = np.where(below | above, 0, maxprob)
+    if dist_prob.ndim:
+        return dist_prob
+    return float(dist_prob)
 
 
-def create_synpath_array(allsyncomp_list, syntype, NumSyn, prob=None):
-    # list of possible synapses with connection probability, which takes into account prior creation of synapses
-    syncomps = []
-    totalsyns = 0
-    print('CONNECT: syntype:', syntype, 'prob', prob)
-    for syncomp in allsyncomp_list:
-        dist, nm = util.get_dist_name(syncomp.parent)
-        if prob:  # calculate dendritic distance dependent connection probability to store with table
-            dist_prob = dendritic_distance_dep_connect_prob(prob, dist)
+def add_synapses(sh, presyns, delays, weights, simdt=None, stp_params=None):
+    # bulk version of plain_synconn: add one synapse to SynHandler sh for each pre-synaptic element
+    # delay and weight of all new synapses are set with a single assignment to the synapse vector
+    jj = sh.synapse.num
+    sh.synapse.num = jj + len(presyns)
+    for field, values in (('delay', delays), ('weight', weights)):
+        all_values = np.array(getattr(sh.synapse.vec, field), dtype=float)
+        all_values[jj:] = values
+        setattr(sh.synapse.vec, field, all_values)
+    for i, presyn in enumerate(presyns):
+        if presyn.className == 'TimeTable':
+            msg = 'eventOut'
         else:
-            dist_prob = 1
-        # print('syncomp',syncomp,'dist',dist,'prob',dist_prob)
-        if dist_prob > 0:  # only add synchan to list if connection probability is non-zero
-            sh = moose.element(syncomp.path + '/SH')
-            # TODO: Fix for synapses on spines; there should only be 1 per spine
-            if NAME_HEAD in nm:
-                SynPerComp = 1  # - sh.numSynapses
-            else:
-                SynPerComp = util.distance_mapping(NumSyn[syntype], dist)  # -sh.numSynapses
-            for i in range(SynPerComp):
-                totalsyns += dist_prob  # totalsyns=total synapses to connect
-                if i < SynPerComp - sh.numSynapses:
-                    syncomps.append([syncomp.path + '/SH', dist_prob])
-                    # print('{} synapses already connected of {} total synapses, adding 1 synapse with {} dist_prob to list'.format(sh.numSynapses,SynPerComp,dist_prob))
-                else:
-                    syncomps.append([syncomp.path + '/SH', 0])
-                    # print('{} synapses already connected of {} total synapses, adding 1 synapse with 0 dist_prob to list'.format(sh.numSynapses,SynPerComp))
-
-    # normalize probability to pdf
-    syncomp_sum = sum([p[1] for p in syncomps])
-    print('CONNECT: totsyns:', totalsyns, 'syncomp_sum', syncomp_sum)
-    for syn in syncomps:
-        syn[1] = float(syn[1]) / syncomp_sum
-    avail_syns = np.int(np.round(syncomp_sum))
-    return syncomps, totalsyns, avail_syns
+            msg = 'spikeOut'
+        moose.connect(presyn, msg, sh.synapse[jj + i], 'addSpike')
+        if stp_params is not None and stp_params[i] is not None:
+            plasticity.ShortTermPlas(sh.synapse[jj + i], jj + i, stp_params[i], simdt, presyn, msg)
 
 
-def connect_timetable(post_connection, syncomps, totalsyn, netparams, model):
-    dist = 0
+def instantiate_plan(plan, netparams, model):
+    # create the synapses and messages of a connectivity plan from connect_plan.connection_plan
+    # returns dictionary of connections for each post-synaptic neuron type, saved in confile
+    from moose_nerp.prototypes.connect_plan import CONN_KEY_SEPARATOR, merged_edges
+    name_soma = model.param_cond.NAME_SOMA
     syn_params = model.param_syn
     simdt = model.param_sim.simdt
-    # tt_list is list of time tables stored with number of times the time table can be used in the network
-    tt_list = post_connection.pre.stimtab
-    dend_loc = post_connection.dend_loc
-    if getattr(model, 'stpYN', False):
-        stp = post_connection.stp
-    else:
-        stp = None
+    nodes, synapses, num_cells = plan['nodes'], plan['synapses'], int(plan['num_cells'])
+    conns = [key.split(CONN_KEY_SEPARATOR) for key in plan['conns']]
+    stp_params = [netparams.connect_dict[post][syntype][pre].stp for post, syntype, pre in conns]
     connections = {}
-    num_choices = np.int(np.round(totalsyn))
-    if num_choices > 0:
-        # randomly select num_choices of synapses without replacement from the entire set
-        syn_choices = np.random.choice([sc[0] for sc in syncomps], size=num_choices, replace=False,
-                                       p=[sc[1] for sc in syncomps])
-        # randomly select subset of time-tables for spike train input
-        # could do this in one line, but then meaningless error message
-        presyn_tt = []
-        for i, syn in enumerate(syn_choices):
-            if len(tt_list) > 0:
-                presyn_tt.append(select_entry(tt_list))
+    for ntype, cells in plan['pop'].items():
+        if ntype not in netparams.connect_dict:
+            continue
+        connect_list = {pc: {} for pc in cells}
+        postcells = cells[:1] if plan['single'] else cells
+        for postnum, postcell in enumerate(postcells):
+            if not plan['single']:
+                connect_list[postcell]['postsoma_loc'] = tuple(plan['soma_loc'][ntype][postnum])
+            for syntype, syn_connects in netparams.connect_dict[ntype].items():
+                connect_list[postcell][syntype] = {pre: {} for pre in syn_connects.keys() if 'extern' in pre}
+        connections[ntype] = connect_list
+    # one moose lookup per pre-synaptic element: spikegen of neurons, or time table
+    # neurons simulated by another process (shard.Shard.local_plan) are replaced by proxy time tables
+    proxies = plan.get('proxies', {})
+    presyn_elements = {}
+    def presyn_element(pre):
+        if pre not in presyn_elements:
+            if pre in proxies:
+                presyn_elements[pre] = moose.element(proxies[pre])
+            elif pre < num_cells:
+                presyn_elements[pre] = moose.wildcardFind(nodes[pre] + '/' + name_soma + '/#[TYPE=SpikeGen]')[0]
             else:
-                print('table empty', i, syn, tt_list)
-        # presyn_tt=[select_entry(tt_list) for syn in syn_choices]
-        print('## connect from tt', post_connection.pre.tablename, ', number of connections', len(presyn_tt))
-    else:
-        syn_choices = [];
-        presyn_tt = []
-        print('&& no connectons from time tables', post_connection.pre.tablename)
-    # connect the time-table to the synapse with mindelay (set dist=0)
-    for tt, syn in zip(presyn_tt, syn_choices):
-        postbranch = util.syn_name(moose.element(syn).parent.path, NAME_HEAD)
-        log.debug('CONNECT: TT {} POST {}', tt.path, syn)
-        synconn(syn, dist, tt, syn_params, netparams.mindelay, simdt=simdt, stp=stp, weight=post_connection.weight)
-        # save the connection in a dictionary for inspection later
-        connections[postbranch] = tt.path
+                # time tables are created when first connected
+                presyn_elements[pre] = ttables.TableSet.find_timetable(nodes[pre])
+        return presyn_elements[pre]
+    # extern trains of ext_connect entries with aggregate=True are merged into one time table per synchan
+    # (more only if several spikes fall in the same time step)
+    merged, merge_id = merged_edges(plan, netparams)
+    merged_tables = {}
+    # group edges by post-synaptic synchan, so that each SynHandler is resized only once
+    order = np.lexsort((plan['edges']['syn'], plan['edges']['post']))
+    edges, merge_id = plan['edges'][order], merge_id[order]
+    group_key = edges['post'].astype(np.int64) * max(len(synapses), 1) + edges['syn']
+    bounds = np.flatnonzero(np.diff(group_key)) + 1
+    for group, group_merge in zip(np.split(edges, bounds), np.split(merge_id, bounds)):
+        if not len(group):
+            continue
+        postcell = nodes[group['post'][0]]
+        synchan = moose.element(postcell + '/' + synapses[group['syn'][0]])
+        single_edges = group[group_merge < 0]
+        presyns = [presyn_element(pre) for pre in single_edges['pre']]
+        stp = [stp_params[s] if s >= 0 else None for s in single_edges['stp']]
+        merge_nums, first = np.unique(group_merge[group_merge >= 0], return_index=True)
+        delays, weights = [single_edges['delay']], [single_edges['weight']]
+        for num, edge in zip(merge_nums, group[group_merge >= 0][first]):
+            tables = ttables.TableSet.merged_timetables([nodes[pre] for pre in group['pre'][group_merge == num]],
+                                                        'merged_TimTab{}'.format(num), simdt)
+            merged_tables[num] = tables[0]
+            presyns.extend(tables)
+            stp.extend([None] * len(tables))
+            delays.append(np.repeat(edge['delay'], len(tables)))
+            weights.append(np.repeat(edge['weight'], len(tables)))
+        delays, weights = np.concatenate(delays), np.concatenate(weights)
+        log.debug('CONNECT: {} synapses to {}', len(presyns), synchan.path)
+        add_synapses(moose.element(synchan.path + '/SH'), presyns, delays, weights, simdt, stp)
+        if synchan.name == syn_params.NAME_AMPA:
+            nmda_synpath = synchan.parent.path + '/' + syn_params.NAME_NMDA + '/SH'
+            if moose.exists(nmda_synpath):
+                # probably should add stp for NMDA.  When including desensitization, will be different
+                add_synapses(moose.element(nmda_synpath), presyns, delays, weights)
+        # save the connections in a dictionary for inspection later
+        branch = synapses[group['syn'][0]].split('/')[:-1]
+        postbranch = '/'.join(branch[-2:]) if NAME_HEAD in branch[-1] else branch[-1]
+        for edge, num in zip(group, group_merge):
+            ntype, syntype, pretype = conns[edge['conn']]
+            syn_connections = connections[ntype][postcell][syntype]
+            if num >= 0:
+                syn_connections[pretype][postbranch] = merged_tables[num].path
+            elif edge['pre'] >= num_cells:
+                syn_connections[pretype][postbranch] = nodes[edge['pre']]
+            else:
+                precell = nodes[edge['pre']].split('/')[-1]
+                syn_connections[precell + CONNECT_SEPARATOR + postbranch] = {
+                    'presoma_loc': tuple(plan['node_loc'][edge['pre']]), 'dist': np.round(edge['dist'], 6)}
     return connections
-
-
-def timetable_input(cells, netparams, postype, model):
-    # connect post-synaptic synapses to time tables
-    # used for single neuron models only, since populations are connected in connect_neurons
-    log.info('CONNECT set: {} {} {}', postype, cells[postype], netparams.connect_dict[postype])
-    post_connections = netparams.connect_dict[postype]
-    connect_list = {pc: {} for pc in cells[postype]}
-    postcell = cells[postype][0]
-    for syntype in post_connections.keys():
-        connect_list[postcell][syntype] = {}
-        for pretype in post_connections[syntype].keys():
-            dend_prob = post_connections[syntype][pretype].dend_loc
-            print('################', postcell, 'synchan:', syntype, 'pretype:', pretype)
-            allsyncomp_list = moose.wildcardFind(postcell + '/##/' + syntype + '[ISA=SynChan]')
-            print('CREATE_SYNPATH_ARRAY from timetable_input, pre=', pretype)
-            syncomps, totalsyn, availsyn = create_synpath_array(allsyncomp_list, syntype, model.param_syn.NumSyn,
-                                                                prob=dend_prob)
-            log.info('SYN TABLE for {} {} has {} compartments to make {} synapses', postcell, syntype, len(syncomps),
-                     totalsyn)
-            if 'extern' in pretype:
-                print('## connect to tt', postcell, syntype, pretype)
-                connect_list[postcell][syntype][pretype] = connect_timetable(post_connections[syntype][pretype],
-                                                                             syncomps, totalsyn, netparams, model)
-    return connect_list
-
-
-def connect_neurons(cells, netparams, postype, model):
-    log.info('CONNECT set: {} {} {}', postype, cells[postype], netparams.connect_dict[postype])
-    post_connections = netparams.connect_dict[postype]
-    connect_list = {pc: {} for pc in cells[postype]}
-    intra_conns = {key: [] for key in
-                   post_connections.keys()}  # accumulate number of connections of each type to calculate mean
-    # loop over post-synaptic neurons - convert to list if only singe instance of any type
-    if not isinstance(cells[postype], list):
-        temp = cells[postype]
-        cells[postype] = list([temp])
-    for postcell in cells[postype]:
-        postsoma = postcell + '/' + model.param_cond.NAME_SOMA
-        xpost = moose.element(postsoma).x
-        ypost = moose.element(postsoma).y
-        zpost = moose.element(postsoma).z
-        connect_list[postcell]['postsoma_loc'] = (xpost, ypost, zpost)
-        # set-up array of post-synapse compartments/synchans
-        for syntype in post_connections.keys():
-            connect_list[postcell][syntype] = {}
-            # make a table of possible post-synaptic connections
-            for pretype in post_connections[syntype].keys():
-                dend_prob = post_connections[syntype][pretype].dend_loc
-                allsyncomp_list = moose.wildcardFind(postcell + '/##/' + syntype + '[ISA=SynChan]')
-                print('CREATE_SYNPATH_ARRAY from connect_neurons, pre=', pretype)
-                syncomps, totalsyn, availsyns = create_synpath_array(allsyncomp_list, syntype, model.param_syn.NumSyn,
-                                                                     prob=dend_prob)
-                log.info('SYN TABLE for {} {} {} has {} compartments and {} synapses', postsoma, syntype, pretype,
-                         len(syncomps), totalsyn)
-                if 'extern' in pretype:
-                    print('## connect to tt', postcell, syntype, pretype)
-                    ####### connect to time tables instead of other neurons in network
-                    connect_list[postcell][syntype][pretype] = connect_timetable(post_connections[syntype][pretype],
-                                                                                 syncomps, totalsyn, netparams, model)
-                    intra_conns[syntype].append(len(connect_list[postcell][syntype][pretype]))
-                else:
-                    if getattr(model, 'stpYN', False):
-                        stp = post_connections[syntype][pretype].stp
-                    else:
-                        stp = None
-                    spikegen_conns = []
-                    fact = 1;
-                    prob = 0
-                    ###### connect to other neurons in network: loop over pre-synaptic neurons
-                    for precell in cells[pretype]:
-                        presoma = precell + '/' + model.param_cond.NAME_SOMA
-                        xpre = moose.element(presoma).x
-                        ypre = moose.element(presoma).y
-                        zpre = moose.element(presoma).z
-                        dist = np.sqrt((xpre - xpost) ** 2 + (ypre - ypost) ** 2 + (zpre - zpost) ** 2)
-                        if post_connections[syntype][pretype].space_const:
-                            fact = post_connections[syntype][pretype].space_const
-                            # calculate distance between pre- and post-soma
-                            prob = np.exp(-(dist / fact))
-                        elif post_connections[syntype][pretype].probability:
-                            prob = post_connections[syntype][pretype].probability
-                        else:
-                            print('need to specify either probability or space constant in param_net for', syntype,
-                                  pretype)
-                        connect = np.random.uniform()
-                        log.debug('{} {} {} {} {} {}', presoma, postsoma, dist, fact, prob, connect)
-                        # select a random number to determine whether a connection should occur
-                        if connect < prob and dist > 0:
-                            spikegen_conns.append(
-                                [moose.wildcardFind(presoma + '/#[TYPE=SpikeGen]')[0], (xpre, ypre, zpre), dist])
-                    if len(spikegen_conns):
-                        num_conn = [max(np.random.poisson(post_connections[syntype][pretype].num_conns), 1) for n in
-                                    spikegen_conns]
-                        print('&& connect to neuron', postcell, syntype, 'from', pretype, 'num conns', num_conn)
-                        intra_conns[syntype].append(np.sum(num_conn))
-                        # duplicate spikegens in list to match the length of the list syn_choices to be generated
-                        for i in range(len(num_conn) - 1, -1, -1):
-                            for n in range(num_conn[i] - 1):
-                                spikegen_conns.insert(i, spikegen_conns[i])
-                        num_choices = min(len(spikegen_conns), availsyns)
-                        if len(spikegen_conns) > availsyns:
-                            print('>>>> uh oh, too few synapses on post-synaptic cell')
-                        # randomly select num_choices of synapses
-                        if availsyns == 0:
-                            print('>>>>>>>>>>> uh oh, no available synapses on post-synaptic cell')
-                            syn_choices = []
-                        else:
-                            syn_choices = np.random.choice([sc[0] for sc in syncomps], size=num_choices, replace=False,
-                                                           p=[sc[1] for sc in syncomps])
-                        log.debug('CONNECT: PRE {} POST {} ', spikegen_conns, syn_choices)
-                        # connect the pre-synaptic spikegens to randomly chosen synapses
-                        for i, syn in enumerate(syn_choices):
-                            postbranch = util.syn_name(moose.element(syn).parent.path, NAME_HEAD)
-                            precell = spikegen_conns[i][0].parent.path.split('/')[2].split('[')[0]
-                            connect_list[postcell][syntype][precell + CONNECT_SEPARATOR + postbranch] = {
-                                'presoma_loc': spikegen_conns[i][1], 'dist': np.round(spikegen_conns[i][2], 6)}
-                            log.debug('{}', connect_list[postcell][syntype])
-                            # connect the synapse
-                            # print('** intrinsic synconn',i,syn,spikegen_conns[i][2],spikegen_conns[i][0].path)
-                            synconn(syn, spikegen_conns[i][2], spikegen_conns[i][0], model.param_syn,
-                                    netparams.mindelay, netparams.cond_vel, stp_params=stp)
-                    else:
-                        print('   no pre-synaptic cells selected for', postcell, 'from', pretype)
-    tmp = [np.mean(intra_conns[syn]) / len(cells[postype]) for syn in intra_conns.keys()]
-    print('mean number of intra-network connections', intra_conns, tmp)
-    return connect_list
@@ -0,0 +1,432 @@
+"""\
+Connectivity plan: decide every synaptic connection of a network (or of single neurons
+receiving time table input) using NumPy arrays, without creating any moose objects.
+connect.instantiate_plan creates the synapses and messages specified by the plan.
+
+The plan is a dictionary:
+   pop, location, soma_loc: the population, as from pop_funcs.population_plan
+   nodes: paths of pre- and post-synaptic elements; first num_cells neurons, then time tables
+   node_loc: soma location of the num_cells neurons
+   synapses: synchan paths relative to the post-synaptic neuron, e.g. 570_3/sp0head/ampa
+   conns: 'post/syntype/pretype' key of each connection in netparams.connect_dict
+   edges: one row per synapse, fields given by EDGE_DTYPE
+   single: True if the post-synaptic neurons are the neuron prototypes
+
+Plans can be cached on disk (cached_network_plan), keyed by a fingerprint of the network
+parameters and the random seed, so that trials and worker processes reuse the same plan.
+"""
+from __future__ import print_function, division
+import os
+import re
+import time
+import hashlib
+import tempfile
+import numpy as np
+import numpy.lib.recfunctions
+import moose
+
+from moose_nerp.prototypes import (connect,
+                                   pop_funcs,
+                                   ttables,
+                                   util,
+                                   logutil)
+from moose_nerp.prototypes.spines import NAME_HEAD
+log = logutil.Logger()
+
+CONN_KEY_SEPARATOR = '/'
+#change PLAN_VERSION when the plan format or algorithm changes, to invalidate cached plans
+PLAN_VERSION = 1
+#maximum time (sec) to wait for another process computing the same plan
+PLAN_LOCK_TIMEOUT = 600
+
+EDGE_DTYPE = np.dtype([('pre', np.int32),      # index into nodes: neuron (spikegen) or time table
+                       ('post', np.int32),     # index into nodes: post-synaptic neuron
+                       ('syn', np.int32),      # index into synapses
+                       ('conn', np.int16),     # index into conns
+                       ('stp', np.int16),      # index into conns of short term plasticity params, -1 for none
+                       ('delay', np.float64),
+                       ('weight', np.float64),
+                       ('dist', np.float64)])  # distance between pre and post soma, 0 for time tables
+
+def relative_path(element, neuron):
+    #path of element relative to neuron, without the [0] indices
+    return re.sub(r'\[0\]', '', element.path[len(neuron.path) + 1:])
+
+#synapse candidate tables of neuron prototypes, shared by all copies of each prototype
+#keys: (prototype path, syntype, NumSyn spec) for tables, (table key, dend_loc spec) for entries
+_synapse_tables = {}
+_synapse_entries = {}
+
+def clear_synapse_tables():
+    #call when neuron prototypes are (re)created
+    _synapse_tables.clear()
+    _synapse_entries.clear()
+
+def synapse_table(neur_proto, syntype, NumSyn):
+    #all synchans of syntype in the neuron prototype: path, number of synapses and distance from soma
+    key = (neur_proto.path, syntype, _canonical(NumSyn[syntype]))
+    if key in _synapse_tables:
+        return _synapse_tables[key]
+    synchans = moose.wildcardFind(neur_proto.path + '/##/' + syntype + '[ISA=SynChan]')
+    paths = [relative_path(syncomp, neur_proto) for syncomp in synchans]
+    dist, names = util.locations([syncomp.parent for syncomp in synchans])
+    #NumSyn is a mapping of distance only; spine heads have one synapse
+    syn_per_comp = util.DistanceMap(NumSyn[syntype]).evaluate(dist)
+    syn_per_comp[[NAME_HEAD in nm for nm in names]] = 1
+    _synapse_tables[key] = {'key': key,
+                            'synapses': np.array(paths, dtype=str),
+                            'syn_per_comp': syn_per_comp.astype(int),
+                            'dist': dist}
+    log.debug('PLAN: synapse table {} {} with {} synchans', neur_proto.path, syntype, len(paths))
+    return _synapse_tables[key]
+
+def synapse_entries(table, prob=None):
+    #one entry per potential synapse: index of synchan, rank among synapses of that synchan,
+    #and dendritic distance dependent connection probability
+    key = (table['key'], _canonical(prob))
+    if key in _synapse_entries:
+        return _synapse_entries[key]
+    syn_per_comp = table['syn_per_comp']
+    syn = np.repeat(np.arange(len(syn_per_comp)), syn_per_comp)
+    rank = np.arange(len(syn)) - np.repeat(np.cumsum(syn_per_comp) - syn_per_comp, syn_per_comp)
+    if prob:
+        dist_prob = connect.dendritic_distance_dep_connect_prob(prob, table['dist'])
+    else:
+        dist_prob = np.ones(len(syn_per_comp))
+    _synapse_entries[key] = (syn, rank, dist_prob[syn])
+    return _synapse_entries[key]
+
+def available_prob(entries, syn_per_comp, used):
+    #probability of entries, excluding synapses already used
+    syn, rank, prob = entries
+    return np.where(rank < syn_per_comp[syn] - used[syn], prob, 0)
+
+def choose_synapses(entries, syn_per_comp, used, num_choices):
+    #randomly select num_choices synchans (with multiplicity) without replacement of the available synapses
+    avail = available_prob(entries, syn_per_comp, used)
+    num_avail = np.count_nonzero(avail)
+    if num_choices > num_avail:
+        print('>>>> uh oh, too few synapses on post-synaptic cell', num_choices, num_avail)
+        num_choices = num_avail
+    if num_choices == 0:
+        return np.zeros(0, dtype=int)
+    choice = np.random.choice(len(avail), size=num_choices, replace=False, p=avail / avail.sum())
+    return entries[0][choice]
+
+def train_pool(numtt, syn_per_tt):
+    #multiset of trains, each repeated syn_per_tt times, in random order
+    #consecutive blocks are drawn without replacement, so no train is used more than syn_per_tt times
+    return {'trains': np.random.permutation(np.repeat(np.arange(numtt), syn_per_tt)), 'next': 0}
+
+def allocate_trains(pool, num, tablename=''):
+    #next block of num trains from the pool; fewer if the pool is exhausted
+    start = pool['next']
+    trains = pool['trains'][start:start + num]
+    pool['next'] = start + len(trains)
+    if len(trains) < num and len(trains):
+        #only reported once per pool, since the shortage was reported by report_train_demand
+        print('table empty', tablename, len(trains), 'of', num, 'trains selected')
+    return trains
+
+def report_train_demand(demand, pools):
+    #compare trains needed by all extern connections with trains available, before allocating any
+    for tablename, needed in demand.items():
+        available = len(pools[tablename]['trains'])
+        log.info('PLAN: time tables {}: {} synapses, {} available', tablename, needed, available)
+        if needed > available:
+            log.warning('PLAN: too few time tables {}: about {} synapses will not be connected', tablename,
+                        needed - available)
+
+def make_edges(pre, post, syn, conn, stp, delay, weight, dist):
+    edges = np.zeros(len(pre), dtype=EDGE_DTYPE)
+    edges['pre'] = pre
+    edges['post'] = post
+    edges['syn'] = syn
+    edges['conn'] = conn
+    edges['stp'] = stp
+    edges['delay'] = delay
+    edges['weight'] = weight
+    edges['dist'] = dist
+    return edges
+
+#edges with equal values of these fields are merged into one synapse by merged_edges
+MERGE_FIELDS = ['post', 'syn', 'conn', 'delay', 'weight']
+
+def merged_edges(plan, netparams):
+    #edges from time tables of ext_connect entries with aggregate=True, without short term plasticity:
+    #trains to one synchan with the same connection, delay and weight are merged (superposed) into one
+    #time table and one synapse by connect.instantiate_plan
+    #returns mask of merged edges, and number of the merged time table of each edge (-1 if not merged)
+    conns = [key.split(CONN_KEY_SEPARATOR) for key in plan['conns']]
+    aggregate = np.array([bool(getattr(netparams.connect_dict[post][syntype][pre], 'aggregate', False))
+                          for post, syntype, pre in conns], dtype=bool)
+    edges = plan['edges']
+    merge_id = np.full(len(edges), -1, dtype=np.int64)
+    if not np.any(aggregate):
+        return merge_id >= 0, merge_id
+    mask = (edges['pre'] >= plan['num_cells']) & (edges['stp'] < 0) & aggregate[edges['conn']]
+    if np.any(mask):
+        keys = np.lib.recfunctions.repack_fields(edges[mask][MERGE_FIELDS])
+        merge_id[mask] = np.unique(keys, return_inverse=True)[1].ravel()
+        #a single train is not merged, its time table may be shared with other synapses
+        mask[mask] = np.bincount(merge_id[mask])[merge_id[mask]] > 1
+        merge_id[~mask] = -1
+        merge_id[mask] = np.unique(merge_id[mask], return_inverse=True)[1].ravel()
+    return mask, merge_id
+
+def connection_plan(model, netparams, population, single=False):
+    #population: dictionary with 'pop' (list of neuron paths for each type) and, unless single, soma_loc
+    #if single, post-synaptic neurons are neuron prototypes, and only time tables are connected
+    pop = population['pop']
+    connect_dict = netparams.connect_dict
+    posttypes = [ntype for ntype in pop.keys() if ntype in connect_dict]
+    #nodes: neurons of all types, followed by the time tables of all extern connections
+    nodes = [cell for ntype in pop.keys() for cell in pop[ntype]]
+    node_id = {}
+    offset = 0
+    for ntype in pop.keys():
+        node_id[ntype] = offset + np.arange(len(pop[ntype]))
+        offset += len(pop[ntype])
+    num_cells = len(nodes)
+    tt_offset = {}
+    tt_pools = {}
+    for ntype in posttypes:
+        for syn_connects in connect_dict[ntype].values():
+            for pretype, conn in syn_connects.items():
+                if 'extern' in pretype and conn.pre.tablename not in tt_offset:
+                    numtt = conn.pre.num_trains()
+                    tt_offset[conn.pre.tablename] = len(nodes)
+                    tt_pools[conn.pre.tablename] = train_pool(numtt, conn.pre.syn_per_tt)
+                    nodes.extend(conn.pre.table_path(ii) for ii in range(numtt))
+    #expected number of synapses per time table set, from the synapse candidate tables
+    demand = {tablename: 0 for tablename in tt_offset}
+    for ntype in posttypes:
+        for syntype, syn_connects in connect_dict[ntype].items():
+            table = synapse_table(moose.element(ntype), syntype, model.param_syn.NumSyn)
+            for pretype, conn in syn_connects.items():
+                if 'extern' in pretype:
+                    totalsyn = np.sum(synapse_entries(table, conn.dend_loc)[2])
+                    demand[conn.pre.tablename] += int(np.round(totalsyn)) * (1 if single else len(pop[ntype]))
+    report_train_demand(demand, tt_pools)
+    synapses, conns, edges = [], [], []
+    for ntype in posttypes:
+        neur_proto = moose.element(ntype)
+        postcells = node_id[ntype][:1] if single else node_id[ntype]
+        for syntype, syn_connects in connect_dict[ntype].items():
+            table = synapse_table(neur_proto, syntype, model.param_syn.NumSyn)
+            syn_offset = len(synapses)
+            synapses.extend(table['synapses'])
+            #number of synapses of each synchan already used, for each post-synaptic neuron
+            used = np.zeros((len(postcells), len(table['synapses'])), dtype=int)
+            for pretype, conn in syn_connects.items():
+                extern = 'extern' in pretype
+                if not extern and (single or pretype not in pop):
+                    print('   no pre-synaptic population', pretype, 'for', ntype, syntype)
+                    continue
+                conn_num = len(conns)
+                conns.append(CONN_KEY_SEPARATOR.join([ntype, syntype, pretype]))
+                stp = conn_num if getattr(model, 'stpYN', False) and conn.stp is not None else -1
+                #only extern connections carry a weight; connections between neurons have weight 1
+                weight = getattr(conn, 'weight', 1) if extern else 1
+                entries = synapse_entries(table, conn.dend_loc)
+                totalsyn = np.sum(entries[2])
+                num_conns = []
+                if extern:
+                    for ii, post in enumerate(postcells):
+                        syn = choose_synapses(entries, table['syn_per_comp'], used[ii], int(np.round(totalsyn)))
+                        trains = allocate_trains(tt_pools[conn.pre.tablename], len(syn), conn.pre.tablename)
+                        syn = syn[:len(trains)]
+                        np.add.at(used[ii], syn, 1)
+                        num_conns.append(len(syn))
+                        edges.append(make_edges(tt_offset[conn.pre.tablename] + trains, post, syn + syn_offset,
+                                                conn_num, stp, netparams.mindelay, weight, 0))
+                else:
+                    post_idx, pre_idx, dist, pre_conns = connect.spatial_connections(population['soma_loc'][ntype],
+                                                                                     population['soma_loc'][pretype],
+                                                                                     conn)
+                    bounds = np.searchsorted(post_idx, np.arange(len(postcells) + 1))
+                    for ii, post in enumerate(postcells):
+                        block = slice(bounds[ii], bounds[ii + 1])
+                        #duplicate pre-synaptic cells to match the number of connections
+                        conn_pre = np.repeat(pre_idx[block], pre_conns[block])
+                        conn_dist = np.repeat(dist[block], pre_conns[block])
+                        avail_syns = int(np.round(np.sum(available_prob(entries, table['syn_per_comp'], used[ii]))))
+                        syn = choose_synapses(entries, table['syn_per_comp'], used[ii], min(len(conn_pre), avail_syns))
+                        conn_pre, conn_dist = conn_pre[:len(syn)], conn_dist[:len(syn)]
+                        np.add.at(used[ii], syn, 1)
+                        num_conns.append(len(syn))
+                        delay = np.maximum(netparams.mindelay,
+                                           np.random.normal(netparams.mindelay + conn_dist / netparams.cond_vel,
+                                                            netparams.mindelay))
+                        edges.append(make_edges(node_id[pretype][conn_pre], post, syn + syn_offset,
+                                                conn_num, stp, delay, weight, conn_dist))
+                log.info('PLAN: {} {} from {}: mean {} connections per neuron', ntype, syntype, pretype,
+                         np.mean(num_conns))
+    if not single:
+        node_loc = np.concatenate([population['soma_loc'][ntype] for ntype in pop.keys()] + [np.zeros((0, 3))])
+    else:
+        node_loc = np.zeros((num_cells, 3))
+    plan = dict(population)
+    plan.update(nodes=np.array(nodes, dtype=str),
+                num_cells=num_cells,
+                node_loc=node_loc,
+                synapses=np.array(synapses, dtype=str),
+                conns=np.array(conns, dtype=str),
+                edges=np.concatenate(edges) if len(edges) else np.zeros(0, dtype=EDGE_DTYPE),
+                single=single)
+    return plan
+
+def network_plan(model, netparams, neur_protos={}):
+    #population and connections specified by netparams, without creating any moose objects
+    if netparams.single:
+        #network is equal to the list of neuron prototypes:
+        population = {'pop': {ntype: [neur_protos[ntype].path] for ntype in neur_protos.keys()},
+                      'location': {}}
+    else:
+        population = pop_funcs.population_plan(netparams)
+    plan = connection_plan(model, netparams, population, single=netparams.single)
+    log.info('PLAN: {} neurons, {} time tables, {} synapses', plan['num_cells'],
+             len(plan['nodes']) - plan['num_cells'], len(plan['edges']))
+    return plan
+
+def _canonical(obj):
+    #text representation of parameters, independent of dict order and of memory addresses
+    if isinstance(obj, dict):
+        return '{' + ', '.join(sorted('{}: {}'.format(_canonical(k), _canonical(v)) for k, v in obj.items())) + '}'
+    if isinstance(obj, (list, tuple)):
+        return type(obj).__name__ + '(' + ', '.join(_canonical(v) for v in obj) + ')'
+    if isinstance(obj, np.ndarray):
+        return _canonical(obj.tolist())
+    if isinstance(obj, ttables.TableSet):
+        #a modified spike train file changes the number of trains; generated trains have no file
+        fname = obj.filename + '.npz' if isinstance(obj.filename, str) else None
+        stat = (os.path.getsize(fname), os.path.getmtime(fname)) if fname and os.path.exists(fname) else None
+        return 'TableSet' + _canonical([obj.tablename, obj.filename, obj.syn_per_tt, stat])
+    if hasattr(obj, '__code__'):
+        return obj.__code__.co_code.hex() + _canonical(obj.__code__.co_consts)
+    return repr(obj)
+
+def synapse_tables_key(model, netparams):
+    #synapse candidate tables of the post-synaptic prototypes that exist, which change with the
+    #morphology, spines and synapse parameters
+    tables = []
+    for ntype in sorted(netparams.connect_dict.keys()):
+        if moose.exists(ntype):
+            for syntype in sorted(netparams.connect_dict[ntype].keys()):
+                table = synapse_table(moose.element(ntype), syntype, model.param_syn.NumSyn)
+                tables.append([ntype, syntype, table['synapses'], table['syn_per_comp'], table['dist']])
+    return tables
+
+def plan_fingerprint(model, netparams, neur_protos={}, seed=None):
+    #hash of all parameters that determine the plan
+    params = {'version': PLAN_VERSION,
+              'seed': seed,
+              'single': netparams.single,
+              'netname': netparams.netname,
+              'connect_dict': netparams.connect_dict,
+              'pop_dict': netparams.pop_dict,
+              'prototypes': sorted(ntype for ntype in netparams.pop_dict.keys() if moose.exists(ntype)),
+              'neur_protos': sorted(proto.path for proto in neur_protos.values()),
+              'grid': netparams.grid,
+              'chanvar': netparams.chanvar,
+              'mindelay': netparams.mindelay,
+              'cond_vel': netparams.cond_vel,
+              'NumSyn': model.param_syn.NumSyn,
+              'stpYN': getattr(model, 'stpYN', False),
+              'spineYN': getattr(model, 'spineYN', False),
+              'SpineParams': getattr(model, 'SpineParams', None),
+              'SYNAPSE_TYPES': getattr(model, 'SYNAPSE_TYPES', None),
+              'morph_file': getattr(model.param_cond, 'morph_file', None),
+              'synapse_tables': synapse_tables_key(model, netparams)}
+    return hashlib.sha1(_canonical(params).encode('utf-8')).hexdigest()
+
+def save_plan(plan, filename):
+    #save plan in npz format without pickled objects; written to a temporary file and then
+    #renamed, so that other processes never read a partially written plan
+    arrays = {key: plan[key] for key in ('nodes', 'node_loc', 'synapses', 'conns', 'edges')}
+    arrays.update(num_cells=plan['num_cells'], single=plan['single'],
+                  pop_types=np.array(list(plan['pop'].keys()), dtype=str))
+    for ntype, cells in plan['pop'].items():
+        arrays['pop/' + ntype] = np.array(cells, dtype=str)
+        if 'soma_loc' in plan:
+            arrays['soma_loc/' + ntype] = plan['soma_loc'][ntype]
+    if not plan['single']:
+        arrays['location_names'] = np.array([loc[0] for loc in plan['location']], dtype=str)
+        arrays['location_xyz'] = np.reshape([loc[1:] for loc in plan['location']], (-1, 3))
+    if 'rng_state' in plan:
+        name, keys, pos, has_gauss, cached_gaussian = plan['rng_state']
+        arrays.update(rng_keys=keys, rng_pos=pos, rng_gauss=[has_gauss, cached_gaussian])
+    fd, tmpname = tempfile.mkstemp(suffix='.npz', dir=os.path.dirname(os.path.abspath(filename)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmpname, filename)
+    except BaseException:
+        os.remove(tmpname)
+        raise
+
+def load_plan(filename):
+    data = np.load(filename)
+    plan = {key: data[key] for key in ('nodes', 'node_loc', 'synapses', 'conns', 'edges')}
+    plan['num_cells'] = int(data['num_cells'])
+    plan['single'] = bool(data['single'])
+    plan['pop'] = {ntype: list(data['pop/' + ntype]) for ntype in data['pop_types']}
+    if plan['single']:
+        plan['location'] = {}
+    else:
+        plan['soma_loc'] = {ntype: data['soma_loc/' + ntype] for ntype in data['pop_types']}
+        plan['location'] = [[name] + list(xyz) for name, xyz in zip(data['location_names'], data['location_xyz'])]
+    if 'rng_keys' in data.files:
+        has_gauss, cached_gaussian = data['rng_gauss']
+        plan['rng_state'] = ('MT19937', data['rng_keys'], int(data['rng_pos']), int(has_gauss), float(cached_gaussian))
+    return plan
+
+def _remove(filename):
+    #remove filename, if another process has not removed it already
+    try:
+        os.remove(filename)
+    except FileNotFoundError:
+        pass
+
+def cached_network_plan(model, netparams, neur_protos={}, seed=None, cache_dir=None, invalidate=False):
+    #network_plan, reseeding the random number generator if seed is given
+    #if seed and cache_dir are given, the plan is saved in cache_dir, and reused when parameters and seed are identical
+    #cache_dir can be shared by worker processes: only one process computes a plan, others wait for it
+    #invalidate=True discards the cached plan for these parameters and computes a new one
+    if seed is not None:
+        np.random.seed(seed)
+    if cache_dir is None or seed is None:
+        if cache_dir is not None:
+            print('plan not cached: cache requires a seed')
+        return network_plan(model, netparams, neur_protos)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    fname = os.path.join(cache_dir, 'plan_' + plan_fingerprint(model, netparams, neur_protos, seed) + '.npz')
+    if invalidate:
+        _remove(fname)
+    lockname = fname + '.lock'
+    start = time.time()
+    while not os.path.exists(fname):
+        try:
+            os.close(os.open(lockname, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except OSError:
+            #another process is computing this plan
+            if time.time() - start < PLAN_LOCK_TIMEOUT:
+                time.sleep(0.5)
+                continue
+            log.warning('PLAN: timeout waiting for {}, computing plan', lockname)
+            _remove(lockname)
+            continue
+        try:
+            plan = network_plan(model, netparams, neur_protos)
+            plan['rng_state'] = np.random.get_state()
+            save_plan(plan, fname)
+        finally:
+            _remove(lockname)
+        log.info('PLAN: saved {}', fname)
+        return plan
+    plan = load_plan(fname)
+    #random numbers drawn after the plan, e.g. channel variability, are identical to those of an uncached plan
+    np.random.set_state(plan['rng_state'])
+    log.info('PLAN: loaded {}', fname)
+    return plan
@@ -1,6 +1,7 @@
 """\
-Sets up time tables, creates population
-connects time tables to neurons
+Plans the population and all connections (connect_plan), then
+creates population
+connects time tables to neurons, creating only the time tables used
 connects neurons to each other
 """
 from __future__ import print_function, division
@@ -9,46 +10,59 @@ import moose
 
 from moose_nerp.prototypes import (pop_funcs,
                                    connect,
+                                   connect_plan,
+                                   edge_io,
                                    check_connect,
+                                   capacity,
                                    plasticity,
-                                   ttables,
                                    logutil)
 log = logutil.Logger()
 
-def create_network(model, param_net,neur_protos={}):
-    #create all timetables
-    ttables.TableSet.create_all()
-    connections={}
+def create_network(model, param_net,neur_protos={},dry_run=False,seed=None,plan_cache=None,invalidate=False,shard=None,plan=None):
+    #decide population and all connections, without creating any moose objects
+    #if seed and plan_cache (directory) are given (or defined in param_net), the plan is cached and reused
+    #if shard (from shard.run_sharded) is given, only the cells of the shard are created
+    #if plan is given (e.g. edge_io.read_plan), the network is rebuilt from it
+    if seed is None:
+        seed=getattr(param_net,'seed',None)
+    if plan_cache is None:
+        plan_cache=getattr(param_net,'plan_cache',None)
+    if shard is not None:
+        plan=shard.local_plan(param_net)
+    elif plan is None:
+        plan=connect_plan.cached_network_plan(model, param_net, neur_protos, seed, plan_cache, invalidate)
+    suffix='' if shard is None else '_shard{}'.format(shard.index)
+    if dry_run:
+        return plan
+    #refuse to build a network that will not fit in memory
+    capacity.check_capacity(capacity.estimate_network(model, param_net, neur_protos, plan))
+    network_pop={'pop':plan['pop'],'location':plan['location']}
     #
     if param_net.single:
-        network_pop={'pop':{},'location':{}}
-        #network is equal to the list of neuron prototypes:
-        for ntype in neur_protos.keys():
-            network_pop['pop'][ntype]=list([neur_protos[ntype].path])
         #subset of check_param_net
-        num_postsyn,num_postcells,allsyncomp_list=check_connect.count_postsyn(param_net,model.param_syn.NumSyn,network_pop['pop'])
+        num_postsyn,num_postcells,syn_tables=check_connect.count_postsyn(param_net,model.param_syn.NumSyn,network_pop['pop'])
         print("num synapses {} cells {}".format(num_postsyn, num_postcells))
-        tt_per_syn,tt_per_ttfile=check_connect.count_total_tt(param_net,num_postsyn,num_postcells,allsyncomp_list,model.param_syn.NumSyn)
+        tt_per_syn,tt_per_ttfile=check_connect.count_total_tt(param_net,num_postsyn,num_postcells,syn_tables,model.param_syn.NumSyn)
         print("num time tables needed: per synapse type {} per ttfile {}".format(tt_per_syn, tt_per_ttfile))
         #
-        for ntype in network_pop['pop'].keys():
-            connections[ntype]=connect.timetable_input(network_pop['pop'], param_net, ntype, model )
-        #
     else:
         check_connect.check_netparams(param_net,model.param_syn.NumSyn)
         #
         #create population of neurons according to grid spacing and size using neuron prototypes
-        network_pop = pop_funcs.create_population(moose.Neutral(param_net.netname), param_net, model.param_cond.NAME_SOMA)
+        pop_funcs.create_population(moose.Neutral(param_net.netname), param_net, model.param_cond.NAME_SOMA, plan)
         #
         #check_connect syntax after creating population
         check_connect.check_netparams(param_net,model.param_syn.NumSyn,network_pop['pop'])
         #
-        #loop over all post-synaptic neuron types and create connections:
-        for ntype in network_pop['pop'].keys():
-            connections[ntype]=connect.connect_neurons(network_pop['pop'], param_net, ntype, model)
-        #
+    #create synapses and connect them to time tables and to other neurons
+    if shard is not None:
+        shard.create_proxies()
+    connections=connect.instantiate_plan(plan, param_net, model)
     #save/write out the list of connections and location of each neuron
-    np.savez(param_net.confile,conn=connections,loc=network_pop['location'])
+    np.savez(param_net.confile+suffix,conn=connections,loc=network_pop['location'])
+    #connections as HDF5 edges, if param_net.edgefile is defined
+    if getattr(param_net,'edgefile',None):
+        edge_io.write_edges(param_net.edgefile+suffix, plan)
     #
     ##### add Synaptic Plasticity if specified, requires calcium
     plascum={}
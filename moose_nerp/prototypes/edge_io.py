@@ -0,0 +1,164 @@
+"""\
+Network connectivity in HDF5 edges format, an alternative to the pickled dictionary of
+connections saved by create_network in param_net.confile.
+
+   nodes: path, loc (soma location, 0 for time tables) and type (index into attribute types,
+          -1 for time tables) of each node; first num_cells neurons, then time tables
+   synapses: path of each synchan relative to the post-synaptic neuron, its compartment and syntype
+   conns: 'post/syntype/pretype' key of each connection in netparams.connect_dict
+   edges: one dataset per field, one row per synapse:
+          source, target (node ids), synapse (index into synapses), syntype (index into syntypes),
+          conn, stp (index into conns, -1 for no short term plasticity), delay, weight, distance
+
+Edges are written in chunks (EdgeWriter.append).  Compressed edges are chunked;
+uncompressed edges are contiguous, and are memory-mapped by read_edges.  read_plan returns a plan for connect.instantiate_plan,
+to rebuild the network without computing connections.
+"""
+from __future__ import print_function, division
+import numpy as np
+
+from moose_nerp.prototypes import connect_plan, logutil
+log = logutil.Logger()
+
+#number of edges per chunk, and compression of edge datasets (None for memory-mapped edges)
+EDGE_CHUNK = 65536
+EDGE_COMPRESSION = 'gzip'
+#edge dataset name, dtype, and field of connect_plan.EDGE_DTYPE
+EDGE_FIELDS = [('source', np.int32, 'pre'),
+               ('target', np.int32, 'post'),
+               ('synapse', np.int32, 'syn'),
+               ('syntype', np.int16, None),
+               ('conn', np.int16, 'conn'),
+               ('stp', np.int16, 'stp'),
+               ('delay', np.float64, 'delay'),
+               ('weight', np.float64, 'weight'),
+               ('distance', np.float64, 'dist')]
+
+def _strings(values):
+    return np.array([v.encode('utf-8') for v in values], dtype=bytes)
+
+def _decode(values):
+    return np.array([v.decode('utf-8') for v in values], dtype=str)
+
+class EdgeWriter(object):
+    #write the nodes, synapses and conns of a plan, then append edges (EDGE_DTYPE) in chunks
+    #if compression is None, num_edges must be given: edges are contiguous and can be memory-mapped
+    def __init__(self, filename, plan, num_edges=None, compression=EDGE_COMPRESSION, chunk=EDGE_CHUNK):
+        import h5py as h5
+        if compression is None and num_edges is None:
+            raise ValueError('uncompressed edges need num_edges')
+        self.file = h5.File(filename, 'w')
+        self.num_edges = 0
+        num_cells = int(plan['num_cells'])
+        types = list(plan['pop'].keys())
+        cell_num = {cell: ii for ii, cell in enumerate(plan['nodes'][:num_cells])}
+        node_type = np.full(len(plan['nodes']), -1, dtype=np.int16)
+        for typenum, ntype in enumerate(types):
+            node_type[[cell_num[cell] for cell in plan['pop'][ntype] if cell in cell_num]] = typenum
+        node_loc = np.zeros((len(plan['nodes']), 3))
+        node_loc[:num_cells] = plan['node_loc']
+        nodes = self.file.create_group('nodes')
+        nodes.attrs['num_cells'] = num_cells
+        nodes.attrs['single'] = bool(plan['single'])
+        nodes.attrs['types'] = _strings(types)
+        nodes.create_dataset('path', data=_strings(plan['nodes']))
+        nodes.create_dataset('loc', data=node_loc)
+        nodes.create_dataset('type', data=node_type)
+        synapses = self.file.create_group('synapses')
+        synapses.create_dataset('path', data=_strings(plan['synapses']))
+        synapses.create_dataset('compartment', data=_strings([syn.rsplit('/', 1)[0] for syn in plan['synapses']]))
+        self.syntypes = sorted(set(syn.rsplit('/', 1)[-1] for syn in plan['synapses']))
+        self.syntype_num = np.array([self.syntypes.index(syn.rsplit('/', 1)[-1]) for syn in plan['synapses']],
+                                    dtype=np.int16)
+        synapses.attrs['syntypes'] = _strings(self.syntypes)
+        synapses.create_dataset('syntype', data=self.syntype_num)
+        self.file.create_dataset('conns', data=_strings(plan['conns']))
+        edges = self.file.create_group('edges')
+        self.datasets = {}
+        for name, dtype, field in EDGE_FIELDS:
+            if compression is None:
+                self.datasets[name] = edges.create_dataset(name, shape=(num_edges,), dtype=dtype)
+            else:
+                self.datasets[name] = edges.create_dataset(name, shape=(0,), maxshape=(None,), dtype=dtype,
+                                                           chunks=(chunk,), compression=compression, shuffle=True)
+        self.resizable = compression is not None
+
+    def append(self, edges):
+        start, stop = self.num_edges, self.num_edges + len(edges)
+        for name, dtype, field in EDGE_FIELDS:
+            dset = self.datasets[name]
+            if self.resizable:
+                dset.resize((stop,))
+            elif stop > len(dset):
+                raise ValueError('more than {} edges'.format(len(dset)))
+            if field is None:
+                dset[start:stop] = self.syntype_num[edges['syn']]
+            else:
+                dset[start:stop] = edges[field]
+        self.num_edges = stop
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def write_edges(filename, plan, compression=EDGE_COMPRESSION, chunk=EDGE_CHUNK):
+    edges = plan['edges']
+    with EdgeWriter(filename, plan, len(edges), compression, chunk) as writer:
+        for start in range(0, len(edges), chunk):
+            writer.append(edges[start:start + chunk])
+    log.info('EDGES: {} edges written to {}', len(edges), filename)
+
+def read_edges(filename, mmap=True):
+    #dictionary of nodes, synapses, conns and edges (dictionary of field arrays)
+    #contiguous edges are memory-mapped if mmap, others are read into memory
+    import h5py as h5
+    with h5.File(filename, 'r') as f:
+        nodes = f['nodes']
+        data = {'nodes': _decode(nodes['path'][:]),
+                'node_loc': nodes['loc'][:],
+                'node_type': nodes['type'][:],
+                'types': list(_decode(nodes.attrs['types'])),
+                'num_cells': int(nodes.attrs['num_cells']),
+                'single': bool(nodes.attrs['single']),
+                'synapses': _decode(f['synapses/path'][:]),
+                'syntypes': list(_decode(f['synapses'].attrs['syntypes'])),
+                'conns': _decode(f['conns'][:]),
+                'edges': {}}
+        for name, dtype, field in EDGE_FIELDS:
+            dset = f['edges/' + name]
+            offset = dset.id.get_offset()
+            if mmap and offset is not None and dset.compression is None and dset.chunks is None:
+                data['edges'][name] = np.memmap(filename, dtype=dset.dtype, mode='r', offset=offset, shape=dset.shape)
+            else:
+                data['edges'][name] = dset[:]
+    return data
+
+def read_plan(filename):
+    #plan (see connect_plan) of an edges file, for connect.instantiate_plan or create_network
+    data = read_edges(filename, mmap=False)
+    num_cells = data['num_cells']
+    edges = np.zeros(len(data['edges']['source']), dtype=connect_plan.EDGE_DTYPE)
+    for name, dtype, field in EDGE_FIELDS:
+        if field is not None:
+            edges[field] = data['edges'][name]
+    cells = data['nodes'][:num_cells]
+    node_type = data['node_type'][:num_cells]
+    plan = {'nodes': data['nodes'],
+            'num_cells': num_cells,
+            'node_loc': data['node_loc'][:num_cells],
+            'synapses': data['synapses'],
+            'conns': data['conns'],
+            'edges': edges,
+            'single': data['single'],
+            'pop': {ntype: list(cells[node_type == typenum]) for typenum, ntype in enumerate(data['types'])}}
+    if plan['single']:
+        plan['location'] = {}
+    else:
+        plan['soma_loc'] = {ntype: plan['node_loc'][node_type == typenum] for typenum, ntype in enumerate(data['types'])}
+        plan['location'] = [[cell.split('/')[-1]] + list(loc) for cell, loc in zip(cells, plan['node_loc'])]
+    return plan
@@ -1,9 +1,9 @@
 #Eventually, update this for trains and bursts from Sriram's genesis functions
 
 from __future__ import print_function, division
+import hashlib
 import numpy as np
 import moose
-import random
 from moose_nerp.prototypes.util import NamedList
 from moose_nerp.prototypes.util import NamedDict
 from moose_nerp.prototypes import connect, plasticity, util, spines
@@ -103,62 +103,56 @@ def MakeGenerators(container,Stimulation):
 
     return [pulse0,burst_gate,train_gate,experiment_gate]
 
-def loop_through_spines(i,j,k,my_spines,time_tables,delay,StimParams):
-    
-    for spine in my_spines:
-        if spine not in time_tables:
-            time_tables[spine] = []
-        time_tables[spine].append(delay+i*1./StimParams.f_train+j*1./StimParams.f_burst+k*1./StimParams.f_pulse)
+def pulse_times(StimParams,delay):
+    #times of all pulses, in the order train, burst, pulse; and pulse number within the burst of each
+    i=np.arange(StimParams.n_train)[:,None,None]*1./StimParams.f_train
+    j=np.arange(StimParams.n_burst)[None,:,None]*1./StimParams.f_burst
+    pulse=np.arange(StimParams.n_pulse)[None,None,:]
+    times=delay+i+j+pulse*1./StimParams.f_pulse
+    return times.ravel(),np.broadcast_to(pulse,times.shape).astype(int).ravel()
+
+def _choose(candidates,how_many,num_pulses):
+    #how_many candidates (indices) for each pulse, randomly without replacement, in one draw
+    if how_many>candidates:
+        print('MakeTimeTables: {} spines per pulse requested, only {} available'.format(how_many,candidates))
+        how_many=candidates
+    return np.argsort(np.random.random((num_pulses,candidates)),axis=1)[:,:how_many]
 
 def MakeTimeTables(Stimulation,spine_no):
-
+    #dictionary of stimulated spines (or dendrites, if spine_density is 0) and array of their stimulation times
     StimParams = Stimulation.Paradigm
-    delay = Stimulation.stim_delay
     location=Stimulation.StimLoc
 
-    time_tables = {}
-    if location.spine_density==0.0:
-        how_many=spine_no
+    times,pulse=pulse_times(StimParams,Stimulation.stim_delay)
+    num_pulses=len(times)
+    #candidates: spines (or dendrites) which may be stimulated; pulse_index, cand_index: pulse and candidate of each stimulus
+    if location.spine_density==0:
+        candidates=list(location.stim_dendrites)
+        pulse_index=np.repeat(np.arange(num_pulses),len(candidates))
+        cand_index=np.tile(np.arange(len(candidates)),num_pulses)
+    elif location.pulse_sequence:
+        candidates=list(dict.fromkeys(sp for seq in location.pulse_sequence for sp in seq))
+        sequence=[np.array([candidates.index(sp) for sp in seq],dtype=int) for seq in location.pulse_sequence]
+        pulse_index=np.concatenate([np.repeat(p,len(sequence[k])) for p,k in enumerate(pulse)]+[np.zeros(0,dtype=int)])
+        cand_index=np.concatenate([sequence[k] for k in pulse]+[np.zeros(0,dtype=int)])
     else:
         if location.which_spines in ['all','ALL','All']:
-            how_many  = round(location.spine_density*spine_no)
-        elif location.which_spines:
-            how_many  = round(location.spine_density*len(location.which_spines))
-
-    for i in range(StimParams.n_train):
-        for j in range(StimParams.n_burst):
-            for k in range(StimParams.n_pulse):
-                if location.spine_density==0:
-                    my_spines=location.stim_dendrites
-                elif location.pulse_sequence:
-                    my_spines = location.pulse_sequence[k]
-
-                #The next two elif blocks need work.  Eliminate infinite loop, combine into one block since mostly similar
-                elif location.which_spines in ['all','ALL','All']:
-                    my_spines = []
-                    how_many_spines = 0
-                    while True:
-                        spine = random.randint(0,spine_no-1)
-                        if spine not in my_spines:
-                            my_spines.append(spine)
-                            how_many_spines += 1
-                            if how_many_spines == how_many:
-                                break
-
-                elif  location.which_spines:
-                    my_spines = []
-                    how_many_spines = 0
-                    while True:
-                        r = random.randint(0,len(location.which_spines)-1)
-                        spine = location.which_spines[r]
-                        if spine not in my_spines:
-                            my_spines.append(spine)
-                            how_many_spines += 1
-                            if how_many_spines == how_many:
-                                break
-                #ANOTHER ISSUE: This will create identical time_tables for each spine, instead of hooking up same tt to multiples
-                loop_through_spines(i,j,k,my_spines,time_tables,delay,StimParams)
-
+            candidates=list(range(spine_no))
+            how_many=int(round(location.spine_density*spine_no))
+        else:
+            candidates=list(dict.fromkeys(location.which_spines))
+            how_many=int(round(location.spine_density*len(location.which_spines)))
+        chosen=_choose(len(candidates),how_many,num_pulses)
+        pulse_index=np.repeat(np.arange(num_pulses),chosen.shape[1])
+        cand_index=chosen.ravel()
+
+    #group the stimuli by candidate, keeping the order of pulses, and candidates in order of first stimulus
+    order=np.argsort(cand_index,kind='stable')
+    cands,first=np.unique(cand_index,return_index=True)
+    groups=np.split(times[pulse_index[order]],np.searchsorted(cand_index[order],cands[1:]))
+    time_tables = {}
+    for n in np.argsort(first):
+        time_tables[candidates[cands[n]]]=groups[n]
     return time_tables
 
 def enumerate_spine_synchans(model,dendrite):
@@ -183,6 +177,21 @@ def enumerate_spine_synchans(model,dendrite):
 
     return num_spines,synapses    
 
+#paths of time tables by hash of spike times and tick, so that identical stimulation trains share one time table
+_timetables = {}
+
+def shared_timetable(path,spike_times,tick=7):
+    #time table with spike_times, created at path unless one with the same spike times and tick exists
+    spike_times = np.ascontiguousarray(spike_times, dtype=np.float64)
+    key = (hashlib.sha1(spike_times.tobytes()).hexdigest(), tick)
+    if key in _timetables and moose.exists(_timetables[key]):
+        return moose.element(_timetables[key])
+    tt = moose.TimeTable(path)
+    tt.vector = spike_times
+    tt.tick = tick
+    _timetables[key] = tt.path
+    return tt
+
 def HookUpDend(model,dendrite,container):
     if model.Stimulation.StimLoc.spine_density>0:
         num_spines,synchans=enumerate_spine_synchans(model,dendrite)
@@ -202,9 +211,8 @@ def HookUpDend(model,dendrite,container):
     stimtab = {}
     stim_syn = {}
     for spine in time_tables:
-        stimtab[spine] = moose.TimeTable('%s_%s_%s' % (tt_root_name,str(spine),str(int(freq))))
-        stimtab[spine].vector = np.array(time_tables[spine])
-        stimtab[spine].tick=7#moose.element(synchans[spine][0]).tick
+        #spines (and dendrites) with identical spike times share the time table of the first one
+        stimtab[spine] = shared_timetable('%s_%s_%s' % (tt_root_name,str(spine),str(int(freq))),time_tables[spine],tick=7)#moose.element(synchans[spine][0]).tick
         print('HUD,stimtab {} '.format(stimtab),'tick',stimtab[spine].tick)
 
         for synchan in synchans[spine]:
@@ -230,7 +238,7 @@ def ConnectPreSynapticPostSynapticStimulation(model,ntype):
         moose.connect(pg[0], 'output', injectcomp, 'injectMsg')
 
     stimtabs = {};stim_syn_set={};#synchans={}
-    #ISSUE WITH THIS LOOP: potentially creating independent but identical timetables for multiple dendrites
+    #identical timetables for multiple dendrites are created once, see shared_timetable
     for dend in model.Stimulation.StimLoc.stim_dendrites:
         name_dend = '/'+ntype+'/'+dend
         dendrite = moose.element(name_dend)
@@ -0,0 +1,117 @@
+"""\
+Snapshot of /library (channels of chanlib, synaptic channels of synchanlib, GHK), saved to an npz
+file and restored in another process without running the construction code.
+make_library(model, cache_dir) restores the snapshot saved with the same parameters (fingerprint
+of channel and synapse parameters, table ranges, temperature and moose version) if there is one,
+and otherwise builds /library and saves it.  A restored library is read back and compared with the
+snapshot; if it differs, it is deleted and built again.
+"""
+from __future__ import print_function, division
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+import moose
+
+from moose_nerp.prototypes import chan_proto, syn_proto, logutil
+log = logutil.Logger()
+
+LIBRARY_VERSION = 1
+#fields of each class, in the order they are set
+FIELDS = {'HHChannel': ['Xpower', 'Ypower', 'Zpower', 'Ek', 'Gbar', 'instant', 'useConcentration', 'tick'],
+          'HHChannel2D': ['Xpower', 'Ypower', 'Zpower', 'Ek', 'Gbar', 'Xindex', 'Yindex', 'Zindex', 'tick'],
+          'SynChan': ['tau1', 'tau2', 'Ek', 'Gbar', 'normalizeWeights', 'tick'],
+          'NMDAChan': ['tau1', 'tau2', 'Ek', 'Gbar', 'normalizeWeights', 'KMg_A', 'KMg_B', 'CMg',
+                       'condFraction', 'temperature', 'extCa', 'intCaScale', 'intCaOffset', 'tick'],
+          'GHK': ['T', 'Cout', 'valency', 'tick']}
+GATE_CLASSES = {'HHChannel': 'HHGate', 'HHChannel2D': 'HHGate2D'}
+
+def library_fingerprint(model):
+    #hash of all parameters that determine /library
+    key = repr((LIBRARY_VERSION, moose.__version__, model.Channels, model.SYNAPSE_TYPES,
+                model.VMIN, model.VMAX, model.VDIVS, model.CAMIN, model.CAMAX, model.CADIVS,
+                model.Temp, model.ConcOut, model.ghkYN, model.calYN))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def _field_value(value):
+    #json compatible value of a moose field
+    return value.item() if isinstance(value, np.generic) else value
+
+def library_elements(path='/library'):
+    #elements of path that are saved in a snapshot (not neuron prototypes)
+    return [moose.element(child) for child in moose.element(path).children
+            if moose.element(child).className in FIELDS]
+
+def describe(elements):
+    #fields of elements, and their gate tables by element number/gate/table
+    meta, tables = [], {}
+    for num, elem in enumerate(elements):
+        fields = [[field, _field_value(getattr(elem, field))] for field in FIELDS[elem.className]]
+        meta.append({'path': elem.path.replace('[0]', ''), 'className': elem.className, 'fields': fields})
+        if elem.className in GATE_CLASSES:
+            tables.update({'{}/{}'.format(num, name): table for name, table in chan_proto.gate_tables(elem).items()})
+    return meta, tables
+
+def save(filename, path='/library'):
+    #snapshot of path, written to a temporary file and then renamed
+    meta, tables = describe(library_elements(path))
+    fd, tmpname = tempfile.mkstemp(suffix='.npz', dir=os.path.dirname(os.path.abspath(filename)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, elements=np.array(json.dumps(meta)), **tables)
+        os.replace(tmpname, filename)
+    except BaseException:
+        os.remove(tmpname)
+        raise
+
+def restore(filename):
+    #create the elements of a snapshot; returns the elements and the paths that differ from the snapshot
+    with np.load(filename) as data:
+        meta = json.loads(str(data['elements']))
+        arrays = {key: data[key] for key in data.files if key != 'elements'}
+    elements = []
+    for num, desc in enumerate(meta):
+        parent = os.path.dirname(desc['path'])
+        if not moose.exists(parent):
+            moose.Neutral(parent)
+        elem = getattr(moose, desc['className'])(desc['path'])
+        for field, value in desc['fields']:
+            setattr(elem, field, value)
+        prefix = '{}/'.format(num)
+        tables = {key[len(prefix):]: table for key, table in arrays.items() if key.startswith(prefix)}
+        for name in sorted(set(key.split('/')[0] for key in tables)):
+            gate = getattr(moose, GATE_CLASSES[desc['className']])(elem.path + '/' + name)
+            chan_proto.set_gate_tables(gate, tables, name)
+        elements.append(elem)
+    #verify: read back the restored library
+    restored_meta, restored_tables = describe(elements)
+    differ = [desc['path'] for desc, restored in zip(meta, restored_meta) if desc != restored]
+    differ += sorted(set(meta[int(key.split('/')[0])]['path'] for key in arrays
+                         if key not in restored_tables or not np.array_equal(arrays[key], restored_tables[key])))
+    return elements, differ
+
+def make_library(model, cache_dir=None):
+    #build /library (chanlib, synchanlib); with cache_dir (or model.library_cache), restored from a
+    #snapshot with the same parameters, or built and saved
+    if cache_dir is None:
+        cache_dir = getattr(model, 'library_cache', None)
+    if cache_dir is None:
+        chan_proto.chanlib(model)
+        syn_proto.synchanlib(model)
+        return
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    #fingerprint before building, which may change channel parameters (fix_singularities)
+    fname = os.path.join(cache_dir, 'library_' + library_fingerprint(model) + '.npz')
+    if os.path.exists(fname):
+        elements, differ = restore(fname)
+        if not differ:
+            log.info('library restored from {}', fname)
+            return
+        log.warning('library snapshot {} differs from the restored library at {}, building it', fname, differ)
+        for elem in elements:
+            moose.delete(elem)
+    chan_proto.chanlib(model)
+    syn_proto.synchanlib(model)
+    save(fname)
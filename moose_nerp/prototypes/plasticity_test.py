@@ -44,7 +44,11 @@ def short_term_plasticity_test(tt_syn_tuple,syn_delay=0,simdt=None,stp_params=No
     synchan=moose.element(syn.parent)
     syntype=synchan.name
     neurtype=synchan.parent.parent.name
-    syntab=moose.Table(tables.DATA_NAME+'/'+neurtype+'-'+tt.name+'_to_'+syntype)
+    tabname=tables.DATA_NAME+'/'+neurtype+'-'+tt.name+'_to_'+syntype
+    if moose.exists(tabname):
+        #time table shared by several synapses (inject_func.shared_timetable)
+        tabname=tabname+'_'+synchan.parent.name
+    syntab=moose.Table(tabname)
     moose.connect(syntab,'requestOut',synchan,'getGk')
     if stp_params is not None:
         tabset=[]
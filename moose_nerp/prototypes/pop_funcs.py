@@ -9,32 +9,38 @@ import moose
 from moose_nerp.prototypes import logutil, util
 log = logutil.Logger()
 
+#spike generator of each neuron in the network
+SPIKEGEN_THRESHOLD = 0.0
+SPIKEGEN_REFRACT = 1e-3
+
 def count_neurons(netparams):
-    size=np.ones(len(netparams.grid),dtype=np.int)
-    length=np.ones(len(netparams.grid),dtype=np.float)
+    size=np.ones(len(netparams.grid),dtype=int)
+    length=np.ones(len(netparams.grid),dtype=float)
     numneurons=1
     volume=1
     for i in range(len(netparams.grid)):
         if netparams.grid[i]['inc']>0:
             length[i]=netparams.grid[i]['xyzmax']-netparams.grid[i]['xyzmin']
-            size[i]=np.int(np.ceil(length[i]/netparams.grid[i]['inc']))
+            size[i]=int(np.ceil(length[i]/netparams.grid[i]['inc']))
         numneurons*=size[i]
         volume*=length[i]
     return size, numneurons, volume
 
-def create_population(container, netparams, name_soma):
-    netpath = container.path
-    proto=[]
+def population_plan(netparams):
+    #neuron type, name and soma location of each neuron in the network, without creating moose objects
+    netpath = netparams.netname
     neurXclass={}
     locationlist=[]
+    soma_loc={}
     #determine total number of neurons
     size,numneurons,vol=count_neurons(netparams)
     pop_percent=[]
     for neurtype in netparams.pop_dict.keys():
         if moose.exists(neurtype):
-            proto.append(moose.element(neurtype))
             neurXclass[neurtype]=[]
+            soma_loc[neurtype]=[]
             pop_percent.append(netparams.pop_dict[neurtype].percent)
+    typenames=list(neurXclass.keys())
     #create cumulative array of probabilities for selecting neuron type
     choicearray=np.cumsum(pop_percent)
     if choicearray[-1]<1.0:
@@ -47,38 +53,72 @@ def create_population(container, netparams, name_soma):
     for i,xloc in enumerate(np.linspace(netparams.grid[0]['xyzmin'], netparams.grid[0]['xyzmax'], size[0])):
         for j,yloc in enumerate(np.linspace(netparams.grid[1]['xyzmin'], netparams.grid[1]['xyzmax'], size[1])):
             for k,zloc in enumerate(np.linspace(netparams.grid[2]['xyzmin'], netparams.grid[2]['xyzmax'], size[2])):
-                #for each location in grid, assign neuron type, update soma location, add in spike generator
+                #for each location in grid, assign neuron type and soma location
                 neurnumber=i*size[2]*size[1]+j*size[2]+k
                 neurtypenum=np.min(np.where(rannum[neurnumber]<choicearray))
                 log.debug("i,j,k {} {} {} neurnumber {} type {}", i,j,k, neurnumber, neurtypenum)
-                typename = proto[neurtypenum].name
+                typename = typenames[neurtypenum]
                 tag = '{}_{}'.format(typename, neurnumber)
-                new_neuron=moose.copy(proto[neurtypenum],netpath, tag)
-                neurXclass[typename].append(container.path + '/' + tag)
-                comp=moose.element(new_neuron.path + '/'+name_soma)
-                comp.x=i*xloc
-                comp.y=j*yloc
-                comp.z=k*zloc
-                log.debug("x,y,z={},{},{} {}", comp.x, comp.y, comp.z, new_neuron.path)
-                locationlist.append([new_neuron.name,comp.x,comp.y,comp.z])
-                #spike generator - can this be done to the neuron prototype?
-                spikegen = moose.SpikeGen(comp.path + '/spikegen')
-                #should these be parameters in netparams?
-                spikegen.threshold = 0.0
-                spikegen.refractT=1e-3
-                m = moose.connect(comp, 'VmOut', spikegen, 'Vm')
+                neurXclass[typename].append(netpath + '/' + tag)
+                soma_loc[typename].append((i*xloc, j*yloc, k*zloc))
+                locationlist.append([tag, i*xloc, j*yloc, k*zloc])
+    return {'location': locationlist,
+            'pop':neurXclass,
+            'soma_loc':{neurtype:np.reshape(loc,(-1,3)) for neurtype,loc in soma_loc.items()}}
+
+def add_spikegen(neur_proto, name_soma):
+    #spike generator at the soma; returns None if it already exists
+    spikegen_path = neur_proto.path + '/' + name_soma + '/spikegen'
+    if moose.exists(spikegen_path):
+        return None
+    comp = moose.element(neur_proto.path + '/' + name_soma)
+    spikegen = moose.SpikeGen(spikegen_path)
+    #should these be parameters in netparams?
+    spikegen.threshold = SPIKEGEN_THRESHOLD
+    spikegen.refractT = SPIKEGEN_REFRACT
+    m = moose.connect(comp, 'VmOut', spikegen, 'Vm')
+    return spikegen
+
+def create_population(container, netparams, name_soma, pop_plan=None):
+    #create the neurons of the population plan (created if not given) by copying the neuron prototypes
+    if pop_plan is None:
+        pop_plan = population_plan(netparams)
+    neurXclass = pop_plan['pop']
+    for typename, neurons in neurXclass.items():
+        proto = moose.element(typename)
+        #spike generator is added to the prototype once, so that it is copied with each neuron
+        proto_spikegen = add_spikegen(proto, name_soma)
+        for neurpath, loc in zip(neurons, pop_plan['soma_loc'][typename]):
+            new_neuron=moose.copy(proto,container,neurpath.split('/')[-1])
+            comp=moose.element(new_neuron.path + '/'+name_soma)
+            comp.x, comp.y, comp.z = loc
+        log.debug("{} {} neurons, soma locations {}", typename, len(neurons), pop_plan['soma_loc'][typename])
+        #prototype is left unchanged
+        if proto_spikegen is not None:
+            moose.delete(proto_spikegen)
     #Create variability in neurons of network
-    for neurtype in netparams.chanvar.keys():
-        for chan,var in netparams.chanvar[neurtype].items():
-            #single multiplier for Gbar for all the channels compartments
-            if var>0:
-                log.debug('adding variability to {} soma {}, variance: {}', neurtype,chan, var)
-                GbarArray=abs(np.random.normal(1.0, var, len(neurXclass[neurtype])))
-                for ii,neurname in enumerate(neurXclass[neurtype]):
-                    soma_chan_path=neurname+'/'+name_soma+'/'+chan
-                    if moose.exists(soma_chan_path):
-                        chancomp=moose.element(soma_chan_path)
-                        chancomp.Gbar=chancomp.Gbar*GbarArray[ii]
+    apply_chanvar(container, netparams, name_soma, neurXclass, getattr(netparams, 'chanvar_dend', False))
     #
-    return {'location': locationlist,
-            'pop':neurXclass}
+    return pop_plan
+
+def apply_chanvar(container, netparams, name_soma, neurXclass, dendrites=False):
+    #single multiplier of Gbar for each neuron and channel, applied to the soma channel,
+    #or if dendrites, to the channel in all compartments of the neuron
+    comps = '/##' if dendrites else '/' + name_soma + '/#'
+    for neurtype, chanvar in netparams.chanvar.items():
+        chans = [chan for chan, var in chanvar.items() if var > 0]
+        neurons = neurXclass.get(neurtype, [])
+        if not len(chans) or not len(neurons):
+            continue
+        log.debug('adding variability to {} {}, variance: {}', neurtype, comps, {chan: chanvar[chan] for chan in chans})
+        #one row per channel, same random numbers as drawing one channel at a time
+        var = np.array([chanvar[chan] for chan in chans])
+        GbarArray = np.abs(np.random.normal(1.0, var[:, np.newaxis], (len(chans), len(neurons))))
+        chan_num = {chan: ii for ii, chan in enumerate(chans)}
+        neur_num = {neurpath.split('/')[-1]: ii for ii, neurpath in enumerate(neurons)}
+        #all channels of this neuron type in one query; other types matching the name pattern are skipped
+        for chancomp in moose.wildcardFind(container.path + '/' + neurtype + '_#' + comps + '[ISA=ChanBase]'):
+            neurname = chancomp.path[len(container.path) + 1:].split('/')[0].split('[')[0]
+            if chancomp.name in chan_num and neurname in neur_num:
+                chancomp.Gbar = chancomp.Gbar * GbarArray[chan_num[chancomp.name], neur_num[neurname]]
+    return
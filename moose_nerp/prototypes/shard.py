@@ -0,0 +1,226 @@
+"""\
+Sharded network simulation: the population grid is divided into spatial shards along its
+longest axis, and each shard is simulated by one worker process on the same computer (no MPI).
+Workers run in lock-step epochs of netparams.mindelay, and exchange the spikes of each epoch
+through shared memory.  Spikes of cells in other shards are replayed, one epoch later, by
+proxy time tables; the synaptic delay of connections from other shards is reduced by one epoch,
+so that spikes arrive at the same time as in a single process.
+
+The connectivity plan is computed once, before the workers are started, and inherited by
+each worker (fork); the neuron prototypes must also exist before run_sharded is called.
+"""
+from __future__ import print_function, division
+import queue
+import multiprocessing
+import numpy as np
+import moose
+
+from moose_nerp.prototypes import (connect_plan,
+                                   create_network,
+                                   clocks,
+                                   pop_funcs,
+                                   logutil)
+log = logutil.Logger()
+
+#proxy time tables of cells in other shards, and spike tables of the cells of each shard
+SHARD_INPUT = '/shard_input'
+SHARD_SPIKES = '/shard_spikes'
+#maximum time (sec) to wait for the other workers at the end of an epoch
+EXCHANGE_TIMEOUT = 600
+
+def partition_cells(netparams, plan, num_shards):
+    #shard of each cell in the plan: slabs of the population grid along its longest axis
+    if plan['single']:
+        raise ValueError('single neuron simulations cannot be sharded')
+    size = pop_funcs.count_neurons(netparams)[0]
+    axis = int(np.argmax(size))
+    if num_shards > size[axis]:
+        raise ValueError('{} shards but only {} grid points along axis {}'.format(num_shards, size[axis], axis))
+    #cell names end with the neuron number, i*size[2]*size[1]+j*size[2]+k
+    cells = plan['nodes'][:int(plan['num_cells'])]
+    neurnumber = np.array([int(cell.rsplit('_', 1)[1]) for cell in cells], dtype=int)
+    grid_index = np.unravel_index(neurnumber, tuple(size))[axis]
+    return grid_index * num_shards // size[axis]
+
+class SpikeExchange(object):
+    #shared memory of the spikes sent by each shard during one epoch: (node, time) pairs
+    #two buffers, alternating between epochs, so that a single barrier per epoch is needed
+    def __init__(self, num_shards, capacity):
+        self.num_shards = num_shards
+        self.capacity = capacity
+        self.barrier = multiprocessing.Barrier(num_shards)
+        self._counts = multiprocessing.RawArray('q', 2 * num_shards)
+        self._nodes = multiprocessing.RawArray('q', 2 * num_shards * capacity)
+        self._times = multiprocessing.RawArray('d', 2 * num_shards * capacity)
+
+    def arrays(self):
+        #numpy views of the shared memory, created in each worker
+        shape = (2, self.num_shards, self.capacity)
+        return (np.frombuffer(self._counts, dtype=np.int64).reshape(2, self.num_shards),
+                np.frombuffer(self._nodes, dtype=np.int64).reshape(shape),
+                np.frombuffer(self._times, dtype=np.float64).reshape(shape))
+
+class Shard(object):
+    def __init__(self, index, plan, cell_shard, exchange, epoch):
+        self.index = index
+        self.plan = plan
+        self.cell_shard = cell_shard
+        self.exchange = exchange
+        self.epoch = epoch
+        num_cells = int(plan['num_cells'])
+        #time tables are never remote
+        self.is_local = np.ones(len(plan['nodes']), dtype=bool)
+        self.is_local[:num_cells] = cell_shard == index
+        edges = plan['edges']
+        #local cells with post-synaptic cells in other shards
+        export = (edges['pre'] < num_cells) & self.is_local[edges['pre']] & ~self.is_local[edges['post']]
+        self.exported = np.unique(edges['pre'][export])
+        self.proxies = {}
+        self.spike_tables = []
+        self.spikes = {}
+
+    def local_plan(self, netparams):
+        #plan restricted to the cells of this shard, and the synapses onto them
+        plan = self.plan
+        nodes, num_cells = plan['nodes'], int(plan['num_cells'])
+        edges = plan['edges'][self.is_local[plan['edges']['post']]].copy()
+        remote = ~self.is_local[edges['pre']]
+        edges['delay'][remote] -= self.epoch
+        #one proxy time table per remote pre-synaptic cell
+        self.proxies = {int(pre): SHARD_INPUT + '/' + nodes[pre].split('/')[-1] for pre in np.unique(edges['pre'][remote])}
+        local_cells = set(nodes[:num_cells][self.is_local[:num_cells]])
+        pop, soma_loc = {}, {}
+        for ntype, cells in plan['pop'].items():
+            keep = np.array([cell in local_cells for cell in cells], dtype=bool)
+            pop[ntype] = [cell for cell in cells if cell in local_cells]
+            soma_loc[ntype] = plan['soma_loc'][ntype][keep]
+        location = [loc for loc in plan['location'] if netparams.netname + '/' + loc[0] in local_cells]
+        log.info('SHARD {}: {} cells, {} synapses, {} remote pre-synaptic cells', self.index,
+                 len(local_cells), len(edges), len(self.proxies))
+        return dict(plan, pop=pop, soma_loc=soma_loc, location=location, edges=edges, proxies=self.proxies)
+
+    def create_proxies(self):
+        if not moose.exists(SHARD_INPUT):
+            moose.Neutral(SHARD_INPUT)
+        for path in self.proxies.values():
+            moose.TimeTable(path).tick = 7
+
+    def create_spike_tables(self, name_soma):
+        #record spikes of all local cells, for exchange and for the results
+        if not moose.exists(SHARD_SPIKES):
+            moose.Neutral(SHARD_SPIKES)
+        nodes = self.plan['nodes']
+        for node in np.flatnonzero(self.is_local[:int(self.plan['num_cells'])]):
+            spikegen = moose.wildcardFind(nodes[node] + '/' + name_soma + '/#[TYPE=SpikeGen]')[0]
+            tab = moose.Table(SHARD_SPIKES + '/' + nodes[node].split('/')[-1])
+            moose.connect(spikegen, 'spikeOut', tab, 'spike')
+            self.spike_tables.append((node, tab))
+            self.spikes[nodes[node]] = []
+
+    def exchange_spikes(self, epoch_num, counts, spike_nodes, spike_times):
+        #send the spikes of exported cells, and replay the spikes of remote cells one epoch later
+        buf = epoch_num % 2
+        sent_nodes, sent_times = [], []
+        for node, tab in self.spike_tables:
+            times = tab.vector
+            if len(times):
+                self.spikes[self.plan['nodes'][node]].extend(times)
+                tab.clearVec()
+                sent_nodes.append(np.full(len(times), node))
+                sent_times.append(times)
+        sent_nodes = np.concatenate(sent_nodes) if len(sent_nodes) else np.zeros(0, dtype=int)
+        sent_times = np.concatenate(sent_times) if len(sent_times) else np.zeros(0)
+        export = np.isin(sent_nodes, self.exported)
+        num = np.count_nonzero(export)
+        if num > self.exchange.capacity:
+            self.exchange.barrier.abort()
+            raise RuntimeError('shard {}: {} spikes in one epoch, capacity {}'.format(
+                self.index, num, self.exchange.capacity))
+        spike_nodes[buf, self.index, :num] = sent_nodes[export]
+        spike_times[buf, self.index, :num] = sent_times[export]
+        counts[buf, self.index] = num
+        self.exchange.barrier.wait(EXCHANGE_TIMEOUT)
+        for shard in range(self.exchange.num_shards):
+            num = counts[buf, shard]
+            if shard == self.index or not num:
+                continue
+            received_nodes, received_times = spike_nodes[buf, shard, :num], spike_times[buf, shard, :num]
+            for node in np.unique(received_nodes):
+                if node in self.proxies:
+                    proxy = moose.element(self.proxies[node])
+                    new_times = np.sort(received_times[received_nodes == node]) + self.epoch
+                    #a time table keeps its position, so new spike times are appended
+                    proxy.vector = np.append(proxy.vector, new_times)
+
+    def run(self, simtime):
+        counts, spike_nodes, spike_times = self.exchange.arrays()
+        num_epochs = int(np.ceil(simtime / self.epoch - 1e-9))
+        moose.reinit()
+        for epoch_num in range(num_epochs):
+            moose.start(self.epoch)
+            self.exchange_spikes(epoch_num, counts, spike_nodes, spike_times)
+        return {cell: np.array(times) for cell, times in self.spikes.items()}
+
+def _worker(shard, model, netparams, neur_protos, simtime, setup, seed, results):
+    try:
+        if seed is not None:
+            np.random.seed(seed + shard.index)
+        network_pop, connections, plas = create_network.create_network(model, netparams, neur_protos, shard=shard)
+        shard.create_spike_tables(model.param_cond.NAME_SOMA)
+        collect = setup(model, netparams, network_pop, connections, plas) if setup is not None else None
+        param_sim = model.param_sim
+        clocks.assign_clocks([netparams.netname], param_sim.simdt, param_sim.plotdt, param_sim.hsolve,
+                             model.param_cond.NAME_SOMA)
+        spikes = shard.run(simtime)
+        results.put((shard.index, spikes, collect() if callable(collect) else None))
+    except BaseException:
+        #release the other workers waiting at the end of an epoch
+        shard.exchange.barrier.abort()
+        raise
+
+def run_sharded(model, netparams, neur_protos, num_shards, simtime=None, setup=None, seed=None, plan_cache=None):
+    #simulate the network in num_shards worker processes
+    #setup(model, netparams, network_pop, connections, plas) is called in each worker after the
+    #network is created, e.g. to add stimulation or output tables; it may return a function,
+    #called after the simulation, whose (picklable) result is returned for each shard
+    #returns spike times of every cell, and list of setup results ordered by shard
+    if netparams.mindelay <= 0:
+        raise ValueError('sharded simulation requires netparams.mindelay > 0, the epoch of spike exchange')
+    if simtime is None:
+        simtime = model.param_sim.simtime
+    if seed is None:
+        seed = getattr(netparams, 'seed', None)
+    if plan_cache is None:
+        plan_cache = getattr(netparams, 'plan_cache', None)
+    plan = connect_plan.cached_network_plan(model, netparams, neur_protos, seed, plan_cache)
+    cell_shard = partition_cells(netparams, plan, num_shards)
+    #spike generators cannot fire more than once per refractory period
+    max_cells = int(np.max(np.bincount(cell_shard, minlength=num_shards)))
+    capacity = max_cells * (int(np.ceil(netparams.mindelay / pop_funcs.SPIKEGEN_REFRACT)) + 1)
+    exchange = SpikeExchange(num_shards, capacity)
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    workers = [context.Process(target=_worker, args=(Shard(ii, plan, cell_shard, exchange, netparams.mindelay),
+                                                      model, netparams, neur_protos, simtime, setup, seed, results))
+               for ii in range(num_shards)]
+    for worker in workers:
+        worker.start()
+    shard_results = {}
+    try:
+        while len(shard_results) < num_shards:
+            try:
+                index, spikes, collected = results.get(timeout=1)
+                shard_results[index] = (spikes, collected)
+            except queue.Empty:
+                failed = [ii for ii, worker in enumerate(workers) if worker.exitcode not in (None, 0)]
+                if len(failed):
+                    raise RuntimeError('shard workers {} failed'.format(failed))
+    finally:
+        for worker in workers:
+            if len(shard_results) < num_shards:
+                worker.terminate()
+            worker.join()
+    spikes = {}
+    for ii in range(num_shards):
+        spikes.update(shard_results[ii][0])
+    return spikes, [shard_results[ii][1] for ii in range(num_shards)]
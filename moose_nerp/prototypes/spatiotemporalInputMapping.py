@@ -108,7 +108,7 @@ def generateElementList(neuron, wildcardStrings=['ampa,nmda'], elementType='SynC
     Examples: Add use cases
     '''
     # 1. Moose wildcard find from neuron using elementType.
-    neuron.buildSegmentTree()
+    index = branchIndex(neuron)
 
     allList = []
     for s in wildcardStrings:
@@ -120,28 +120,24 @@ def generateElementList(neuron, wildcardStrings=['ampa,nmda'], elementType='SynC
                                           commonParentOrder=commonParentOrder, min_length = min_length, min_path_length = min_path_length, max_path_length = max_path_length)
     else:
         possibleBranches = branch_list
-    bd = getBranchDict(neuron)
-    possibleCompartments = [comp for branch in possibleBranches for comp in bd[branch]['CompList']]
+    branchIds = [index.branchId[branch] for branch in possibleBranches]
+    possibleCompartments = set(index.paths[i] for i in np.flatnonzero(np.isin(index.branch, branchIds)))
     elementList = []
     for el in allList:
-        # Get Distance of element, or parent compartment if element not compartment
-        el = moose.element(el)
-        if isinstance(el, (moose.Compartment, moose.ZombieCompartment)):
-            dist,name = util.get_dist_name(el)
-            path = el.path
-        elif isinstance(moose.element(el.parent),(moose.Compartment,moose.ZombieCompartment)):
-            dist,name = util.get_dist_name(moose.element(el.parent))
-            path = el.parent.path
-        else:
-            print('Invalid Element')
+        # Distance of element, or parent compartment if element not compartment, from the index
+        path = el.path
+        if path not in index.compDist:
+            path = path.rsplit('/', 1)[0]
+        if path not in index.compDist:
+            print('Invalid Element', el.path)
+            continue
+        dist = index.compDist[path]
+        name = path.rsplit('/', 1)[-1]
+        # spine compartments: elements are selected by the dendrite the spine is on
         if any(s in name.lower() for s in ['head'.lower(),'neck'.lower()]):
-            dist,name = util.get_dist_name(moose.element(el.parent))
-            path = moose.element(path).parent
-        #print('#####possible compartments')
-        #print(possibleCompartments)
-        #print(name, dist, path)
-        if (minDistance<dist<maxDistance) and path.path in possibleCompartments:
-            elementList.append(el)
+            path = path.rsplit('/', 1)[0]
+        if (minDistance<dist<maxDistance) and path in possibleCompartments:
+            elementList.append(moose.element(el))
     #print(elementList)
     return elementList
 
@@ -156,6 +152,105 @@ def getBranchOrder(compartment):
 
     return
 
+
+class BranchIndex(object):
+    '''Morphology of a neuron as arrays, built by one walk of the compartment tree.
+
+    Compartments, in depth first order from the soma (compartment 0):
+    paths, parent (index of parent compartment, -1 for soma), branch (branch
+    number of compartment), length, dist (distance from soma, as util.get_dist_name),
+    pathDist (distance from soma center along the tree), compId ({path: index}).
+    compDist: {path: dist} of these and of compartments not in the tree, e.g. spines.
+
+    Branches, in depth first order, so that the branches descending from branch b
+    are b+1...branchEnd[b]: branchPaths (path of first compartment), branchParent,
+    branchOrder (0 for soma), branchLength, minBranchDistance, maxBranchDistance,
+    terminal, branchId ({path of first compartment: branch number}).
+
+    A compartment starts a new branch if its parent compartment has more than one child.
+    '''
+    def __init__(self, neuron):
+        neuron.buildSegmentTree()
+        root = moose.element(neuron.compartments[0])
+        paths, parent, branch, length, dist, numChildren = [], [], [], [], [], []
+        branchParent, branchFirst, terminal = [], [], []
+        # stack of (compartment, parent index, number of children of parent), children pushed in reverse
+        # to visit them in the order of the recursive walk
+        stack = [(root, -1, 0)]
+        while stack:
+            comp, par, siblings = stack.pop()
+            i = len(paths)
+            children = [moose.element(child) for child in comp.neighbors['axialOut']]
+            paths.append(comp.path)
+            parent.append(par)
+            length.append(comp.length)
+            dist.append(util.get_dist_name(comp)[0])
+            numChildren.append(len(children))
+            if par < 0 or siblings > 1:
+                branch.append(len(branchFirst))
+                branchParent.append(branch[par] if par >= 0 else -1)
+                branchFirst.append(i)
+                terminal.append(False)
+            else:
+                branch.append(branch[par])
+            terminal[branch[i]] = len(children) == 0
+            for child in reversed(children):
+                stack.append((child, i, len(children)))
+        self.paths = np.array(paths)
+        self.parent = np.array(parent, dtype=int)
+        self.branch = np.array(branch, dtype=int)
+        self.length = np.array(length)
+        self.dist = np.array(dist)
+        self.compId = {path: i for i, path in enumerate(paths)}
+        self.compDist = {comp.path: util.get_dist_name(comp)[0]
+                         for comp in moose.wildcardFind(neuron.path + '/##[ISA=CompartmentBase]')
+                         if comp.path not in self.compId}
+        self.compDist.update(zip(paths, dist))
+        self.pathDist = np.zeros(len(paths))
+        for i in range(1, len(paths)):
+            self.pathDist[i] = self.pathDist[parent[i]] + (length[parent[i]] + length[i]) / 2
+        self.branchPaths = self.paths[branchFirst]
+        self.branchParent = np.array(branchParent, dtype=int)
+        self.terminal = np.array(terminal, dtype=bool)
+        self.branchId = {path: b for b, path in enumerate(self.branchPaths)}
+        numBranches = len(branchFirst)
+        self.branchOrder = np.zeros(numBranches, dtype=int)
+        for b in range(1, numBranches):
+            self.branchOrder[b] = self.branchOrder[self.branchParent[b]] + 1
+        self.branchLength = np.bincount(self.branch, weights=self.length, minlength=numBranches)
+        first = np.array(branchFirst, dtype=int)
+        self.minBranchDistance = self.dist[first] - self.length[first] / 2
+        self.maxBranchDistance = self.minBranchDistance + self.branchLength
+        self.branchEnd = np.arange(numBranches)
+        for b in range(numBranches - 1, 0, -1):
+            p = self.branchParent[b]
+            self.branchEnd[p] = max(self.branchEnd[p], self.branchEnd[b])
+        self.numCompartments = len(neuron.compartments)
+
+    def branchPath(self, b):
+        '''Paths of first compartments of branches from soma to branch b'''
+        ancestors = [b]
+        while self.branchParent[ancestors[-1]] >= 0:
+            ancestors.append(self.branchParent[ancestors[-1]])
+        return [str(self.branchPaths[a]) for a in reversed(ancestors)]
+
+    def descendants(self, b):
+        '''Boolean array of branches descending from branch b, including b'''
+        ids = np.arange(len(self.branchPaths))
+        return (ids >= b) & (ids <= self.branchEnd[b])
+
+
+#BranchIndex of each neuron, by path; rebuilt if compartments are added
+_branchIndex = {}
+
+def branchIndex(neuron, rebuild=False):
+    '''BranchIndex of neuron, built on first use'''
+    index = _branchIndex.get(neuron.path)
+    if rebuild or index is None or index.numCompartments != len(neuron.compartments):
+        index = _branchIndex[neuron.path] = BranchIndex(neuron)
+    return index
+
+
 def getBranchDict(neuron):
     '''Return a {BranchNameString: {CompList: [CompartmentsInBranchList],
                                     BranchPath: [Soma,Primary,...CurrentBranch],
@@ -173,60 +268,30 @@ def getBranchDict(neuron):
 
     Neuron must be an instance of class Moose.Neuron
     '''
+    index = branchIndex(neuron)
+    order = np.argsort(index.branch, kind='stable')
+    compLists = np.split(index.paths[order], np.cumsum(np.bincount(index.branch))[:-1])
     branchDict={}
-    neuron.buildSegmentTree()
-    #lastbranchpoint=''
-    def recursiveBranch(comp,lastbranchpoint):
-        nonlocal branchDict
-        children = comp.neighbors['axialOut']
-        if not comp.path==lastbranchpoint: # Do this if we are not at the root, soma, compartment
-            parentComp = comp.neighbors['handleAxial'][0]
-            parentCompChildren = moose.element(parentComp).neighbors['axialOut']
-        else: # Do this only the first time for the root soma compartment
-            parentCompChildren = children
-            lastbranchpoint = comp.path
-        if len(parentCompChildren)>1: # This is the first compartment of a branch
-            if not comp.path==lastbranchpoint: # Do this for all except soma
-                branchDict[comp.path] = {'BranchPath':lastbranchpoint+[comp.path]}
-            else: # Do this for Soma
-                branchDict[comp.path] = {'BranchPath':[comp.path]}
-            branchDict[comp.path]['BranchOrder']=len(branchDict[comp.path]['BranchPath'])-1
-            branchDict[comp.path]['CompList'] = [comp.path]
-            branchDict[comp.path]['BranchLength'] = comp.length
-            
-            dist,name = util.get_dist_name(comp)
-            branchDict[comp.path]['MinBranchDistance'] = dist-comp.length/2
-            branchDict[comp.path]['MaxBranchDistance'] = dist+comp.length/2
-                        
-            lastbranchpoint = branchDict[comp.path]['BranchPath']
-        elif len(parentCompChildren)==1: # This is an additional compartment of lastbranchpoint, just append to comp list
-            branchDict[lastbranchpoint[-1]]['CompList'].append(comp.path)
-            branchDict[lastbranchpoint[-1]]['BranchLength'] += comp.length
-            branchDict[lastbranchpoint[-1]]['MaxBranchDistance'] += comp.length
-
-        if len(children)==0: #This is a terminal compartment
-            branchDict[lastbranchpoint[-1]]['Terminal'] = True
-        else:
-            branchDict[lastbranchpoint[-1]]['Terminal'] = False
-
-        for child in children: # Loop recursively through all children compartments
-            n = moose.element(child)
-            #print(branchDict)
-            recursiveBranch(n,lastbranchpoint)
-    recursiveBranch(moose.element(neuron.compartments[0]),moose.element(neuron.compartments[0]).path)
+    for b, path in enumerate(index.branchPaths):
+        branchDict[str(path)] = {'BranchPath': index.branchPath(b),
+                                 'BranchOrder': int(index.branchOrder[b]),
+                                 'CompList': [str(comp) for comp in compLists[b]],
+                                 'BranchLength': index.branchLength[b],
+                                 'MinBranchDistance': index.minBranchDistance[b],
+                                 'MaxBranchDistance': index.maxBranchDistance[b],
+                                 'Terminal': bool(index.terminal[b])}
     return branchDict
 
 
 def mapCompartmentToBranch(neuron):
-    bd = getBranchDict(neuron)
+    index = branchIndex(neuron)
     compToBranchDict={}
     for comp in neuron.compartments:
-        for k,v in bd.items():
-                if comp.path in bd[k]['CompList']:
-                    compToBranchDict[comp.path]={'Branch':k}
-                    compToBranchDict[comp.path]['BranchOrder']=bd[k]['BranchOrder']
-                    compToBranchDict[comp.path]['Terminal']=bd[k]['Terminal']
-                    compToBranchDict[comp.path]['BranchPath']=bd[k]['BranchPath']
+        b = index.branch[index.compId[comp.path]]
+        compToBranchDict[comp.path]={'Branch':str(index.branchPaths[b])}
+        compToBranchDict[comp.path]['BranchOrder']=int(index.branchOrder[b])
+        compToBranchDict[comp.path]['Terminal']=bool(index.terminal[b])
+        compToBranchDict[comp.path]['BranchPath']=index.branchPath(b)
     return compToBranchDict
 
 
@@ -239,27 +304,27 @@ def getBranchesOfOrder(neuron,order,n=1,commonParentOrder=0, min_length = None,
     If order is None, then branches selected from any order (but with commonParent if
     commonParentOrder not 0).
     '''
-    bd = getBranchDict(neuron)
+    index = branchIndex(neuron)
     if commonParentOrder != 0:
         commonParentBranch = getBranchesOfOrder(neuron,commonParentOrder)[0]
+        select = index.descendants(index.branchId[commonParentBranch])
     else:
-        commonParentBranch = neuron.compartments[0].path
+        select = np.ones(len(index.branchPaths), dtype=bool)
     if order == -1:
-        branchesOfOrder = [branch for branch in bd.keys() if bd[branch]['Terminal'] == True and commonParentBranch in bd[branch]['BranchPath']]
-    elif order is None:
-        branchesOfOrder = [branch for branch in bd.keys() if commonParentBranch in bd[branch]['BranchPath']]
-    else:
-        branchesOfOrder = [branch for branch in bd.keys() if order == bd[branch]['BranchOrder'] and commonParentBranch in bd[branch]['BranchPath']]
-    
+        select &= index.terminal
+    elif order is not None:
+        select &= index.branchOrder == order
+
     if min_length is not None:
-        branchesOfOrder = [branch for branch in branchesOfOrder if bd[branch]['BranchLength'] > min_length]
-    
+        select &= index.branchLength > min_length
+
     if min_path_length is not None:
-        branchesOfOrder = [branch for branch in branchesOfOrder if bd[branch]['MinBranchDistance'] <= min_path_length]
-    
+        select &= index.minBranchDistance <= min_path_length
+
     if max_path_length is not None:
-        branchesOfOrder = [branch for branch in branchesOfOrder if bd[branch]['MaxBranchDistance'] >= max_path_length]
-    
+        select &= index.maxBranchDistance >= max_path_length
+
+    branchesOfOrder = [str(branch) for branch in index.branchPaths[select]]
     if n in ['all','All','ALL']:
         return branchesOfOrder
     else:
@@ -271,15 +336,58 @@ def temporalMapping(inputList, minTime = 0, maxTime = 0, random = True):
     for input in inputList:
         input.delay = np.random.uniform(minTime, maxTime)
 
-def createTimeTables(inputList,model,n_per_syn=1,start_time=0.05,freq=500.0):
-    from moose_nerp.prototypes import connect
+def sequentialPattern(inputList,n_per_syn=1,start_time=0.05,freq=500.0):
+    '''{input path: spike times}, inputs activated one after the other at freq, n_per_syn times each'''
     num = len(inputList)
-    for i,input in enumerate(inputList):
-        sh = moose.element(input.path+'/SH')
-        tt = moose.TimeTable(input.path+'/tt')
-        tt.vector = [start_time+i*1./freq + j*num*1./freq for j in range(n_per_syn)]
-        #print(tt.vector)
-        connect.synconn(sh.path,False,tt,model.param_syn,mindel=0)
+    return {input.path: [start_time+i*1./freq + j*num*1./freq for j in range(n_per_syn)]
+            for i,input in enumerate(inputList)}
+
+
+class InputPool(object):
+    '''TimeTables connected once to a set of candidate synapses (SynChans with SH),
+    to run one neuron with many spatiotemporal input patterns without rebuilding it.
+    A pattern is a {synchan path (or element): spike times} dictionary; synapses not in
+    the pattern receive no input.
+
+    Example, after building the neuron and its output tables:
+        pool = InputPool(generateElementList(neuron, ...), model)
+        for inputs in patterns:
+            pool.run(sequentialPattern(inputs, n_per_syn=3), simtime)
+            ...read the output tables...
+    '''
+    def __init__(self, inputList, model, mindel=0):
+        from moose_nerp.prototypes import connect
+        self.tables = {}
+        for input in inputList:
+            tt = moose.TimeTable(input.path+'/tt')
+            tt.vector = []
+            connect.synconn(moose.element(input.path+'/SH').path,False,tt,model.param_syn,mindel=mindel)
+            self.tables[input.path] = tt
+        self.active = set()
+
+    def setPattern(self,pattern):
+        '''rewrite the spike times of the time tables of pattern, and clear those of the previous pattern'''
+        pattern = {getattr(input,'path',input): times for input,times in pattern.items()}
+        unknown = set(pattern) - set(self.tables)
+        if unknown:
+            raise ValueError('inputs not in InputPool: {}'.format(sorted(unknown)))
+        for path in self.active - set(pattern):
+            self.tables[path].vector = []
+        for path,times in pattern.items():
+            self.tables[path].vector = np.sort(np.asarray(times,dtype=float))
+        self.active = set(pattern)
+
+    def run(self,pattern,simtime):
+        '''set pattern, reinit (which also rewinds the time tables) and simulate'''
+        self.setPattern(pattern)
+        moose.reinit()
+        moose.start(simtime)
+
+
+def createTimeTables(inputList,model,n_per_syn=1,start_time=0.05,freq=500.0):
+    pool = InputPool(inputList,model)
+    pool.setPattern(sequentialPattern(inputList,n_per_syn,start_time,freq))
+    return pool
 
 def exampleClusteredDistal(model, nInputs = 5):
     for neuron in model.neurons.values():
@@ -0,0 +1,188 @@
+"""\
+Ragged spike-train container: all spike times in one flat float64 array, times, and the
+start of each train in offsets, so that train k is times[offsets[k]:offsets[k+1]].
+Saved as an uncompressed npz file (no pickle), whose arrays are memory-mapped by load,
+so a train is read without reading the others.
+
+Optional names (one row of strings per train) label trains saved from nested dictionaries,
+e.g. {syntype: {pretype: {branch: spike times}}} (save_nested, load_nested).
+convert writes the container for an npz file of an object array of trains (spikeTime).
+SharedPool copies the trains of several files to one shared memory block, created by a parent
+process, which worker processes attach without copying (attach).
+"""
+from __future__ import print_function, division
+import os
+import struct
+import tempfile
+import zipfile
+import numpy as np
+
+#suffix of converted files: FullTrialLowVariability.npz -> FullTrialLowVariability_trains.npz
+TRAINS_SUFFIX = '_trains.npz'
+
+class SpikeTrains(object):
+    def __init__(self, times, offsets, names=None):
+        self.times = times
+        self.offsets = offsets
+        self.names = names
+
+    @classmethod
+    def from_trains(cls, trains, names=None):
+        times = np.concatenate([np.asarray(train, dtype=np.float64).ravel() for train in trains] + [np.zeros(0)])
+        offsets = np.concatenate([[0], np.cumsum([np.size(train) for train in trains])]).astype(np.int64)
+        return cls(times, offsets, names)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, k):
+        #view of train k, no copy
+        return self.times[self.offsets[k]:self.offsets[k + 1]]
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self[k]
+
+    def save(self, filename):
+        #written to a temporary file and renamed, since other processes may be reading the file
+        arrays = {'times': self.times, 'offsets': self.offsets}
+        if self.names is not None:
+            arrays['names'] = np.asarray(self.names, dtype=str)
+        fd, tmpname = tempfile.mkstemp(suffix='.npz', dir=os.path.dirname(os.path.abspath(filename)))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmpname, filename)
+        except BaseException:
+            os.remove(tmpname)
+            raise
+
+def _memmap_member(filename, name):
+    #memory-map an array stored uncompressed in an npz file, None if compressed
+    with zipfile.ZipFile(filename) as zf:
+        info = zf.getinfo(name + '.npy')
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    with open(filename, 'rb') as f:
+        #local file header: 30 bytes, then file name and extra field
+        f.seek(info.header_offset)
+        name_len, extra_len = struct.unpack('<HH', f.read(30)[26:30])
+        f.seek(info.header_offset + 30 + name_len + extra_len)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    if dtype.hasobject:
+        return None
+    if not np.prod(shape):
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=shape,
+                     order='F' if fortran_order else 'C')
+
+def is_ragged(filename):
+    with np.load(filename) as data:
+        return 'times' in data.files and 'offsets' in data.files
+
+def load(filename, mmap=True):
+    times = _memmap_member(filename, 'times') if mmap else None
+    with np.load(filename) as data:
+        if times is None:
+            times = data['times']
+        offsets = data['offsets']
+        names = data['names'] if 'names' in data.files else None
+    return SpikeTrains(times, offsets, names)
+
+def convert(npzfile, filename=None, key='spikeTime'):
+    #convert npz file with object array of trains to a spike train container, returns its filename
+    if filename is None:
+        filename = npzfile[:-len('.npz')] + TRAINS_SUFFIX if npzfile.endswith('.npz') else npzfile + TRAINS_SUFFIX
+    with np.load(npzfile, encoding='latin1', allow_pickle=True) as data:
+        SpikeTrains.from_trains(data[key]).save(filename)
+    return filename
+
+def converted(npzfile, key='spikeTime'):
+    #spike train container of npzfile: the file itself if already ragged, else its converted file,
+    #(re)converted if missing or older than npzfile; None if it cannot be written
+    if is_ragged(npzfile):
+        return npzfile
+    filename = npzfile[:-len('.npz')] + TRAINS_SUFFIX
+    if os.path.exists(filename) and os.path.getmtime(filename) >= os.path.getmtime(npzfile):
+        return filename
+    try:
+        return convert(npzfile, filename, key)
+    except (IOError, OSError):
+        return None
+
+def from_file(filename, key='spikeTime'):
+    #spike trains of filename (without .npz), memory-mapped from its converted container,
+    #or in memory if the container cannot be written
+    store = converted(filename + '.npz', key)
+    if store is not None:
+        return load(store)
+    print('cannot convert', filename, 'trains not memory-mapped')
+    with np.load(filename + '.npz', encoding='latin1', allow_pickle=True) as data:
+        return SpikeTrains.from_trains(data[key])
+
+class SharedPool(object):
+    #spike trains of several sources (dictionary key: SpikeTrains) in one shared memory block;
+    #handle is passed to worker processes, e.g. as Pool initargs, for attach
+    def __init__(self, sources):
+        from multiprocessing import shared_memory
+        self.layout = {}
+        size = 0
+        for key, trains in sources.items():
+            self.layout[key] = (size, len(trains.times), len(trains.offsets))
+            size += 8 * (len(trains.times) + len(trains.offsets))
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for key, trains in _views(self.shm, self.layout).items():
+            trains.times[:] = sources[key].times
+            trains.offsets[:] = sources[key].offsets
+
+    def handle(self):
+        return self.shm.name, self.layout
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+def _views(shm, layout):
+    sources = {}
+    for key, (start, num_times, num_offsets) in layout.items():
+        times = np.ndarray(num_times, dtype=np.float64, buffer=shm.buf, offset=start)
+        offsets = np.ndarray(num_offsets, dtype=np.int64, buffer=shm.buf, offset=start + 8 * num_times)
+        sources[key] = SpikeTrains(times, offsets)
+    return sources
+
+def attach(handle):
+    #attach the shared memory of SharedPool.handle(); returns the shared memory, which must be
+    #kept while the trains are used, and the dictionary of SpikeTrains, views of the shared memory
+    from multiprocessing import shared_memory
+    name, layout = handle
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, _views(shm, layout)
+
+def _flatten(nested, prefix=()):
+    for key in sorted(nested.keys()):
+        if isinstance(nested[key], dict):
+            for item in _flatten(nested[key], prefix + (key,)):
+                yield item
+        else:
+            yield prefix + (key,), nested[key]
+
+def save_nested(filename, nested):
+    #nested dictionary of spike trains, all at the same depth
+    items = list(_flatten(nested))
+    names = np.array([list(names) for names, train in items], dtype=str)
+    SpikeTrains.from_trains([train for names, train in items], names).save(filename)
+
+def load_nested(filename, mmap=True):
+    trains = load(filename, mmap)
+    nested = {}
+    for k, names in enumerate(trains.names if trains.names is not None else []):
+        level = nested
+        for name in names[:-1]:
+            level = level.setdefault(str(name), {})
+        level[str(names[-1])] = trains[k]
+    return nested
@@ -0,0 +1,206 @@
+"""\
+Gate table resolution: finds, for each channel of model.Channels, the smallest table size (VDIVS
+for voltage, CADIVS for calcium) whose steady state (tableA/tableB) and time constant (1/tableB),
+linearly interpolated as by the hsolve lookup tables, stay within a tolerance of the analytic
+forms used by chan_proto.  Voltage gate tables are evaluated as chan_proto makes them, including
+the lines of chan_proto.fix_singularities, which replace a fixed number of table entries (so a
+voltage range that shrinks with VDIVS) around each singularity.
+The steady state error is absolute (inf_tol), the time constant error is relative (tau_tol).
+The model tables must be large enough for every channel, so the recommendation is the largest
+size needed by any channel; tables of 2D (BK) channels are tuned along each axis with half the
+tolerance, since errors of bilinear interpolation add.
+Table sizes follow the convention of chan_proto for each gate: DIVS is the number of intervals of
+gates made by setupAlpha and setupTau, and the number of points of tables filled at
+np.linspace(lo, hi, DIVS) (calcium, sigmoid and 2D gates).
+
+   tuning = table_resolution.tune_model(model)
+   table_resolution.report(tuning)
+   table_resolution.write_params(model, tuning)   #writes VDIVS and CADIVS into param_chan.py
+"""
+from __future__ import print_function, division
+import os
+import re
+import copy
+import types
+import numpy as np
+
+from moose_nerp.prototypes import chan_proto, logutil
+log = logutil.Logger()
+
+INF_TOL = 1e-3
+TAU_TOL = 1e-2
+MIN_DIVS = 8
+MAX_DIVS = 2 ** 16
+#positions within each table interval at which the interpolation error is evaluated
+FRACTIONS = np.array([0.25, 0.5, 0.75])
+#number of values of the other axis at which 2D tables are evaluated
+SAMPLES = 65
+#half width (volts) around a singularity within which the analytic rates are interpolated, avoiding 0/0
+SINGULAR_WINDOW = 1e-6
+BYTES = 8
+
+def moose_rate(v, rate, B, C, vhalf, vslope):
+    #(rate + B*v)/(C + exp((v+vhalf)/vslope)), the form used by HHGate setupAlpha and setupTau
+    def f(v):
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            return (rate + B * v) / (C + np.exp((v + vhalf) / vslope))
+    y = f(v)
+    if C < 0:
+        v0 = vslope * np.log(-C) - vhalf
+        near = np.abs(v - v0) < SINGULAR_WINDOW
+        if np.any(near):
+            edges = np.array([v0 - SINGULAR_WINDOW, v0 + SINGULAR_WINDOW])
+            y = np.where(near, np.interp(v, edges, f(edges)), y)
+    return y
+
+def gate_rates(params, x):
+    #analytic tableA and tableB of a gate at x (voltage, or calcium for ZChannelParams)
+    if isinstance(params, chan_proto.AlphaBetaChannelParams):
+        alpha = moose_rate(x, *params[:5])
+        return alpha, alpha + moose_rate(x, *params[5:])
+    if isinstance(params, chan_proto.StandardMooseTauInfChannelParams):
+        tau = moose_rate(x, *params[:5])
+        return moose_rate(x, *params[5:]) / tau, 1 / tau
+    if isinstance(params, chan_proto.TauInfMinChannelParams):
+        tau_func = chan_proto.quadratic if params.T_power == 2 else chan_proto.sigmoid
+        tau = tau_func(x, params.T_min, params.T_vdep, params.T_vhalf, params.T_vslope)
+        minf = chan_proto.sigmoid(x, params.SS_min, params.SS_vdep, params.SS_vhalf, params.SS_vslope)
+        return minf / tau, 1 / tau
+    if isinstance(params, chan_proto.ZChannelParams):
+        return chan_proto.Z_gate_tables(params, x)
+    raise ValueError('unknown gate parameters {}'.format(params))
+
+def linspace_table(params):
+    #True if chan_proto fills the tables of a gate (or 2D channel) at np.linspace(lo, hi, DIVS), so that
+    #DIVS is the number of points; False if DIVS is the number of intervals (setupAlpha, setupTau)
+    return isinstance(params, (chan_proto.ZChannelParams, chan_proto.TauInfMinChannelParams, chan_proto.TwoD))
+
+def gate_table(model, params, v):
+    #tableA and tableB of a voltage gate as made by chan_proto.make_gate with table points v, from
+    #model.VMIN to model.VMAX: gate_rates, with the singularities fixed by chan_proto.fix_singularities
+    A, B = gate_rates(params, v)
+    if not isinstance(params, chan_proto.AlphaBetaChannelParams):
+        return A, B
+    gate = types.SimpleNamespace(tableA=np.array(A), tableB=np.array(B))
+    #fix_singularities may change the parameters
+    chan_proto.fix_singularities(model, copy.deepcopy(params), gate)
+    return gate.tableA, gate.tableB
+
+def interpolation_error(rates, lo, hi, divs, table=None):
+    #largest steady state (absolute) and time constant (relative) error of a table of divs intervals
+    #from lo to hi, linearly interpolated; rates(x) gives tableA and tableB, x along the first axis;
+    #table(x) gives the table values at the table points, if not rates(x)
+    nodes = np.linspace(lo, hi, divs + 1)
+    x = (nodes[:-1, np.newaxis] + (nodes[1] - nodes[0]) * FRACTIONS).ravel()
+    idx = np.repeat(np.arange(divs), len(FRACTIONS))
+    A, B = [np.asarray(t) for t in (table or rates)(nodes)]
+    a, b = [np.asarray(t) for t in rates(x)]
+    frac = np.tile(FRACTIONS, divs).reshape((-1,) + (1,) * (A.ndim - 1))
+    Ai = A[idx] * (1 - frac) + A[idx + 1] * frac
+    Bi = B[idx] * (1 - frac) + B[idx + 1] * frac
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inf_err = np.nanmax(np.abs(Ai / Bi - a / b))
+        tau_err = np.nanmax(np.abs(b / Bi - 1))
+    return inf_err, tau_err
+
+def smallest_divs(rates, lo, hi, inf_tol=INF_TOL, tau_tol=TAU_TOL, points=False, table=None):
+    #smallest number of table intervals (or points, if points) within tolerance, by doubling and then
+    #bisection, assuming that the error decreases with the table size
+    def within(divs):
+        inf_err, tau_err = interpolation_error(rates, lo, hi, divs, table)
+        return inf_err <= inf_tol and tau_err <= tau_tol
+    good = MIN_DIVS
+    while not within(good):
+        if good >= MAX_DIVS:
+            log.warning('gate tables exceed tolerance with {} divisions', MAX_DIVS)
+            return MAX_DIVS + 1 if points else MAX_DIVS
+        good *= 2
+    bad = good // 2 if good > MIN_DIVS else 0
+    while good - bad > 1:
+        mid = (good + bad) // 2
+        if within(mid):
+            good = mid
+        else:
+            bad = mid
+    return good + 1 if points else good
+
+def tune_channel(model, params, inf_tol=INF_TOL, tau_tol=TAU_TOL):
+    #smallest VDIVS and CADIVS of a channel (None if the channel has no table on that axis)
+    divs = {'VDIVS': None, 'CADIVS': None}
+    if isinstance(params, chan_proto.TwoD):
+        v_samples = np.linspace(model.VMIN, model.VMAX, SAMPLES)
+        ca_samples = np.linspace(model.CAMIN, model.CAMAX, SAMPLES)
+        v_rates = lambda v: chan_proto.BK_gating_matrix(model, params, v, ca_samples)
+        ca_rates = lambda ca: [m.T for m in chan_proto.BK_gating_matrix(model, params, v_samples, ca)]
+        divs['VDIVS'] = smallest_divs(v_rates, model.VMIN, model.VMAX, inf_tol / 2, tau_tol / 2, True)
+        divs['CADIVS'] = smallest_divs(ca_rates, model.CAMIN, model.CAMAX, inf_tol / 2, tau_tol / 2, True)
+        return divs
+    for gate, power in (('X', params.channel.Xpow), ('Y', params.channel.Ypow), ('Z', params.channel.Zpow)):
+        if power <= 0:
+            continue
+        gate_params = getattr(params, gate)
+        if isinstance(gate_params, chan_proto.ZChannelParams):
+            key, lo, hi, table = 'CADIVS', model.CAMIN, model.CAMAX, None
+        else:
+            key, lo, hi, table = 'VDIVS', model.VMIN, model.VMAX, lambda v: gate_table(model, gate_params, v)
+        needed = smallest_divs(lambda x: gate_rates(gate_params, x), lo, hi, inf_tol, tau_tol,
+                               linspace_table(gate_params), table)
+        divs[key] = max(divs[key] or 0, needed)
+    return divs
+
+def table_bytes(params, VDIVS, CADIVS):
+    #memory of tableA and tableB of all gates of a channel
+    if isinstance(params, chan_proto.TwoD):
+        return 2 * BYTES * VDIVS * CADIVS
+    entries = 0
+    for gate, power in (('X', params.channel.Xpow), ('Y', params.channel.Ypow), ('Z', params.channel.Zpow)):
+        if power > 0:
+            gate_params = getattr(params, gate)
+            divs = CADIVS if isinstance(gate_params, chan_proto.ZChannelParams) else VDIVS
+            entries += divs if linspace_table(gate_params) else divs + 1
+    return 2 * BYTES * entries
+
+def tune_model(model, inf_tol=INF_TOL, tau_tol=TAU_TOL):
+    #table sizes needed by each channel of model.Channels, recommended VDIVS and CADIVS (for the
+    #current table ranges), and table memory (bytes per channel prototype) with the current and
+    #recommended sizes
+    channels = {name: tune_channel(model, params, inf_tol, tau_tol) for name, params in model.Channels.items()}
+    tuning = {'channels': channels}
+    for key in ('VDIVS', 'CADIVS'):
+        needed = [divs[key] for divs in channels.values() if divs[key] is not None]
+        tuning[key] = max(needed) if needed else getattr(model, key)
+    for name, params in model.Channels.items():
+        channels[name]['bytes'] = table_bytes(params, model.VDIVS, model.CADIVS)
+        channels[name]['tuned_bytes'] = table_bytes(params, tuning['VDIVS'], tuning['CADIVS'])
+    tuning['current'] = {key: getattr(model, key) for key in ('VDIVS', 'CADIVS')}
+    tuning['bytes'] = sum(divs['bytes'] for divs in channels.values())
+    tuning['tuned_bytes'] = sum(divs['tuned_bytes'] for divs in channels.values())
+    return tuning
+
+def report(tuning):
+    print('GATE TABLES: {:12s} {:>8s} {:>8s} {:>12s} {:>12s}'.format('channel', 'VDIVS', 'CADIVS', 'MB now', 'MB tuned'))
+    for name, divs in tuning['channels'].items():
+        print('             {:12s} {:>8} {:>8} {:12.3f} {:12.3f}'.format(name, str(divs['VDIVS'] or '-'),
+              str(divs['CADIVS'] or '-'), divs['bytes'] / 1e6, divs['tuned_bytes'] / 1e6))
+    print('   VDIVS {} -> {}, CADIVS {} -> {}, memory {:.3f} -> {:.3f} MB per prototype'.format(
+        tuning['current']['VDIVS'], tuning['VDIVS'], tuning['current']['CADIVS'], tuning['CADIVS'],
+        tuning['bytes'] / 1e6, tuning['tuned_bytes'] / 1e6))
+
+def write_params(model, tuning, filename=None, keys=('VDIVS', 'CADIVS')):
+    #replace the values of keys in the param_chan.py file of model (or filename) by the recommendation;
+    #only lines of the form KEY = value are changed, comments are kept
+    if filename is None:
+        filename = os.path.join(os.path.dirname(model.__file__), 'param_chan.py')
+    with open(filename, newline='') as f:
+        text = f.read()
+    changed = []
+    for key in keys:
+        if tuning[key] == tuning['current'][key]:
+            continue
+        text, num = re.subn(r'^({}\s*=\s*)[-+.0-9eE]+'.format(key), r'\g<1>{}'.format(tuning[key]), text, flags=re.M)
+        if num:
+            changed.append(key)
+    with open(filename, 'w', newline='') as f:
+        f.write(text)
+    print('{}: {}'.format(filename, ', '.join('{} = {}'.format(key, tuning[key]) for key in changed) or 'unchanged'))
+    return changed
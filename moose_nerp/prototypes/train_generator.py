@@ -0,0 +1,139 @@
+"""\
+Spike trains for extern inputs generated in the simulation process, instead of the npz files
+of the synth_trains scripts.  A TrainSpec can be given to TableSet in place of a filename.
+
+Processes (TrainSpec.process):
+   poisson: exponential ISIs; if osc_depth > 0, the rate is modulated by thinning:
+            rate*(1 + osc_depth*sin(2*pi*osc_freq*t + osc_phase))
+   gamma: gamma distributed ISIs with shape parameter shape (shape=1 is poisson)
+   lognormal: lognormal ISIs, sigma is the standard deviation of log(ISI)
+   corr > 0 (poisson only): each train is a random thinning, with probability corr, of a common
+            mother process of rate rate/corr, giving pairwise correlation corr between trains
+
+Trains are generated in blocks of TrainSpec.block sec, all trains at once.  The random numbers
+of each block are drawn from a generator keyed by (seed, block), so that the trains are
+reproducible whether they are generated at once (generate) or streamed in chunks (chunks).
+If seed is a list with one seed per train, each train is generated separately, and does not
+depend on the number of trains or on the other seeds.
+"""
+from __future__ import print_function, division
+import numpy as np
+
+from moose_nerp.prototypes import spike_trains
+from moose_nerp.prototypes.util import NamedList
+
+TrainSpec = NamedList('TrainSpec', '''process
+                                   num_trains
+                                   duration
+                                   rate
+                                   shape=1.0
+                                   sigma=1.0
+                                   osc_freq=0
+                                   osc_depth=0
+                                   osc_phase=0
+                                   corr=0
+                                   seed=None
+                                   block=1.0''')
+
+PROCESSES = ('poisson', 'gamma', 'lognormal')
+#spawn key of the mother process of correlated trains, distinct from block numbers
+MOTHER_KEY = 2 ** 31
+
+def _rng(seed, block, mother=False):
+    spawn_key = (MOTHER_KEY, block) if mother else (block,)
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=spawn_key))
+
+def _isi(rng, spec, rate, size):
+    if spec.process == 'poisson':
+        return rng.exponential(1.0 / rate, size)
+    if spec.process == 'gamma':
+        return rng.gamma(spec.shape, 1.0 / (spec.shape * rate), size)
+    if spec.process == 'lognormal':
+        return rng.lognormal(np.log(1.0 / rate) - spec.sigma ** 2 / 2, spec.sigma, size)
+    raise ValueError('unknown spike train process ' + str(spec.process))
+
+def _modulation(spec, times):
+    #rate modulation relative to the maximum rate, for thinning
+    return (1 + spec.osc_depth * np.sin(2 * np.pi * spec.osc_freq * times + spec.osc_phase)) / (1 + spec.osc_depth)
+
+def _renewal_block(rng, spec, rate, pending, t_stop):
+    #spike times before t_stop of len(pending) trains, each starting with its pending spike
+    #returns list of arrays of spike times, and the next pending spike of each train
+    num = len(pending)
+    if not num:
+        return [], pending
+    expected = rate * (t_stop - np.min(pending))
+    cols = max(int(expected + 5 * np.sqrt(expected)) + 10, 1)
+    times = pending[:, np.newaxis] + np.concatenate([np.zeros((num, 1)), np.cumsum(_isi(rng, spec, rate, (num, cols)), axis=1)], axis=1)
+    #rarely, more ISIs are needed to reach t_stop
+    while np.any(times[:, -1] < t_stop):
+        extra = times[:, -1:] + np.cumsum(_isi(rng, spec, rate, (num, cols)), axis=1)
+        times = np.concatenate([times, extra], axis=1)
+    count = np.sum(times < t_stop, axis=1)
+    trains = [row[:n] for row, n in zip(times, count)]
+    return trains, times[np.arange(num), count]
+
+def _block(spec, seeds, block, state):
+    #spike times of all trains in one block; state holds the pending spike of each train
+    t_stop = min((block + 1) * spec.block, spec.duration)
+    #maximum rate of the modulated process, thinned by _modulation
+    rate = spec.rate * (1 + spec.osc_depth) if spec.osc_depth > 0 else spec.rate
+    if spec.corr > 0:
+        if spec.process != 'poisson':
+            raise ValueError('correlated trains require a poisson process')
+        mother_rng = _rng(seeds[0] if len(seeds) == 1 else list(seeds), block, mother=True)
+        mother, state['mother'] = _renewal_block(mother_rng, spec, rate / spec.corr, state['mother'], t_stop)
+        mother = mother[0]
+        if spec.osc_depth > 0:
+            mother = mother[mother_rng.random(len(mother)) < _modulation(spec, mother)]
+        if len(seeds) == 1:
+            keep = _rng(seeds[0], block).random((spec.num_trains, len(mother))) < spec.corr
+        else:
+            keep = np.array([_rng(seed, block).random(len(mother)) < spec.corr for seed in seeds]).reshape(-1, len(mother))
+        return [mother[k] for k in keep]
+    if spec.osc_depth > 0 and spec.process != 'poisson':
+        raise ValueError('rate modulation by thinning requires a poisson process')
+    if len(seeds) == 1:
+        rngs = [(_rng(seeds[0], block), np.arange(spec.num_trains))]
+    else:
+        rngs = [(_rng(seed, block), np.array([k])) for k, seed in enumerate(seeds)]
+    trains = [None] * spec.num_trains
+    for rng, rows in rngs:
+        block_trains, state['pending'][rows] = _renewal_block(rng, spec, rate, state['pending'][rows], t_stop)
+        for k, train in zip(rows, block_trains):
+            if spec.osc_depth > 0:
+                train = train[rng.random(len(train)) < _modulation(spec, train)]
+            trains[k] = train
+    return trains
+
+def _seeds(spec):
+    if spec.seed is None:
+        #unseeded: a random seed is drawn, so that all blocks use the same generators
+        return [int(np.random.SeedSequence().entropy)]
+    if np.ndim(spec.seed):
+        if len(spec.seed) != spec.num_trains:
+            raise ValueError('{} seeds for {} trains'.format(len(spec.seed), spec.num_trains))
+        return list(spec.seed)
+    return [spec.seed]
+
+def chunks(spec, chunk_blocks=1):
+    #iterator over (t_start, t_stop, SpikeTrains) for consecutive chunks of chunk_blocks blocks
+    if spec.process not in PROCESSES:
+        raise ValueError('unknown spike train process ' + str(spec.process))
+    seeds = _seeds(spec)
+    num_blocks = int(np.ceil(spec.duration / spec.block - 1e-9))
+    #each train starts with a spike at time 0, removed from the first block
+    state = {'pending': np.zeros(spec.num_trains), 'mother': np.zeros(1)}
+    for start in range(0, num_blocks, chunk_blocks):
+        blocks = [_block(spec, seeds, block, state) for block in range(start, min(start + chunk_blocks, num_blocks))]
+        if start == 0:
+            blocks[0] = [train[1:] if len(train) and train[0] == 0 else train for train in blocks[0]]
+        trains = [np.concatenate([b[k] for b in blocks]) for k in range(spec.num_trains)]
+        yield (start * spec.block, min((start + chunk_blocks) * spec.block, spec.duration),
+               spike_trains.SpikeTrains.from_trains(trains))
+
+def generate(spec):
+    #all trains of spec, as spike_trains.SpikeTrains
+    chunk_trains = [trains for t_start, t_stop, trains in chunks(spec, chunk_blocks=64)]
+    return spike_trains.SpikeTrains.from_trains([np.concatenate([trains[k] for trains in chunk_trains] + [np.zeros(0)])
+                                                 for k in range(spec.num_trains)])
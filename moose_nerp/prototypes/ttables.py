@@ -1,11 +1,18 @@
 # ttables.py
 # object to associate name of time tables with filename containing data
+# spike trains are converted once to a ragged container (spike_trains), which is memory-mapped;
+# time tables are created only when first connected (timetable)
 import moose
 import numpy as np
 
+from moose_nerp.prototypes import spike_trains, train_generator
+
 
 class TableSet(object):
     ALL = []
+    PATH = '/input'
+    # trains shared by a parent process (spike_trains.SharedPool), by repr of filename
+    SHARED = {}
 
     def __init__(self, tablename, filename, syn_per_tt):
         self.tablename = tablename
@@ -13,25 +20,117 @@ class TableSet(object):
         self.syn_per_tt = syn_per_tt
         self.numtt = int(0)
         self.needed = int(0)
+        self.stimtab = {}
+        self.trains = None
+        self.store_file = None
         self.ALL.append(self)
 
-    def create(self):
-        path = "/input"
-        if not moose.exists('/input'):
-            moose.Neutral('/input')
-        spike_file = np.load(self.filename + '.npz', encoding='latin1')
-        spike_times = spike_file['spikeTime']
-        self.numtt = len(spike_times)
-        print('creating', self, self.tablename, self.filename, 'AVAILABLE trains: ', self.numtt)
-        self.stimtab = []
-        for ii, stimtimes in enumerate(spike_times):
-            self.stimtab.append([moose.TimeTable('{}/{}_TimTab{}'.format(path, self.tablename, ii)), self.syn_per_tt])
-            self.stimtab[ii][0].vector = stimtimes
-            self.stimtab[ii][0].tick = 7
-        print(self.tablename, 'complete')
+    def load(self):
+        # spike trains (spike_trains.SpikeTrains), memory-mapped from the ragged container of the npz file
+        # if filename is a train_generator.TrainSpec, trains are generated, without any file
+        if self.trains is None or self.store_file != repr(self.filename):
+            self.store_file = repr(self.filename)
+            if self.store_file in self.SHARED:
+                self.trains = self.SHARED[self.store_file]
+            elif isinstance(self.filename, train_generator.TrainSpec):
+                self.trains = train_generator.generate(self.filename)
+            else:
+                self.trains = spike_trains.from_file(self.filename)
+            self.numtt = len(self.trains)
+        return self.trains
+
+    def num_trains(self):
+        # number of trains in the file, without creating the time tables
+        return len(self.load())
+
+    def train(self, ii):
+        return np.array(self.load()[ii])
+
+    def table_path(self, ii):
+        return '{}/{}_TimTab{}'.format(self.PATH, self.tablename, ii)
+
+    def timetable(self, ii):
+        # time table of train ii, created the first time it is needed
+        if ii not in self.stimtab or not moose.exists(self.table_path(ii)):
+            if not moose.exists(self.PATH):
+                moose.Neutral(self.PATH)
+            tt = moose.TimeTable(self.table_path(ii))
+            # set from the view of the train, mapped file or shared memory
+            tt.vector = self.load()[ii]
+            tt.tick = 7
+            self.stimtab[ii] = [tt, self.syn_per_tt]
+        return self.stimtab[ii][0]
+
+    def create(self, trains=None, seed=None):
+        # create time tables of trains (list of train numbers); if not given, the needed number
+        # of trains (or all trains, if needed is unknown) are chosen randomly, reproducibly by seed
+        numtt = self.num_trains()
+        if trains is None:
+            if self.needed and self.needed < numtt:
+                trains = np.sort(np.random.RandomState(seed).choice(numtt, self.needed, replace=False))
+            else:
+                trains = range(numtt)
+        print('creating', self, self.tablename, self.filename, 'AVAILABLE trains: ', numtt)
+        for ii in trains:
+            self.timetable(int(ii))
+        print(self.tablename, 'complete', len(self.stimtab), 'trains created')
 
     @classmethod
-    def create_all(cls):
+    def create_all(cls, seed=None):
         for obj in cls.ALL:
-            obj.create()
+            obj.create(seed=seed)
         print('tables created')
+
+    @classmethod
+    def find(cls, path):
+        # TableSet and train number of path given by table_path
+        for obj in cls.ALL:
+            prefix = obj.table_path('')
+            if path.startswith(prefix) and path[len(prefix):].isdigit():
+                return obj, int(path[len(prefix):])
+        raise ValueError('no TableSet for time table ' + path)
+
+    @classmethod
+    def find_timetable(cls, path):
+        # time table of path given by table_path, created if needed
+        obj, ii = cls.find(path)
+        return obj.timetable(ii)
+
+    @classmethod
+    def merged_timetables(cls, paths, name, dt=None):
+        # the spikes of all trains of paths (given by table_path, not created), in as few time tables as
+        # possible: a time table sends at most one spike per time step dt, so spikes delivered in the same
+        # step by the separate tables are put in different tables (layers), e.g. name, name_1
+        trains = [obj.load()[ii] for obj, ii in map(cls.find, paths)]
+        times = np.concatenate(trains + [np.zeros(0)])
+        if dt is None:
+            layers = [np.sort(times)]
+        else:
+            steps = np.concatenate([delivery_steps(train, dt) for train in trains] + [np.zeros(0, dtype=np.int64)])
+            # spikes delayed by the one spike per step limit are moved into the step they were delivered in
+            times = np.where(steps > first_steps(times, dt), (steps - 0.5) * dt, times)
+            order = np.lexsort((times, steps))
+            steps, times = steps[order], times[order]
+            layer = np.arange(len(steps)) - np.searchsorted(steps, steps)
+            layers = [times[layer == num] for num in range(np.max(layer, initial=0) + 1)]
+        if not moose.exists(cls.PATH):
+            moose.Neutral(cls.PATH)
+        tables = []
+        for num, layer_times in enumerate(layers):
+            tt = moose.TimeTable(cls.PATH + '/' + name + ('_{}'.format(num) if num else ''))
+            tt.vector = layer_times
+            tt.tick = 7
+            tables.append(tt)
+        return tables
+
+
+def first_steps(times, dt):
+    # first time step (of duration dt) at which a time table can send a spike at times; the first step is 1
+    return np.maximum(np.ceil(times / dt), 1).astype(np.int64)
+
+
+def delivery_steps(train, dt):
+    # time step at which a time table sends each spike of train, one spike per step at most
+    steps = first_steps(np.asarray(train), dt)
+    rank = np.arange(len(steps))
+    return rank + np.maximum.accumulate(steps - rank) if len(steps) else steps
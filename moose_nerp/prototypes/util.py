@@ -111,6 +111,82 @@ def distance_mapping(mapping, where):
     return result(dist)
 
 
+def _apply(func, dists):
+    # func of each distance; called once with the array of distances if func accepts arrays
+    try:
+        return _np.broadcast_to(func(dists), dists.shape)
+    except (TypeError, ValueError):
+        return [func(d) for d in dists]
+
+
+class DistanceMap(object):
+    """Compiled distance mapping: the intervals of the mapping (in the order used by distance_mapping)
+    as arrays of bounds, and name patterns, so that many locations are evaluated at once.
+    evaluate gives the same values as distance_mapping for each location."""
+
+    def __init__(self, mapping):
+        keys = [k for k in sorted(mapping, key=len, reverse=True) if len(k) in (2, 3)]
+        self.lo = _np.array([k[0] for k in keys], dtype=float)
+        self.hi = _np.array([k[1] for k in keys], dtype=float)
+        self.descriptions = [k[2] if len(k) == 3 else '' for k in keys]
+        self.values = [mapping[k] for k in keys]
+        # if values are numbers or functions of distance, results are numbers (integers if all values are)
+        values = [v for v in self.values if v is not None]
+        self.numeric = all(isinstance(v, _numbers.Number) or callable(v) for v in values)
+        self.dtype = int if all(isinstance(v, _numbers.Integral) for v in values) else float
+
+    def match(self, dists, names):
+        # index of the first interval containing each location, -1 if none
+        dists = _np.asarray(dists, dtype=float)
+        inside = (self.lo[:, None] <= dists) & (dists < self.hi[:, None])
+        names = _np.asarray(names, dtype=str)
+        for i, description in enumerate(self.descriptions):
+            if description:
+                inside[i] &= _np.char.startswith(names, description) | _np.char.endswith(names, description)
+        return _np.where(inside.any(axis=0), inside.argmax(axis=0), -1)
+
+    def evaluate(self, dists, names=None):
+        # values at distances dists of locations with names (empty if not given)
+        dists = _np.asarray(dists, dtype=float)
+        if names is None:
+            names = [''] * len(dists)
+        idx = self.match(dists, names)
+        result = _np.zeros(len(dists), dtype=self.dtype if self.numeric else object)
+        for i, value in enumerate(self.values):
+            sel = idx == i
+            if not value or not sel.any():
+                continue
+            if callable(value):
+                result[sel] = _apply(value, dists[sel])
+            elif self.numeric:
+                result[sel] = value
+            else:
+                for j in _np.flatnonzero(sel):
+                    result[j] = value
+        return result
+
+    def at(self, comp):
+        # value in one compartment
+        value = self.evaluate(*locations([comp]))[0]
+        return value.item() if isinstance(value, _np.generic) else value
+
+
+def locations(comps):
+    # distances (from the origin, as get_dist_name) and names of compartments
+    dist_names = [get_dist_name(comp) for comp in comps]
+    return _np.array([d for d, n in dist_names], dtype=float), [n for d, n in dist_names]
+
+
+def distance_matrix(mappings, comps):
+    # values of each mapping of mappings (columns, e.g. channels of Condset[ntype]) in each
+    # compartment of comps (rows), in one pass
+    dists, names = locations(comps)
+    columns = [DistanceMap(mapping).evaluate(dists, names) for mapping in mappings.values()]
+    if not columns:
+        return _np.zeros((len(dists), 0))
+    return _np.column_stack(columns)
+
+
 try:
     from __builtin__ import execfile
 except ImportError:
@@ -4,9 +4,11 @@ from .param_net import (netname,
                         cond_vel,
                         mindelay,
                         confile,
+                        edgefile,
                         outfile,
                         grid,
-                        chanvar)
+                        chanvar,
+                        chanvar_dend)
 
 ###########plotting control 
 plot_netvm = 1
@@ -7,6 +7,8 @@ neur_distr = NamedList('neur_distr', 'neuronname spacing percent')
 
 netname = '/striatum'
 confile = 'striatum_connect'
+#HDF5 file of connections (see edge_io), None to save only confile
+edgefile = None
 outfile = 'striatum_out'
 
 spacing = 25e-6
@@ -44,12 +46,15 @@ chanvar = {
     'D1': chanvarSPN,
     # 'D2':chanvarSPN,
 }
+#if True, channel variability is applied to all compartments, not only the soma
+chanvar_dend = False
 
 ####################### Connections
 dend_location = NamedList('dend_location',
                           'mindist=0 maxdist=1 maxprob=None half_dist=None steep=0 postsyn_fraction=None')
 connect = NamedList('connect', 'synapse pre post num_conns=2 space_const=None probability=None dend_loc=None stp=None')
-ext_connect = NamedList('ext_connect', 'synapse pre post dend_loc=None stp=None')
+# aggregate=True: trains to one synchan are merged into one time table and synapse (connect_plan.merged_edges)
+ext_connect = NamedList('ext_connect', 'synapse pre post dend_loc=None stp=None aggregate=False')
 
 # add post_location to both of these - optionally specify e.g. prox vs distal for synapses
 
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from moose_nerp.prototypes import connect_plan
+
+
+@pytest.fixture
+def make_plan():
+    # plan of three neurons along x, D1_0, D1_1 and D2_2, and one time table (node 3), with
+    # edges given by the arrays (or scalars) of connect_plan.make_edges; connection 0 is D1/gaba/D1
+    def make(pre, post, syn, delay, weight, dist):
+        edges = connect_plan.make_edges(np.asarray(pre), np.asarray(post), np.asarray(syn), 0, -1,
+                                        np.asarray(delay), weight, np.asarray(dist))
+        return {'pop': {'D1': ['/striatum/D1_0', '/striatum/D1_1'], 'D2': ['/striatum/D2_2']},
+                'location': [['D1_0', 0.0, 0.0, 0.0], ['D1_1', 25e-6, 0.0, 0.0], ['D2_2', 50e-6, 0.0, 0.0]],
+                'soma_loc': {'D1': np.array([[0, 0, 0], [25e-6, 0, 0]]), 'D2': np.array([[50e-6, 0, 0]])},
+                'nodes': np.array(['/striatum/D1_0', '/striatum/D1_1', '/striatum/D2_2', '/input/tt_0']),
+                'num_cells': 3,
+                'node_loc': np.array([[0, 0, 0], [25e-6, 0, 0], [50e-6, 0, 0]]),
+                'synapses': np.array(['570_3/ampa', '570_3/sp0head/gaba']),
+                'conns': np.array(['D1/gaba/D1']),
+                'edges': edges,
+                'single': False}
+    return make
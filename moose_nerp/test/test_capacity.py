@@ -0,0 +1,50 @@
+import logging
+import pytest
+
+from moose_nerp.prototypes import capacity
+from moose_nerp.prototypes.util import NamedDict, NamedList
+
+conn = NamedList('connect', 'synapse pre post num_conns=2 space_const=None probability=None dend_loc=None stp=None')
+
+COSTS = {'object_bytes': {'Table': 1000}, 'object_time': {}, 'default_object_bytes': 1000,
+         'default_object_time': 1e-3, 'copy_bytes': 0, 'copy_time': 0, 'message_bytes': 100,
+         'message_time': 1e-3, 'synapse_bytes': 50, 'sample_bytes': 8, 'step_time': 1e-6}
+
+
+@pytest.fixture
+def estimate(monkeypatch, make_plan):
+    monkeypatch.setattr(capacity, 'COSTS', COSTS)
+    # neuron prototypes receiving four gaba synapses; no objects are copied
+    plan = make_plan([0, 2, 1, 3], [1, 1, 2, 0], 1, 1e-3, 1, 0)
+    plan['single'] = True
+    model = NamedDict('model', param_syn=NamedDict('param_syn', NAME_AMPA='ampa', NAME_NMDA='nmda'),
+                      param_sim=NamedDict('param_sim', simtime=0.1, simdt=1e-5, plotdt=1e-4))
+    netparams = NamedDict('netparams', plot_netvm=0,
+                          connect_dict={'D1': {'gaba': {'D1': conn('gaba', 'D1', 'D1')}}})
+    return capacity.estimate_network(model, netparams, plan=plan)
+
+
+def test_estimate_network(estimate):
+    # one spike table per neuron; messages of the synapses and spike tables
+    assert estimate['synapses'] == 4
+    assert estimate['objects']['Table'] == 3 and not estimate['objects']['TimeTable']
+    assert estimate['messages'] == 7
+    assert estimate['memory'] == pytest.approx(3 * 1000 + 7 * 100 + 4 * 50)
+    assert estimate['build_time'] == pytest.approx(3e-3 + 7e-3)
+    assert estimate['run_time'] == pytest.approx(3 * 1e-6 * 0.1 / 1e-5)
+    capacity.report(estimate)
+
+
+def test_check_capacity(estimate, monkeypatch, caplog):
+    monkeypatch.setattr(capacity, 'available_memory', lambda: 10000)
+    with caplog.at_level(logging.INFO):
+        capacity.check_capacity(estimate)
+    assert not [rec for rec in caplog.records if rec.levelno >= logging.WARNING]
+    # above MEMORY_WARN (50%) of available memory
+    monkeypatch.setattr(capacity, 'available_memory', lambda: 6000)
+    capacity.check_capacity(estimate)
+    assert [rec for rec in caplog.records if rec.levelno == logging.WARNING]
+    # above MEMORY_MAX (90%)
+    monkeypatch.setattr(capacity, 'available_memory', lambda: 4000)
+    with pytest.raises(MemoryError):
+        capacity.check_capacity(estimate)
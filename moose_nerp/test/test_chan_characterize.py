@@ -0,0 +1,30 @@
+import numpy as np
+
+from moose_nerp import d1d2
+from moose_nerp.prototypes import chan_characterize
+
+
+def test_gate_kinetics():
+    dt, delay = 1e-4, 0.01
+    t = np.arange(0, 0.2, dt)
+    tau = np.array([[0.005], [0.02], [0.5], [0.01]])
+    final = np.array([[0.9], [0.1], [0.9], [0.5]])
+    traces = np.where(t < delay, 0.5, final + (0.5 - final) * np.exp(-(t - delay) / tau))
+    inf, measured = chan_characterize.gate_kinetics(traces, dt, delay)
+    assert np.allclose(inf[:2], [0.9, 0.1], atol=1e-4) and np.allclose(measured[:2], [0.005, 0.02], rtol=1e-3)
+    # not converged, and no change
+    assert np.isnan(inf[2]) and np.isnan(measured[2])
+    assert inf[3] == 0.5 and np.isnan(measured[3])
+
+
+def test_characterize():
+    results = chan_characterize.characterize(d1d2, ['KaF', 'SKCa'], duration=0.1)
+    assert sorted(results) == ['KaF', 'SKCa'] and sorted(results['KaF']) == ['X', 'Y']
+    kaf = results['KaF']['X']
+    assert kaf['variable'] == 'Vm' and len(kaf['inf']) == len(chan_characterize.VSTEPS)
+    measured = np.isfinite(kaf['tau'])
+    assert measured.sum() > 10
+    assert np.allclose(kaf['inf'], kaf['inf_analytic'], atol=2e-3)
+    assert np.allclose(kaf['tau'][measured], kaf['tau_analytic'][measured], rtol=0.05)
+    sk = results['SKCa']['Z']
+    assert sk['variable'] == 'Ca' and np.allclose(sk['inf'], sk['inf_analytic'], atol=0.05)
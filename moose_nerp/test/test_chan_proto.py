@@ -0,0 +1,48 @@
+import copy
+import os
+
+import moose
+import numpy as np
+import pytest
+
+from moose_nerp import d1d2
+from moose_nerp.prototypes import chan_proto
+
+
+def test_gate_cache(tmpdir):
+    cache = str(tmpdir)
+    channels = {key: params for key, params in d1d2.Channels.items() if isinstance(params, chan_proto.TypicalOneD)}
+    moose.Neutral('/test_gates')
+    try:
+        for n, path in enumerate(['/test_gates/fresh', '/test_gates/saved', '/test_gates/cached']):
+            moose.Neutral(path)
+            for key, params in channels.items():
+                # copies, because creating a channel may change its parameters
+                chan_proto.make_channel(d1d2, path + '/' + key, copy.deepcopy(params), cache if n else None)
+            if n == 1:
+                assert len(os.listdir(cache)) == len(channels)
+        for key, params in channels.items():
+            fresh = chan_proto.gate_tables(moose.element('/test_gates/fresh/' + key))
+            cached = moose.element('/test_gates/cached/' + key)
+            assert cached.Ek == params.channel.Erev
+            assert cached.useConcentration == moose.element('/test_gates/fresh/' + key).useConcentration
+            tables = chan_proto.gate_tables(cached)
+            assert sorted(tables) == sorted(fresh)
+            for name in tables:
+                assert np.array_equal(tables[name], fresh[name]), key + ' ' + name
+    finally:
+        moose.delete('/test_gates')
+
+
+def test_2d_not_cached(tmpdir):
+    # BK tables are computed faster than they are read from a file
+    cache = str(tmpdir)
+    moose.Neutral('/test_bk')
+    try:
+        try:
+            chan_proto.make_channel(d1d2, '/test_bk/BKCa', copy.deepcopy(d1d2.Channels['BKCa']), cache)
+        except AttributeError:
+            pytest.skip('HHChannel2D gates not supported by this moose version')
+        assert moose.exists('/test_bk/BKCa') and not os.listdir(cache)
+    finally:
+        moose.delete('/test_bk')
@@ -0,0 +1,34 @@
+import moose
+import numpy as np
+
+from moose_nerp.prototypes import chirp
+
+
+def test_zap_impedance():
+    dt, T, tau, rm = 1e-4, 4.0, 0.01, 100e6
+    comp = moose.Compartment('/test_zap')
+    try:
+        comp.Rm, comp.Cm = rm, tau / rm
+        waves = chirp.zap_waveform(amp=[10e-12, 20e-12], f0=0.5, f1=100, T=T, simdt=dt)
+        assert waves.shape == (2, int(T / dt))
+        table = chirp.stimulus_table(waves[0], dt, start=0.1, comps=[comp])
+        vmtab = moose.Table('/test_zap/vm')
+        moose.connect(vmtab, 'requestOut', comp, 'getVm')
+        for i in range(10):
+            moose.setClock(i, dt)
+        vm = []
+        for wave in waves:
+            chirp.set_waveform(table, wave, dt, start=0.1)
+            moose.reinit()
+            moose.start(T + 0.2)
+            vm.append(vmtab.vector[1000:1000 + len(wave)])
+        freqs, amp, phase = chirp.impedance(vm, waves, dt, fmin=2, fmax=20)
+        # single frequency bins are noisy, compare at a few frequencies
+        bins = np.searchsorted(freqs, [2, 5, 10, 20])
+        freqs, amp, phase = freqs[bins], amp[:, bins], phase[:, bins]
+        expected = 1 + 1j * 2 * np.pi * freqs * tau
+        assert np.allclose(amp, rm / np.abs(expected), rtol=0.03)
+        assert np.allclose(phase, -np.angle(expected), atol=0.03)
+    finally:
+        moose.delete('/test_zap')
+        moose.delete('/chirpgen')
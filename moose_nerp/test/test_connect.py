@@ -0,0 +1,56 @@
+import numpy as np
+
+from moose_nerp.prototypes import connect
+from moose_nerp.prototypes.util import NamedList
+
+conn = NamedList('connect', 'synapse pre post num_conns=2 space_const=None probability=None dend_loc=None stp=None')
+
+
+def grid_locations(n, spacing):
+    x, y = np.meshgrid(np.arange(n) * spacing, np.arange(n) * spacing)
+    return np.column_stack([x.ravel(), y.ravel(), np.zeros(n * n)])
+
+
+def test_candidate_pairs_tree_vs_dense():
+    locs = grid_locations(8, 25e-6)
+    post, pre, dist = connect.candidate_pairs(locs, locs, 60e-6)
+    dense = np.linalg.norm(locs[:, None, :] - locs[None, :, :], axis=2)
+    expected_post, expected_pre = np.nonzero(dense <= 60e-6)
+    assert np.array_equal(post, expected_post)
+    assert np.array_equal(pre, expected_pre)
+    assert np.allclose(dist, dense[expected_post, expected_pre])
+
+
+def test_spatial_connections_space_const():
+    np.random.seed(0)
+    locs = grid_locations(20, 25e-6)
+    space_const = 50e-6
+    params = conn(synapse='gaba', pre='D1', post='D1', space_const=space_const)
+    post, pre, dist, num_conns = connect.spatial_connections(locs, locs, params)
+    assert np.all(dist > 0)
+    assert np.all(num_conns >= 1)
+    assert np.all(np.diff(post) >= 0)
+    dense = np.linalg.norm(locs[:, None, :] - locs[None, :, :], axis=2)
+    expected = np.sum(np.exp(-dense[dense > 0] / space_const))
+    assert abs(len(post) - expected) < 4 * np.sqrt(expected)
+
+
+def test_spatial_connections_probability():
+    np.random.seed(0)
+    locs = grid_locations(10, 25e-6)
+    params = conn(synapse='gaba', pre='D1', post='D1', probability=0.3)
+    post, pre, dist, num_conns = connect.spatial_connections(locs, locs, params)
+    expected = 0.3 * len(locs) * (len(locs) - 1)
+    assert abs(len(post) - expected) < 4 * np.sqrt(expected)
+
+
+def test_dendritic_distance_dep_connect_prob_vector():
+    dend_location = NamedList('dend_location', 'mindist=0 maxdist=1 maxprob=None half_dist=None steep=0 postsyn_fraction=None')
+    dist = np.linspace(0, 400e-6, 41)
+    for prob in (dend_location(mindist=20e-6, maxdist=300e-6, half_dist=80e-6, steep=2),
+                 dend_location(mindist=20e-6, maxdist=300e-6, half_dist=80e-6, steep=-3, postsyn_fraction=0.5),
+                 dend_location(mindist=20e-6, maxdist=300e-6, postsyn_fraction=0.8)):
+        vector = connect.dendritic_distance_dep_connect_prob(prob, dist)
+        scalar = [connect.dendritic_distance_dep_connect_prob(prob, d) for d in dist]
+        assert isinstance(scalar[0], float)
+        assert np.allclose(vector, scalar)
@@ -0,0 +1,64 @@
+import numpy as np
+
+from moose_nerp.prototypes import connect_plan
+from moose_nerp.prototypes.util import NamedDict, NamedList
+
+conn = NamedList('connect', 'synapse pre post num_conns=2 space_const=None probability=None dend_loc=None stp=None')
+
+
+def test_save_load_plan(tmpdir, make_plan):
+    plan = make_plan([0, 1, 2], 1, [0, 1, 1], 1e-3, 1.5, [25e-6, 0, 35e-6])
+    np.random.seed(3)
+    plan['rng_state'] = np.random.get_state()
+    fname = str(tmpdir.join('plan.npz'))
+    connect_plan.save_plan(plan, fname)
+    loaded = connect_plan.load_plan(fname)
+    assert loaded['pop'] == plan['pop']
+    assert loaded['location'] == plan['location']
+    assert loaded['num_cells'] == 3 and not loaded['single']
+    assert np.array_equal(loaded['edges'], plan['edges'])
+    assert np.array_equal(loaded['soma_loc']['D2'], plan['soma_loc']['D2'])
+    np.random.set_state(loaded['rng_state'])
+    assert np.random.rand() == np.random.RandomState(3).rand()
+
+
+def test_plan_fingerprint():
+    netparams = NamedDict('netparams', single=False, netname='/striatum', pop_dict={}, grid={},
+                          chanvar={}, mindelay=1e-3, cond_vel=0.8,
+                          connect_dict={'D1': {'gaba': {'D1': conn('gaba', 'D1', 'D1', space_const=75e-6)}}})
+    model = NamedDict('model', param_syn=NamedDict('param_syn', NumSyn={'gaba': 1, 'ampa': 1}),
+                      param_cond=NamedDict('param_cond', morph_file={'D1': 'MScell.p'}),
+                      stpYN=False, spineYN=False, SYNAPSE_TYPES={},
+                      SpineParams=NamedDict('SpineParams', spineStart=26.1e-6))
+    fingerprint = connect_plan.plan_fingerprint(model, netparams, seed=1)
+    assert fingerprint == connect_plan.plan_fingerprint(model, netparams, seed=1)
+    assert fingerprint != connect_plan.plan_fingerprint(model, netparams, seed=2)
+    model.SpineParams.spineStart = 30e-6
+    assert fingerprint != connect_plan.plan_fingerprint(model, netparams, seed=1)
+    model.SpineParams.spineStart = 26.1e-6
+    netparams.connect_dict['D1']['gaba']['D1'].space_const = 50e-6
+    assert fingerprint != connect_plan.plan_fingerprint(model, netparams, seed=1)
+
+
+def test_allocate_trains():
+    np.random.seed(0)
+    pool = connect_plan.train_pool(10, 3)
+    blocks = [connect_plan.allocate_trains(pool, 7) for i in range(5)]
+    assert [len(b) for b in blocks] == [7, 7, 7, 7, 2]
+    assert np.array_equal(np.bincount(np.concatenate(blocks)), np.full(10, 3))
+
+
+def test_merged_edges():
+    ext_conn = NamedList('ext_connect', 'synapse pre post dend_loc=None stp=None aggregate=False')
+    netparams = NamedDict('netparams', connect_dict={'D1': {'ampa': {'extern1': ext_conn('ampa', None, 'D1'),
+                                                                     'extern2': ext_conn('ampa', None, 'D1')}}})
+    # time tables 3-7: three trains to synapse 0, one to synapse 1 of conn 0; one of conn 1 to synapse 0
+    edges = connect_plan.make_edges(np.array([3, 4, 5, 6, 7]), 0, np.array([0, 0, 0, 1, 0]),
+                                    np.array([0, 0, 0, 0, 1]), -1, 1e-3, 1.0, 0)
+    plan = {'edges': edges, 'num_cells': 1, 'conns': np.array(['D1/ampa/extern1', 'D1/ampa/extern2'])}
+    mask, merge_id = connect_plan.merged_edges(plan, netparams)
+    assert not np.any(mask) and np.all(merge_id == -1)
+    netparams.connect_dict['D1']['ampa']['extern1'].aggregate = True
+    netparams.connect_dict['D1']['ampa']['extern2'].aggregate = True
+    mask, merge_id = connect_plan.merged_edges(plan, netparams)
+    assert list(merge_id) == [0, 0, 0, -1, -1]
@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+from moose_nerp.prototypes import edge_io
+
+h5py = pytest.importorskip('h5py')
+
+
+@pytest.mark.parametrize('compression', [edge_io.EDGE_COMPRESSION, None])
+def test_write_read_plan(tmpdir, compression, make_plan):
+    plan = make_plan([1, 2, 3], [0, 0, 1], [0, 1, 1], [1e-3, 2e-3, 1e-3], 1.5, [25e-6, 35e-6, 0])
+    fname = str(tmpdir.join('edges.h5'))
+    edge_io.write_edges(fname, plan, compression=compression, chunk=2)
+    data = edge_io.read_edges(fname)
+    assert isinstance(data['edges']['source'], np.memmap) == (compression is None)
+    assert list(data['edges']['syntype']) == [0, 1, 1]
+    assert data['syntypes'] == ['ampa', 'gaba']
+    loaded = edge_io.read_plan(fname)
+    assert np.array_equal(loaded['edges'], plan['edges'])
+    assert loaded['pop'] == plan['pop']
+    assert np.array_equal(loaded['soma_loc']['D1'], plan['soma_loc']['D1'])
+    assert list(loaded['nodes']) == list(plan['nodes'])
@@ -0,0 +1,33 @@
+import moose
+import numpy as np
+
+from moose_nerp.prototypes import inject_func
+
+
+def test_shared_timetable():
+    moose.Neutral('/test_input')
+    try:
+        tt1 = inject_func.shared_timetable('/test_input/tt1', [0.1, 0.2])
+        tt2 = inject_func.shared_timetable('/test_input/tt2', np.array([0.1, 0.2]))
+        tt3 = inject_func.shared_timetable('/test_input/tt3', [0.1, 0.2], tick=6)
+        assert tt2.path == tt1.path and not moose.exists('/test_input/tt2')
+        assert tt3.path != tt1.path and np.array_equal(tt3.vector, [0.1, 0.2])
+    finally:
+        moose.delete('/test_input')
+    tt4 = inject_func.shared_timetable('/tt4', [0.1, 0.2])
+    assert moose.exists('/tt4') and np.array_equal(tt4.vector, [0.1, 0.2])
+    moose.delete('/tt4')
+
+
+def test_make_time_tables():
+    paradigm = inject_func.ParadigmParams(f_pulse=50., n_pulse=2, A_inject=0, f_burst=5, n_burst=2, f_train=0.1,
+                                          n_train=1, width_AP=0.005, AP_interval=0.01, n_AP=1, ISI=0, name='test')
+    loc = inject_func.StimLocParams(which_spines='all', spine_density=0, pulse_sequence=None,
+                                    stim_dendrites=['dend1', 'dend2'])
+    time_tables = inject_func.MakeTimeTables(inject_func.StimParams(paradigm, loc, 0.1), 10)
+    assert list(time_tables) == ['dend1', 'dend2']
+    assert np.allclose(time_tables['dend2'], [0.1, 0.12, 0.3, 0.32])
+    # more spines requested than available: each pulse stimulates all of them once
+    loc = inject_func.StimLocParams(which_spines=[3, 5], spine_density=1.5, pulse_sequence=None, stim_dendrites=[])
+    time_tables = inject_func.MakeTimeTables(inject_func.StimParams(paradigm, loc, 0.1), 10)
+    assert sorted(time_tables) == [3, 5] and np.allclose(time_tables[5], [0.1, 0.12, 0.3, 0.32])
@@ -0,0 +1,32 @@
+import copy
+
+import moose
+import numpy as np
+
+from moose_nerp import d1d2
+from moose_nerp.prototypes import chan_proto, library_snapshot, syn_proto
+
+
+def test_save_restore(tmpdir):
+    filename = str(tmpdir.join('library.npz'))
+    moose.Neutral('/test_library')
+    try:
+        for name in ('KaF', 'CaL12', 'SKCa', 'NaF'):
+            chan_proto.make_channel(d1d2, '/test_library/' + name, copy.deepcopy(d1d2.Channels[name]))
+        for name, params in d1d2.SYNAPSE_TYPES.items():
+            syn_proto.make_synchan(d1d2, '/test_library/' + name, params)
+        meta, tables = library_snapshot.describe(library_snapshot.library_elements('/test_library'))
+        library_snapshot.save(filename, '/test_library')
+    finally:
+        moose.delete('/test_library')
+    elements, differ = library_snapshot.restore(filename)
+    try:
+        assert differ == []
+        assert [elem.path.replace('[0]', '') for elem in elements] == [desc['path'] for desc in meta]
+        restored_meta, restored_tables = library_snapshot.describe(elements)
+        assert restored_meta == meta
+        assert sorted(restored_tables) == sorted(tables)
+        assert all(np.array_equal(restored_tables[key], tables[key]) for key in tables)
+        assert moose.element('/test_library/SKCa').useConcentration
+    finally:
+        moose.delete('/test_library')
@@ -65,3 +65,26 @@ def test_distance_mapping_inf():
     assert_close(util.distance_mapping(map, 0), 3)
     assert_close(util.distance_mapping(map, 5), 1.103638323514327)
     assert_close(util.distance_mapping(map, 1e5), 0)
+
+
+def test_distance_map():
+    near = (0, 20)
+    far = (20, 30)
+    maps = [{near: 5, far: 6},
+            {near: (lambda x: 5 + x), far: (lambda x: 30 - x)},
+            {(0, np.inf): (lambda x: 3 * np.exp(-x / 5))},
+            {near: 0, far: (lambda x: 1 if x < 25 else 2)}]
+    dists = [0, 10, 20, 25, 30, 35, 1e5]
+    for map in maps:
+        expected = [util.distance_mapping(map, d) for d in dists]
+        assert np.allclose(util.DistanceMap(map).evaluate(dists), expected)
+    assert util.DistanceMap(maps[0]).evaluate(dists).dtype == int
+
+
+def test_distance_map_names():
+    # intervals with a name pattern come first, as in distance_mapping
+    map = {(0, 20): 1, (0, 20, '_2'): 2, (20, 30, 'dend'): (lambda x: x)}
+    names = ['soma', 'a_2', '_2b', 'soma', 'dend1', 'xdend']
+    dists = [5, 5, 5, 25, 25, 25]
+    assert list(util.DistanceMap(map).evaluate(dists, names)) == [1, 2, 2, 0, 25, 25]
+    assert util.DistanceMap({(0, 20): [1, 2]}).evaluate([5, 25]).tolist() == [[1, 2], 0]
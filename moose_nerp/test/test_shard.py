@@ -0,0 +1,24 @@
+import numpy as np
+
+from moose_nerp.prototypes import shard
+from moose_nerp.prototypes.util import NamedDict
+
+
+def test_local_plan(make_plan):
+    netparams = NamedDict('netparams', netname='/striatum', mindelay=1e-3,
+                          grid={0: {'xyzmin': 0, 'xyzmax': 75e-6, 'inc': 25e-6},
+                                1: {'xyzmin': 0, 'xyzmax': 0, 'inc': 0},
+                                2: {'xyzmin': 0, 'xyzmax': 0, 'inc': 0}})
+    # D1_0 -> D1_1, D2_2 -> D1_1, D1_1 -> D2_2, time table -> D1_0
+    plan = make_plan([0, 2, 1, 3], [1, 1, 2, 0], 0, [2e-3, 3e-3, 2e-3, 1e-3], 1, 25e-6)
+    cell_shard = shard.partition_cells(netparams, plan, 2)
+    assert list(cell_shard) == [0, 0, 1]
+    shard0 = shard.Shard(0, plan, cell_shard, None, netparams.mindelay)
+    assert list(shard0.exported) == [1]
+    local = shard0.local_plan(netparams)
+    assert local['pop'] == {'D1': ['/striatum/D1_0', '/striatum/D1_1'], 'D2': []}
+    assert len(local['soma_loc']['D2']) == 0 and len(local['location']) == 2
+    assert list(local['edges']['pre']) == [0, 2, 3]
+    # delay of the connection from the other shard is reduced by one epoch
+    assert np.allclose(local['edges']['delay'], [2e-3, 2e-3, 1e-3])
+    assert local['proxies'] == {2: shard.SHARD_INPUT + '/D2_2'}
@@ -0,0 +1,66 @@
+import moose
+import numpy as np
+
+from moose_nerp.prototypes import spatiotemporalInputMapping as stim
+
+
+def make_neuron():
+    # soma with two dendrites; dend1 branches into dend11 and dend12, dend2 continues as dend2b
+    neuron = moose.Neuron('/test_neuron')
+    comps = {}
+    for name, parent, x in [('soma', None, 0), ('dend1', 'soma', 10e-6), ('dend2', 'soma', -10e-6),
+                            ('dend11', 'dend1', 20e-6), ('dend12', 'dend1', 20e-6), ('dend2b', 'dend2', -20e-6)]:
+        comp = moose.Compartment(neuron.path + '/' + name)
+        comp.x, comp.length = x, 10e-6
+        if parent:
+            moose.connect(comps[parent], 'axialOut', comp, 'handleAxial')
+        comps[name] = comp
+    return neuron, comps
+
+
+def test_branch_index():
+    neuron, comps = make_neuron()
+    try:
+        index = stim.branchIndex(neuron)
+        assert index is stim.branchIndex(neuron)
+        bd = stim.getBranchDict(neuron)
+        dend2 = comps['dend2'].path
+        assert bd[dend2]['CompList'] == [dend2, comps['dend2b'].path]
+        assert bd[dend2]['Terminal'] and not bd[comps['dend1'].path]['Terminal']
+        assert bd[comps['dend12'].path]['BranchPath'] == [comps[c].path for c in ['soma', 'dend1', 'dend12']]
+        assert np.isclose(bd[dend2]['MaxBranchDistance'], 25e-6)
+        terminal = stim.getBranchesOfOrder(neuron, -1, n='all', commonParentOrder=0)
+        assert terminal == [comps[c].path for c in ['dend11', 'dend12', 'dend2']]
+        assert stim.getBranchesOfOrder(neuron, 2, n='all') == [comps[c].path for c in ['dend11', 'dend12']]
+        assert stim.mapCompartmentToBranch(neuron)[comps['dend2b'].path]['Branch'] == dend2
+    finally:
+        moose.delete(neuron)
+
+
+def test_input_pool():
+    from moose_nerp import d1d2
+    neuron, comps = make_neuron()
+    try:
+        inputs = []
+        for name in ['dend11', 'dend2b']:
+            synchan = moose.SynChan(comps[name].path + '/ampa')
+            synchan.Gbar, synchan.tau1, synchan.tau2 = 1e-9, 1e-3, 5e-3
+            sh = moose.SimpleSynHandler(synchan.path + '/SH')
+            moose.connect(sh, 'activationOut', synchan, 'activation')
+            moose.connect(synchan, 'channel', comps[name], 'channel')
+            inputs.append(synchan)
+        tabs = [moose.Table(synchan.path + '/gk') for synchan in inputs]
+        for tab, synchan in zip(tabs, inputs):
+            moose.connect(tab, 'requestOut', synchan, 'getGk')
+        for i in range(10):
+            moose.setClock(i, 1e-4)
+        pool = stim.InputPool(inputs, d1d2)
+        results = []
+        for pattern in [{inputs[0]: [0.005]}, {inputs[1].path: [0.002, 0.004]}, {inputs[0]: [0.005]}]:
+            pool.run(pattern, 0.02)
+            results.append([tab.vector.copy() for tab in tabs])
+        assert np.max(results[0][0]) > 0 and np.max(results[0][1]) == 0
+        assert np.max(results[1][0]) == 0 and np.max(results[1][1]) > 0
+        assert np.array_equal(results[0][0], results[2][0]) and np.max(results[2][1]) == 0
+    finally:
+        moose.delete(neuron)
@@ -0,0 +1,44 @@
+import numpy as np
+
+from moose_nerp.prototypes import spike_trains
+
+
+def test_convert_and_load(tmpdir):
+    trains = np.empty(3, dtype=object)
+    trains[:] = [np.array([0.1, 0.5]), np.array([]), np.array([0.2, 0.3, 0.9])]
+    npzfile = str(tmpdir.join('input.npz'))
+    np.savez(npzfile, spikeTime=trains)
+    assert not spike_trains.is_ragged(npzfile)
+    fname = spike_trains.converted(npzfile)
+    assert fname == str(tmpdir.join('input' + spike_trains.TRAINS_SUFFIX))
+    assert spike_trains.is_ragged(fname) and spike_trains.converted(fname) == fname
+    loaded = spike_trains.load(fname)
+    assert isinstance(loaded.times, np.memmap)
+    assert len(loaded) == 3
+    for train, expected in zip(loaded, trains):
+        assert np.array_equal(train, expected)
+
+
+def test_nested(tmpdir):
+    nested = {'ampa': {'extern1': {'570_3': np.array([0.1, 0.2]), '1_2/sp0head': np.array([0.3])}},
+              'gaba': {'extern2': {'570_3': np.array([])}}}
+    fname = str(tmpdir.join('tt.npz'))
+    spike_trains.save_nested(fname, nested)
+    loaded = spike_trains.load_nested(fname)
+    assert sorted(loaded['ampa']['extern1'].keys()) == ['1_2/sp0head', '570_3']
+    assert np.array_equal(loaded['ampa']['extern1']['570_3'], [0.1, 0.2])
+    assert len(loaded['gaba']['extern2']['570_3']) == 0
+
+
+def test_shared_pool():
+    sources = {'a': spike_trains.SpikeTrains.from_trains([np.array([0.1, 0.2]), np.array([])]),
+               'b': spike_trains.SpikeTrains.from_trains([np.array([0.5])])}
+    pool = spike_trains.SharedPool(sources)
+    try:
+        shm, shared = spike_trains.attach(pool.handle())
+        assert np.array_equal(shared['a'][0], [0.1, 0.2]) and len(shared['a'][1]) == 0
+        assert np.array_equal(shared['b'].offsets, [0, 1])
+        del shared
+        shm.close()
+    finally:
+        pool.close()
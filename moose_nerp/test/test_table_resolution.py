@@ -0,0 +1,99 @@
+import copy
+
+import moose
+import numpy as np
+
+from moose_nerp import d1d2
+from moose_nerp.prototypes import chan_proto, table_resolution
+
+
+def test_gate_rates_match_tables():
+    moose.Neutral('/test_rates')
+    try:
+        for name in ('Krp', 'KaF', 'NaF', 'SKCa'):
+            params = d1d2.Channels[name]
+            chan = chan_proto.make_channel(d1d2, '/test_rates/' + name, copy.deepcopy(params))
+            for gate, power in (('X', chan.Xpower), ('Y', chan.Ypower), ('Z', chan.Zpower)):
+                if power > 0:
+                    tables = moose.element(chan.path + '/gate' + gate)
+                    x = np.linspace(tables.min, tables.max, len(tables.tableA))
+                    A, B = table_resolution.gate_rates(getattr(params, gate), x)
+                    assert np.allclose(A, tables.tableA) and np.allclose(B, tables.tableB)
+    finally:
+        moose.delete('/test_rates')
+
+
+def test_smallest_divs():
+    params = d1d2.Channels['KaF'].X
+    rates = lambda v: table_resolution.gate_rates(params, v)
+    divs = table_resolution.smallest_divs(rates, d1d2.VMIN, d1d2.VMAX, 1e-3, 1e-2)
+    inf_err, tau_err = table_resolution.interpolation_error(rates, d1d2.VMIN, d1d2.VMAX, divs)
+    assert inf_err <= 1e-3 and tau_err <= 1e-2
+    inf_err, tau_err = table_resolution.interpolation_error(rates, d1d2.VMIN, d1d2.VMAX, divs - 1)
+    assert inf_err > 1e-3 or tau_err > 1e-2
+    assert table_resolution.smallest_divs(rates, d1d2.VMIN, d1d2.VMAX, 1e-4, 1e-3) > divs
+
+
+def test_tune_model(tmpdir):
+    tuning = table_resolution.tune_model(d1d2)
+    assert set(tuning['channels']) == set(d1d2.Channels)
+    assert tuning['VDIVS'] == max(divs['VDIVS'] or 0 for divs in tuning['channels'].values())
+    assert tuning['channels']['SKCa']['VDIVS'] is None
+    filename = str(tmpdir.join('param_chan.py'))
+    with open(filename, 'w') as f:
+        f.write('VMIN = -120e-3\nVDIVS = 3401 #0.5 mV steps\nCADIVS = 4001\n')
+    assert table_resolution.write_params(d1d2, tuning, filename) == ['VDIVS', 'CADIVS']
+    namespace = {}
+    exec(open(filename).read(), namespace)
+    assert namespace['VDIVS'] == tuning['VDIVS'] and namespace['CADIVS'] == tuning['CADIVS']
+    assert namespace['VMIN'] == d1d2.VMIN
+
+
+def test_z_gate_recommended_divs(monkeypatch):
+    # a calcium gate made by chan_proto with the recommended CADIVS (number of points) is within tolerance
+    params = d1d2.Channels['SKCa']
+    divs = table_resolution.tune_channel(d1d2, params)['CADIVS']
+    monkeypatch.setattr(d1d2, 'CADIVS', divs)
+    moose.Neutral('/test_zgate')
+    try:
+        chan = chan_proto.chan_proto(d1d2, '/test_zgate/SKCa', copy.deepcopy(params))
+        gate = moose.element(chan.path + '/gateZ')
+        assert len(gate.tableA) == divs
+        nodes = np.linspace(gate.min, gate.max, divs)
+        ca = (nodes[:-1, np.newaxis] + (nodes[1] - nodes[0]) * table_resolution.FRACTIONS).ravel()
+        A = np.interp(ca, nodes, gate.tableA)
+        B = np.interp(ca, nodes, gate.tableB)
+        a, b = table_resolution.gate_rates(params.Z, ca)
+        assert np.max(np.abs(A / B - a / b)) <= table_resolution.INF_TOL
+        assert np.max(np.abs(b / B - 1)) <= table_resolution.TAU_TOL
+    finally:
+        moose.delete('/test_zgate')
+    assert table_resolution.table_bytes(params, d1d2.VDIVS, divs) == 2 * table_resolution.BYTES * divs
+
+
+def test_singular_gate_recommended_divs(monkeypatch):
+    # a voltage gate with singularities (C < 0), made by chan_proto with the recommended VDIVS, is within
+    # tolerance, including the lines of fix_singularities
+    params = d1d2.Channels['CaL12']
+    assert params.X.A_C < 0 and params.X.B_C < 0
+    divs = table_resolution.tune_channel(d1d2, params)['VDIVS']
+    monkeypatch.setattr(d1d2, 'VDIVS', divs)
+    moose.Neutral('/test_vgate')
+    try:
+        chan = chan_proto.chan_proto(d1d2, '/test_vgate/CaL12', copy.deepcopy(params))
+        gate = moose.element(chan.path + '/gateX')
+        nodes = np.linspace(gate.min, gate.max, divs + 1)
+        assert len(gate.tableA) == len(nodes)
+        v = (nodes[:-1, np.newaxis] + (nodes[1] - nodes[0]) * table_resolution.FRACTIONS).ravel()
+        A = np.interp(v, nodes, gate.tableA)
+        B = np.interp(v, nodes, gate.tableB)
+        a, b = table_resolution.gate_rates(params.X, v)
+        assert np.max(np.abs(A / B - a / b)) <= table_resolution.INF_TOL
+        assert np.max(np.abs(b / B - 1)) <= table_resolution.TAU_TOL
+        # the lines of fix_singularities span more voltage in a coarser table
+        inf_err, tau_err = table_resolution.interpolation_error(
+            lambda x: table_resolution.gate_rates(params.X, x), d1d2.VMIN, d1d2.VMAX, 212,
+            lambda x: table_resolution.gate_table(d1d2, params.X, x))
+        assert tau_err > table_resolution.TAU_TOL
+    finally:
+        moose.delete('/test_vgate')
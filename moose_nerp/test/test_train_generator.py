@@ -0,0 +1,48 @@
+import numpy as np
+
+from moose_nerp.prototypes import train_generator
+
+
+def test_chunks_match_generate():
+    spec = train_generator.TrainSpec('gamma', 20, 5.0, 10.0, shape=3, seed=4, block=0.5)
+    trains = train_generator.generate(spec)
+    chunks = [chunk for t_start, t_stop, chunk in train_generator.chunks(spec, chunk_blocks=3)]
+    for k in range(spec.num_trains):
+        assert np.array_equal(trains[k], np.concatenate([chunk[k] for chunk in chunks]))
+        assert np.all(np.diff(trains[k]) > 0) and trains[k][0] > 0 and trains[k][-1] < spec.duration
+    rate = len(trains.times) / spec.num_trains / spec.duration
+    assert 8 < rate < 12
+
+
+def test_per_source_seeds():
+    spec = train_generator.TrainSpec('poisson', 3, 5.0, 10.0, seed=[1, 2, 3])
+    other = train_generator.TrainSpec('poisson', 2, 5.0, 10.0, seed=[7, 2])
+    assert np.array_equal(train_generator.generate(spec)[1], train_generator.generate(other)[1])
+
+
+def test_correlated():
+    spec = train_generator.TrainSpec('poisson', 2, 50.0, 10.0, corr=0.5, seed=2)
+    trains = train_generator.generate(spec)
+    shared = np.intersect1d(trains[0], trains[1])
+    # each spike of one train is in the other train with probability corr
+    assert 0.4 < len(shared) / len(trains[0]) < 0.6
+
+
+def test_tableset_spec():
+    from moose_nerp.prototypes import ttables
+    spec = train_generator.TrainSpec('lognormal', 4, 2.0, 10.0, sigma=0.8, seed=1)
+    tableset = ttables.TableSet('test', spec, syn_per_tt=2)
+    try:
+        assert tableset.num_trains() == 4
+        assert np.array_equal(tableset.train(2), train_generator.generate(spec)[2])
+    finally:
+        ttables.TableSet.ALL.remove(tableset)
+
+
+def test_modulated_rate():
+    # thinning by the oscillation keeps the mean rate, with and without a correlated mother process
+    for corr in (0, 0.5):
+        spec = train_generator.TrainSpec('poisson', 20, 50.0, 10.0, osc_freq=5, osc_depth=0.8, corr=corr, seed=3)
+        trains = train_generator.generate(spec)
+        rate = len(trains.times) / spec.num_trains / spec.duration
+        assert 9 < rate < 11
@@ -0,0 +1,40 @@
+import moose
+import numpy as np
+
+from moose_nerp.prototypes import ttables
+
+
+def test_ragged_store(tmpdir):
+    trains = np.empty(3, dtype=object)
+    trains[:] = [np.array([0.1, 0.5]), np.array([]), np.array([0.2, 0.3, 0.9])]
+    fname = str(tmpdir.join('trains'))
+    np.savez(fname, spikeTime=trains)
+    tableset = ttables.TableSet('test', fname, syn_per_tt=2)
+    try:
+        assert tableset.num_trains() == 3
+        assert isinstance(tableset.load().times, np.memmap)
+        for ii in range(3):
+            assert np.array_equal(tableset.train(ii), trains[ii])
+        assert tableset.stimtab == {}
+    finally:
+        ttables.TableSet.ALL.remove(tableset)
+
+
+def test_merged_timetables(tmpdir):
+    trains = np.empty(3, dtype=object)
+    trains[:] = [np.array([-0.2, -0.1, 0.0105]), np.array([0.0101, 0.02]), np.array([0.0102, 0.0104, 0.03])]
+    fname = str(tmpdir.join('trains'))
+    np.savez(fname, spikeTime=trains)
+    tableset = ttables.TableSet('merge', fname, syn_per_tt=2)
+    try:
+        dt = 1e-3
+        # separate time tables send spikes at steps: 1, 2, 11; 11, 20; 11, 12, 30
+        assert list(ttables.delivery_steps(trains[2], dt)) == [11, 12, 30]
+        tables = ttables.TableSet.merged_timetables([tableset.table_path(ii) for ii in range(3)], 'merged', dt)
+        assert [tt.name for tt in tables] == ['merged', 'merged_1', 'merged_2']
+        steps = np.concatenate([ttables.delivery_steps(tt.vector, dt) for tt in tables])
+        assert sorted(steps) == [1, 2, 11, 11, 11, 12, 20, 30]
+        assert tableset.stimtab == {}
+    finally:
+        ttables.TableSet.ALL.remove(tableset)
+        moose.delete(ttables.TableSet.PATH)